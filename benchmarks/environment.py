@@ -0,0 +1,98 @@
+"""
+This module prepares the import path of the benchmarks.
+
+The patches import modules that only exist inside the grading containers
+(inginious.feedback, results, graders_utils...) or in the INGInious frontend
+(inginious.frontend.accessible_time). When a module cannot be imported, the
+offline replacement in benchmarks/stubs is registered in its place, so the
+benchmarks run without the containers nor the frontend installed. Installed
+modules are always preferred.
+"""
+
+import builtins
+import importlib
+import importlib.util
+import os
+import sys
+import types
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+PATCHES_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), "patches")
+STUBS_DIR = os.path.join(BENCHMARKS_DIR, "stubs")
+
+#  Module name -> file (in the stubs directory) replacing it when it is missing
+_STUBS = [
+    ("inginious.feedback", "feedback.py"),
+    ("inginious.frontend.accessible_time", "accessible_time.py"),
+    ("results", "results.py"),
+    ("graders_utils", "graders_utils.py"),
+    ("base_grader", "base_grader.py"),
+    ("submission_requests", "submission_requests.py"),
+    ("projects", "projects.py"),
+    ("tidylib", "tidylib.py"),
+]
+
+
+def _ensure_package(name):
+    """ Imports the package name, creating an empty one if it does not exist """
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        package = types.ModuleType(name)
+        package.__path__ = []
+        sys.modules[name] = package
+        parent, _separator, child = name.rpartition(".")
+        if parent:
+            setattr(_ensure_package(parent), child, package)
+        return package
+
+
+def _register(name, module):
+    sys.modules[name] = module
+    parent, _separator, child = name.rpartition(".")
+    if parent:
+        setattr(_ensure_package(parent), child, module)
+
+
+def _load_stub(name, file_name):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(STUBS_DIR, file_name))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    _register(name, module)
+    return module
+
+
+def setup(force_stubs=False):
+    """
+    Makes the patches and their dependencies importable.
+
+    Args:
+        - force_stubs (bool): Use the offline replacements even if the real modules are installed.
+
+    Returns:
+        The list of names of the modules that were replaced.
+    """
+    if PATCHES_DIR not in sys.path:
+        sys.path.insert(0, PATCHES_DIR)
+    # Translation function installed by INGInious in both the frontend and the containers
+    if not hasattr(builtins, "_"):
+        builtins._ = lambda text: text
+
+    replaced = []
+    for name, file_name in _STUBS:
+        if not force_stubs:
+            try:
+                importlib.import_module(name)
+                continue
+            except ImportError:
+                pass
+        _load_stub(name, file_name)
+        replaced.append(name)
+
+    # The frontend imports the shared modules from its own package
+    for name in ("feedback_templates", "feedback_envelope"):
+        try:
+            importlib.import_module("inginious.frontend." + name)
+        except ImportError:
+            _register("inginious.frontend." + name, importlib.import_module(name))
+    return replaced
@@ -0,0 +1,172 @@
+"""
+This module contains the generators of the synthetic inputs of the benchmarks.
+
+Every generator receives a random.Random instance, so the same seed always
+produces the same input.
+
+Generators:
+    - hdl_trace: Simulation trace of a given size, in the testbench output format.
+    - mutate_trace: Copy of a trace with some of its output values changed.
+    - periodic_trace: Trace without times of a counter, whose lines repeat with a period.
+    - hdl_feedback / multilang_feedback / notebook_feedback: Json feedbacks as stored by the graders.
+    - client_grader_feedback: Dict feedback of a client graded task.
+    - rst_fragments: Task descriptions and feedback fragments in reStructuredText.
+"""
+
+import json
+
+_INPUTS = ("clk", "rst", "a", "b", "sel")
+_OUTPUTS = ("y", "carry", "state")
+
+
+def hdl_trace(rng, size):
+    """
+    Returns a trace of about size bytes with the format
+    T, <time>, INPUTS, <name>, <value>, ..., OUTPUTS, <name>, <value>, ...
+    """
+    lines = []
+    length = 0
+    time = 0
+    while length < size:
+        inputs = ", ".join("{}, {}".format(name, rng.randint(0, 1)) for name in _INPUTS)
+        outputs = "y, {}, carry, {}, state, {:04b}".format(rng.randint(0, 1), rng.randint(0, 1), rng.randint(0, 15))
+        line = "T, {}, INPUTS, {}, OUTPUTS, {}".format(time, inputs, outputs)
+        lines.append(line)
+        length += len(line) + 1
+        time += 10
+    return "\n".join(lines) + "\n"
+
+
+def periodic_trace(rng, size, period):
+    """
+    Returns a trace of about size bytes of a counter modulo period, without the times, so
+    every line is repeated. The worst case of difflib, whose popular lines heuristic does
+    not discard lines repeated less than once every 100 lines.
+    """
+    lines = []
+    length = 0
+    cycle = rng.randrange(2 * period)
+    while length < size:
+        line = "T, INPUTS, clk, {}, OUTPUTS, count, {:08b}".format(cycle % 2, (cycle // 2) % period)
+        lines.append(line)
+        length += len(line) + 1
+        cycle += 1
+    return "\n".join(lines) + "\n"
+
+
+def mutate_trace(rng, trace, error_rate=0.02):
+    """ Returns a copy of the trace with the first output of error_rate of its lines flipped """
+    lines = trace.splitlines()
+    for index in rng.sample(range(len(lines)), max(1, int(len(lines) * error_rate))):
+        head, separator, tail = lines[index].partition("OUTPUTS, y, ")
+        lines[index] = head + separator + ("0" if tail[:1] == "1" else "1") + tail[1:]
+    return "\n".join(lines) + "\n"
+
+
+def _diff_text(rng, lines):
+    """ A short unified diff body, as stored in the debug info """
+    diff = []
+    for _index in range(lines):
+        value = rng.randint(0, 1)
+        diff.append("-T, {0}, INPUTS, a, {1}, OUTPUTS, y, {1}".format(rng.randint(0, 999), value))
+        diff.append("+T, {0}, INPUTS, a, {1}, OUTPUTS, y, {2}".format(rng.randint(0, 999), value, 1 - value))
+    return "@@ -1,{0} +1,{0} @@\n".format(lines) + "\n".join(diff)
+
+
+def _code_feedback(rng, cases, container_type, waveform=None):
+    feedback = []
+    files_feedback = {}
+    for i in range(cases):
+        input_file = "input_{}.txt".format(i)
+        accepted = rng.random() < 0.5
+        feedback.append({
+            "i": i,
+            "result": 100 if accepted else 90,
+            "test_case": [input_file, "output_{}.txt".format(i)],
+            "input_sample": "\n".join(str(rng.randint(0, 1000)) for _line in range(15)),
+        })
+        files_feedback[input_file] = {
+            "input_file": "",
+            "stdout": "",
+            "stderr": "",
+            "return_code": 0,
+            "diff": None if accepted else _diff_text(rng, 40),
+        }
+        if waveform is not None and not accepted:
+            files_feedback[input_file]["waveform"] = waveform
+    options = {
+        "diff_max_lines": 100,
+        "diff_context_lines": 3,
+        "output_diff_for": [case["test_case"][0] for case in feedback],
+        "custom_feedback": {},
+        "show_input": True,
+        "container_type": container_type,
+        "is_staff": False,
+    }
+    feedback.append(options)
+    feedback.append({"files_feedback": files_feedback})
+    return json.dumps(feedback)
+
+
+def hdl_feedback(rng, cases, waveform=None):
+    """ Json feedback of the HDL grader with the given number of test cases """
+    return _code_feedback(rng, cases, "hdl", waveform)
+
+
+def multilang_feedback(rng, cases):
+    """ Json feedback of the multiple languages grader with the given number of test cases """
+    return _code_feedback(rng, cases, "multilang")
+
+
+def notebook_feedback(rng, tests, cases_per_test=5):
+    """ Json feedback of the notebook grader with the given number of tests """
+    feedback = []
+    for i in range(tests):
+        cases = {}
+        for case in range(cases_per_test):
+            is_runtime_error = rng.random() < 0.2
+            cases[str(case)] = {
+                "is_runtime_error": is_runtime_error,
+                "error": "Traceback (most recent call last):\n  File \"<cell>\", line 3\nZeroDivisionError",
+                "case_code": "result = solve({})\nprint(result)".format(rng.randint(0, 100)),
+                "case_output_diff": "- {}/n+ {}".format(rng.randint(0, 100), rng.randint(0, 100)),
+            }
+        feedback.append({
+            "i": i,
+            "test_result": {"name": "Test {}".format(i), "result": 90, "total": rng.random() * 10, "cases": cases},
+            "weights": 10,
+            "show_debug_info": True,
+            "test_custom_feedback": "",
+        })
+    feedback.append({"container_type": "notebook", "is_staff": False})
+    feedback.append({})
+    return json.dumps(feedback)
+
+
+def client_grader_feedback(rng, tests, structured=True):
+    """ Dict feedback of a client graded task, with the functions and variables of each test """
+    grader_results = {}
+    for i in range(tests):
+        functions = {"f{}".format(k): "def f{}(x):\n    return x * {}".format(k, rng.randint(0, 9)) for k in range(3)}
+        variables = {"v{}".format(k): [rng.randint(0, 100) for _value in range(50)] for k in range(5)}
+        grader_results["test_{}".format(i)] = {
+            "id": "1.{}".format(i),
+            "test_grade": rng.randint(0, 100),
+            "test_message": "Expected 42",
+            "functions": functions if structured else repr(functions),
+            "variables": variables if structured else repr(variables),
+        }
+    return {"grader_results": grader_results}
+
+
+def rst_fragments(rng, count):
+    """ A mix of plain and marked up fragments, as found in task descriptions and feedback """
+    fragments = []
+    for i in range(count):
+        if i % 2:
+            fragments.append("Your answer is correct, well done. Test {} passed.".format(rng.randint(0, 100)))
+        else:
+            fragments.append("Exercise {}\n==========\n\nWrite a *function* that returns ``{}``.\n\n"
+                             "- First item\n- Second item\n\n.. code-block:: python\n\n    print({})\n"
+                             .format(i, rng.randint(0, 100), rng.randint(0, 100)))
+    return fragments
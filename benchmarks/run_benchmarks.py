@@ -0,0 +1,280 @@
+"""
+Benchmarks of the feedback pipeline: diff computation, HDL feedback blocks and
+the rendering of the feedback in the frontend.
+
+Each benchmark is timed over several repetitions (the median is reported) and
+run once more under tracemalloc to measure its peak memory. The results can be
+saved as a baseline, and later runs compared against it: the run fails when a
+benchmark is slower, or uses more memory, than the baseline by more than the
+threshold.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--filter TEXT] [--repeat N] [--quick]
+                                        [--save-baseline FILE] [--baseline FILE]
+                                        [--threshold 0.25] [--memory-threshold 0.25]
+                                        [--output FILE] [--force-stubs]
+"""
+
+import argparse
+import atexit
+import difflib
+import gc
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import environment  # noqa: E402
+import generators  # noqa: E402
+
+SEED = 1234
+BASELINE_VERSION = 1
+
+
+class Benchmark:
+    """
+    A benchmark: a setup function building the input once, and the measured function.
+
+    Attributes:
+        - name (str): Unique name, used as the key of the baselines.
+        - setup (callable): Receives a random.Random and returns the argument of run.
+        - run (callable): The measured function.
+        - size (callable): Returns the number of bytes processed from the argument of run,
+        used to report the throughput. None reports operations per second.
+        - quick (bool): Whether the benchmark is part of the --quick subset.
+    """
+
+    def __init__(self, name, setup, run, size=None, quick=True):
+        self.name = name
+        self.setup = setup
+        self.run = run
+        self.size = size
+        self.quick = quick
+
+
+def _benchmarks():
+    """ Builds the list of benchmarks, importing the patches once the environment is ready """
+    import diff_engine
+    import feedback_envelope
+    import feedback_tools
+    import graders
+    import hdl_trace
+    import parsable_text
+    from results import GraderResult
+
+    # The renders would be served from the cache after the first repetition
+    parsable_text.ParsableText.render_cache = None
+
+    benchmarks = []
+
+    def diff_compute(size):
+        def setup(rng):
+            expected = generators.hdl_trace(rng, size)
+            return expected, generators.mutate_trace(rng, expected)
+        return Benchmark("diff_compute_{}kb".format(size // 1024), setup,
+                         lambda args: feedback_tools.Diff({}).compute(args[1], args[0]),
+                         size=lambda args: len(args[0]) + len(args[1]), quick=size <= 100 * 1024)
+
+    for size in (10 * 1024, 100 * 1024, 800 * 1024):
+        benchmarks.append(diff_compute(size))
+
+    # Baseline of diff_engine: the first diff_max_lines lines of the diff, as Diff.compute takes them
+    def bounded_diff(unified_diff, expected, actual, max_lines=100):
+        diff_generator = unified_diff(expected, actual, n=3)
+        lines = list(itertools.islice(diff_generator, max_lines + 2))
+        next(diff_generator, None)
+        return lines
+
+    def diff_baseline(engine, trace, size):
+        if trace == "mutated":
+            def setup(rng):
+                expected = generators.hdl_trace(rng, size)
+                return expected.splitlines(True), generators.mutate_trace(rng, expected).splitlines(True)
+        else:
+            def setup(rng):
+                return (generators.periodic_trace(rng, size, 100).splitlines(True),
+                        generators.periodic_trace(rng, size, 90).splitlines(True))
+        unified_diff = difflib.unified_diff if engine == "difflib" else diff_engine.unified_diff
+        return Benchmark("diff_{}_{}_{}kb".format(engine, trace, size // 1024), setup,
+                         lambda args: bounded_diff(unified_diff, args[0], args[1]),
+                         size=lambda args: sum(map(len, args[0])) + sum(map(len, args[1])),
+                         quick=size <= 100 * 1024)
+
+    for trace in ("mutated", "periodic"):
+        for size in (100 * 1024, 800 * 1024):
+            for engine in ("difflib", "diff_engine"):
+                benchmarks.append(diff_baseline(engine, trace, size))
+
+    def diffwavedrom_setup(rng):
+        expected = generators.hdl_trace(rng, 100 * 1024)
+        actual = generators.mutate_trace(rng, expected)
+        # The input sample is read from the testbench file
+        input_file, input_name = tempfile.mkstemp(suffix=".vhd")
+        with os.fdopen(input_file, "w") as testbench:
+            testbench.write(expected[:2048])
+        atexit.register(os.remove, input_name)
+        diff_tool = graders.DiffWaveDrom({"output_diff_for": [input_name], "show_input": True})
+        debug_info = {"files_feedback": {input_name: {
+            "diff": diff_tool.compute(actual, expected),
+            "stderr": "",
+            "waveform": hdl_trace.waveform_payload(hdl_trace.parse_trace(expected), hdl_trace.parse_trace(actual)),
+        }}}
+        return diff_tool, (input_name, "output.txt"), debug_info
+
+    benchmarks.append(Benchmark(
+        "diffwavedrom_hdl_to_html_block", diffwavedrom_setup,
+        lambda args: args[0].hdl_to_html_block(0, GraderResult.WRONG_ANSWER, args[1], args[2], False)))
+
+    def from_json(kind, cases):
+        generator = {
+            "hdl": generators.hdl_feedback,
+            "multilang": generators.multilang_feedback,
+            "notebook": generators.notebook_feedback,
+        }[kind]
+        return Benchmark("from_json_{}_{}".format(kind, cases), lambda rng: generator(rng, cases),
+                         lambda feedback: parsable_text.ParsableText(feedback, "json").parse(),
+                         size=len, quick=cases <= 50)
+
+    for kind in ("hdl", "multilang", "notebook"):
+        for cases in (1, 50, 500):
+            benchmarks.append(from_json(kind, cases))
+
+    def from_dict(tests, structured):
+        return Benchmark("from_dict_{}_{}".format("structured" if structured else "legacy", tests),
+                         lambda rng: generators.client_grader_feedback(rng, tests, structured),
+                         lambda feedback: parsable_text.ParsableText(feedback, "dict").parse(),
+                         quick=tests <= 50)
+
+    for tests in (1, 50, 500):
+        for structured in (True, False):
+            benchmarks.append(from_dict(tests, structured))
+
+    benchmarks.append(Benchmark(
+        "from_envelope_hdl_500",
+        lambda rng: feedback_envelope.encode_feedback(generators.hdl_feedback(rng, 500)),
+        lambda feedback: parsable_text.ParsableText(feedback, "json").parse(), size=len, quick=False))
+
+    benchmarks.append(Benchmark(
+        "rst_fragments_50", lambda rng: generators.rst_fragments(rng, 50),
+        lambda fragments: [parsable_text.ParsableText.rst(fragment) for fragment in fragments],
+        size=lambda fragments: sum(len(fragment) for fragment in fragments)))
+    return benchmarks
+
+
+def measure(benchmark, repeat):
+    """ Returns the measures of a benchmark as a dict """
+    argument = benchmark.setup(random.Random(SEED))
+    benchmark.run(argument)  # Warm up (imports, caches of compiled templates...)
+
+    timings = []
+    for _index in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        benchmark.run(argument)
+        timings.append(time.perf_counter() - start)
+    seconds = statistics.median(timings)
+
+    gc.collect()
+    tracemalloc.start()
+    benchmark.run(argument)
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = {"seconds": seconds, "min_seconds": min(timings), "peak_bytes": peak}
+    if benchmark.size is not None:
+        result["bytes_per_second"] = benchmark.size(argument) / seconds if seconds else None
+    else:
+        result["ops_per_second"] = 1 / seconds if seconds else None
+    return result
+
+
+def compare(results, baseline, threshold, memory_threshold):
+    """ Returns the list of regressions (str) of results with respect to the baseline """
+    regressions = []
+    for name, result in sorted(results.items()):
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        if result["seconds"] > reference["seconds"] * (1 + threshold):
+            regressions.append("{}: {:.4f}s, baseline {:.4f}s (+{:.0%})".format(
+                name, result["seconds"], reference["seconds"], result["seconds"] / reference["seconds"] - 1))
+        if reference["peak_bytes"] and result["peak_bytes"] > reference["peak_bytes"] * (1 + memory_threshold):
+            regressions.append("{}: peak {} bytes, baseline {} bytes (+{:.0%})".format(
+                name, result["peak_bytes"], reference["peak_bytes"],
+                result["peak_bytes"] / reference["peak_bytes"] - 1))
+    return regressions
+
+
+def _format_throughput(result):
+    if result.get("bytes_per_second") is not None:
+        return "{:10.2f} MB/s".format(result["bytes_per_second"] / 2 ** 20)
+    if result.get("ops_per_second") is not None:
+        return "{:10.1f} op/s".format(result["ops_per_second"])
+    return ""
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks of the feedback pipeline")
+    parser.add_argument("--filter", default="", help="Only run the benchmarks whose name contains this text")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed repetitions of each benchmark")
+    parser.add_argument("--quick", action="store_true", help="Skip the largest inputs")
+    parser.add_argument("--save-baseline", metavar="FILE", help="Save the results as a baseline")
+    parser.add_argument("--baseline", metavar="FILE", help="Fail if the results regress with respect to this baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed relative slowdown (0.25 = 25%%)")
+    parser.add_argument("--memory-threshold", type=float, default=0.25, help="Allowed relative increase of peak memory")
+    parser.add_argument("--output", metavar="FILE", help="Write the results as json")
+    parser.add_argument("--force-stubs", action="store_true",
+                        help="Use the offline replacements even if the real modules are installed")
+    args = parser.parse_args(argv)
+
+    replaced = environment.setup(args.force_stubs)
+    if replaced:
+        print("Using offline replacements of: " + ", ".join(replaced))
+
+    results = {}
+    for benchmark in _benchmarks():
+        if args.filter not in benchmark.name or (args.quick and not benchmark.quick):
+            continue
+        result = measure(benchmark, args.repeat)
+        results[benchmark.name] = result
+        print("{:40} {:10.4f}s {} {:10.1f} KB peak".format(
+            benchmark.name, result["seconds"], _format_throughput(result), result["peak_bytes"] / 2 ** 10))
+
+    report = {
+        "version": BASELINE_VERSION,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "seed": SEED,
+        "results": results,
+    }
+    for file_name in (args.output, args.save_baseline):
+        if file_name:
+            with open(file_name, "w") as output_file:
+                json.dump(report, output_file, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline, "r") as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline.get("version") != BASELINE_VERSION:
+            print("The baseline was saved by another version of the benchmarks, save it again")
+            return 2
+        regressions = compare(results, baseline["results"], args.threshold, args.memory_threshold)
+        if regressions:
+            print("\nRegressions with respect to " + args.baseline + ":")
+            for regression in regressions:
+                print("  " + regression)
+            return 1
+        print("\nNo regressions with respect to " + args.baseline)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,7 @@
+""" Offline replacement of inginious.frontend.accessible_time """
+
+from datetime import datetime
+
+
+def parse_date(date, default=None):
+    return datetime.strptime(date, "%Y-%m-%d %H:%M:%S")
@@ -0,0 +1,6 @@
+""" Offline replacement of the base_grader module of the grading containers """
+
+
+class BaseGrader:
+    def __init__(self, submission_request):
+        self.submission_request = submission_request
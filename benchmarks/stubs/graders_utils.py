@@ -0,0 +1,19 @@
+""" Offline replacement of the graders_utils module of the grading containers """
+
+import json
+
+
+def check_output(actual_output, expected_output):
+    return actual_output.strip() == expected_output.strip()
+
+
+def reduce_text(text, max_length):
+    return text[:max_length]
+
+
+def html_to_rst(html):
+    return ".. raw:: html\n\n    " + html.replace("\n", "\n    ")
+
+
+def feedback_str_for_compilation_error(compilation_output, container_type, response_type):
+    return json.dumps({"container_type": container_type, "compilation_output": compilation_output})
@@ -0,0 +1,20 @@
+""" Offline replacement of the results module of the grading containers """
+
+from enum import IntEnum
+
+
+class GraderResult(IntEnum):
+    COMPILATION_ERROR = 10
+    TIME_LIMIT_EXCEEDED = 20
+    MEMORY_LIMIT_EXCEEDED = 30
+    RUNTIME_ERROR = 40
+    OUTPUT_LIMIT_EXCEEDED = 50
+    GRADING_RUNTIME_ERROR = 60
+    INTERNAL_ERROR = 70
+    PRESENTATION_ERROR = 80
+    WRONG_ANSWER = 90
+    ACCEPTED = 100
+
+
+def parse_non_zero_return_code(return_code):
+    return GraderResult.RUNTIME_ERROR
@@ -0,0 +1,7 @@
+""" Offline replacement of the submission_requests module of the grading containers """
+
+
+class SubmissionRequest:
+    def __init__(self, problem_id, is_staff=False):
+        self.problem_id = problem_id
+        self.is_staff = is_staff
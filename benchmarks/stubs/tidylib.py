@@ -0,0 +1,5 @@
+""" Offline replacement of pytidylib, the html parser is not benchmarked """
+
+
+def tidy_fragment(text):
+    return text, ""
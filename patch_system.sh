@@ -13,11 +13,53 @@ fi
 PATCH_DIR="./patches"
 CONDA_ENV_PATH="$HOME/miniconda3/envs/python3.6_uncode/lib/python3.6/site-packages"
 
+# Recursos del visor de formas de onda (d3, iconos, d3-wave), servidos desde el directorio
+# static del plugin porque la red de exámenes no tiene acceso a internet.
+# Las versiones fijadas están en el repositorio (patches/vendor, ver su README.md); aquí solo se copian.
+# Se comprueban antes de sustituir nada: si faltan, el visor solo funciona con acceso al CDN, y solo se
+# continúa con UNCODE_ALLOW_CDN_ASSETS=1.
+VENDOR_DIR="$PATCH_DIR/vendor"
+STATIC_VENDOR_DIR="$CONDA_ENV_PATH/inginious/frontend/plugins/multilang/static/vendor"
+VENDOR_ASSETS=("d3.min.js" "free-solid-svg-icons.min.js" "d3-wave.js")
+vendor_ok=true
+for asset_name in "${VENDOR_ASSETS[@]}"; do
+    if [ ! -s "$VENDOR_DIR/$asset_name" ]; then
+        echo "❌ Falta $VENDOR_DIR/$asset_name." >&2
+        vendor_ok=false
+    fi
+done
+if [ "$vendor_ok" = true ]; then
+    if ! (cd "$VENDOR_DIR" && sha256sum --quiet -c SHA256SUMS); then
+        echo "❌ Los recursos de $VENDOR_DIR no coinciden con SHA256SUMS." >&2
+        vendor_ok=false
+    fi
+fi
+if [ "$vendor_ok" != true ]; then
+    if [ "${UNCODE_ALLOW_CDN_ASSETS:-0}" = 1 ]; then
+        echo "⚠️ UNCODE_ALLOW_CDN_ASSETS=1: el visor de formas de onda cargará los recursos desde el CDN."
+    else
+        echo "❌ Faltan los recursos del visor de formas de onda (ver $VENDOR_DIR/README.md), no se aplica ningún parche." >&2
+        echo "   Añádelos, o ejecuta con UNCODE_ALLOW_CDN_ASSETS=1 para cargarlos desde el CDN (requiere internet)." >&2
+        exit 1
+    fi
+fi
+
 echo ">> Sustituyendo archivos locales en entorno Conda..."
 
 # Sustituir archivos locales
 sudo cp "$PATCH_DIR/parsable_text.py" "$CONDA_ENV_PATH/inginious/frontend/"
+sudo cp "$PATCH_DIR/feedback_templates.py" "$CONDA_ENV_PATH/inginious/frontend/"
+sudo cp "$PATCH_DIR/feedback_envelope.py" "$CONDA_ENV_PATH/inginious/frontend/"
+sudo cp "$PATCH_DIR/feedback_details.py" "$CONDA_ENV_PATH/inginious/frontend/plugins/"
 sudo cp "$PATCH_DIR/hdlgrader.js" "$CONDA_ENV_PATH/inginious/frontend/plugins/multilang/static/"
+sudo cp "$PATCH_DIR/hdlgrader_worker.js" "$CONDA_ENV_PATH/inginious/frontend/plugins/multilang/static/"
+
+if [ "$vendor_ok" = true ]; then
+    sudo mkdir -p "$STATIC_VENDOR_DIR"
+    for asset_name in "${VENDOR_ASSETS[@]}"; do
+        sudo cp "$VENDOR_DIR/$asset_name" "$STATIC_VENDOR_DIR/"
+    done
+fi
 
 # Borrar caché de Python
 sudo rm -rf "$CONDA_ENV_PATH/inginious/frontend/plugins/multilang/__pycache__"
@@ -49,8 +91,45 @@ patch_file() {
     fi
 }
 
+# Función para instalar un módulo nuevo junto a un archivo existente
+install_alongside() {
+    local filename=$1
+    local anchor=$2
+    local replacement_path="$PATCH_DIR/$filename"
+
+    echo ">> Instalando $filename junto a $anchor..."
+
+    matches=$(sudo find / -type f -iname "$anchor" 2>/dev/null)
+
+    if [ -z "$matches" ]; then
+        echo "⚠️ No se encontró ninguna instancia de $anchor en el sistema."
+    else
+        while IFS= read -r path; do
+            # Se omite la copia del propio repositorio de parches
+            [ "$(dirname "$path")" = "$(realpath "$PATCH_DIR")" ] && continue
+            echo ">> Copiando $filename en: $(dirname "$path")"
+            sudo cp "$replacement_path" "$(dirname "$path")/"
+        done <<< "$matches"
+
+        echo "✅ $filename instalado en todas las ubicaciones encontradas."
+    fi
+}
+
 # Parchear graders.py y feedback_tools.py
 patch_file "graders.py"
 patch_file "feedback_tools.py"
 
-echo "✅ Todos los parches aplicados correctamente."
\ No newline at end of file
+# Módulos nuevos que usa graders.py
+install_alongside "hdl_cache.py" "graders.py"
+install_alongside "hdl_trace.py" "graders.py"
+install_alongside "hdl_stream.py" "graders.py"
+install_alongside "hdl_metrics.py" "graders.py"
+install_alongside "hdl_archive.py" "graders.py"
+install_alongside "hdl_pool.py" "graders.py"
+install_alongside "hdl_projects.py" "graders.py"
+install_alongside "hdl_regrade.py" "graders.py"
+install_alongside "diff_engine.py" "feedback_tools.py"
+install_alongside "feedback_templates.py" "feedback_tools.py"
+install_alongside "feedback_envelope.py" "feedback_tools.py"
+
+echo "✅ Todos los parches aplicados correctamente."
\ No newline at end of file
@@ -0,0 +1,236 @@
+"""
+This module contains a diff engine for long, repetitive outputs such as
+simulation traces.
+
+difflib.SequenceMatcher is quadratic on these outputs, even though only the
+first diff_max_lines lines of the diff are shown. This engine finds the
+matching lines with the patience algorithm (lines that are unique on both
+sides anchor the diff), falling back to the least repeated common line when
+there is no unique one, and produces the diff lazily from the beginning: the
+regions after the last shown hunk are never compared.
+
+Tools:
+    - unified_diff: Drop-in replacement of difflib.unified_diff.
+"""
+
+import bisect
+import collections
+import difflib
+
+#  Regions smaller than this (len(a) * len(b)) without anchors are compared with difflib
+_SMALL_REGION = 2 ** 14
+#  Lines repeated more than this are not used as anchors
+_MAX_ANCHOR_OCCURRENCES = 64
+
+
+def _longest_increasing_pairs(pairs):
+    """ Returns the longest subsequence of (i, j) pairs, sorted by i, with increasing j. """
+    tails = []
+    tail_indexes = []
+    previous = [None] * len(pairs)
+    for index, (_i, j) in enumerate(pairs):
+        position = bisect.bisect_left(tails, j)
+        if position == len(tails):
+            tails.append(j)
+            tail_indexes.append(index)
+        else:
+            tails[position] = j
+            tail_indexes[position] = index
+        previous[index] = tail_indexes[position - 1] if position else None
+
+    result = []
+    index = tail_indexes[-1] if tail_indexes else None
+    while index is not None:
+        result.append(pairs[index])
+        index = previous[index]
+    result.reverse()
+    return result
+
+
+def _anchors(a, alo, ahi, b, blo, bhi):
+    """ Returns the (i, j) pairs of lines to match in the region, in increasing order. """
+    a_counts = collections.Counter(a[alo:ahi])
+    b_positions = {}
+    for j in range(blo, bhi):
+        b_positions.setdefault(b[j], []).append(j)
+
+    pairs = []
+    a_first = {}
+    for i in range(alo, ahi):
+        line = a[i]
+        if a_counts[line] == 1:
+            positions = b_positions.get(line)
+            if positions is not None and len(positions) == 1:
+                pairs.append((i, positions[0]))
+        elif line not in a_first:
+            a_first[line] = i
+    if pairs:
+        return _longest_increasing_pairs(pairs)
+
+    # There is no unique common line, use the least repeated one
+    best = None
+    for line, i in a_first.items():
+        positions = b_positions.get(line)
+        if positions is None:
+            continue
+        occurrences = a_counts[line] + len(positions)
+        if occurrences <= _MAX_ANCHOR_OCCURRENCES and (best is None or occurrences < best[0]):
+            best = (occurrences, i, positions[0])
+    if best is not None:
+        return [best[1:]]
+
+    if (ahi - alo) * (bhi - blo) <= _SMALL_REGION:
+        matcher = difflib.SequenceMatcher(None, a[alo:ahi], b[blo:bhi], autojunk=False)
+        return [(alo + i + k, blo + j + k) for i, j, size in matcher.get_matching_blocks() for k in range(size)]
+    return []
+
+
+def _matching_lines(a, b):
+    """
+    Yields the (i, j, size) blocks of matching lines, in increasing order.
+
+    Regions are split by their anchors and processed from left to right with an
+    explicit stack, so the blocks are produced lazily.
+    """
+    stack = [(0, len(a), 0, len(b))]
+    while stack:
+        item = stack.pop()
+        if len(item) == 3:
+            yield item
+            continue
+
+        alo, ahi, blo, bhi = item
+        prefix = 0
+        while alo + prefix < ahi and blo + prefix < bhi and a[alo + prefix] == b[blo + prefix]:
+            prefix += 1
+        suffix = 0
+        while (alo + prefix < ahi - suffix and blo + prefix < bhi - suffix and
+               a[ahi - suffix - 1] == b[bhi - suffix - 1]):
+            suffix += 1
+
+        pending = []
+        if prefix:
+            pending.append((alo, blo, prefix))
+        i, j = alo + prefix, blo + prefix
+        end_i, end_j = ahi - suffix, bhi - suffix
+        if i < end_i and j < end_j:
+            anchors = _anchors(a, i, end_i, b, j, end_j)
+            for anchor_i, anchor_j in anchors:
+                if i < anchor_i and j < anchor_j:
+                    pending.append((i, anchor_i, j, anchor_j))
+                pending.append((anchor_i, anchor_j, 1))
+                i, j = anchor_i + 1, anchor_j + 1
+            # Without anchors the whole region is a replacement
+            if anchors and i < end_i and j < end_j:
+                pending.append((i, end_i, j, end_j))
+        if suffix:
+            pending.append((end_i, end_j, suffix))
+        stack.extend(reversed(pending))
+
+
+def get_opcodes(a, b):
+    """ Yields the opcodes (as in difflib.SequenceMatcher.get_opcodes) that turn a into b. """
+    i = j = 0
+    current = None
+    blocks = _matching_lines(a, b)
+    for block in blocks:
+        if current is not None and current[0] + current[2] == block[0] and current[1] + current[2] == block[1]:
+            current = (current[0], current[1], current[2] + block[2])
+            continue
+        for opcode in _opcodes_until(current, i, j):
+            yield opcode
+        if current is not None:
+            i, j = current[0] + current[2], current[1] + current[2]
+        current = block
+    for opcode in _opcodes_until(current, i, j):
+        yield opcode
+    if current is not None:
+        i, j = current[0] + current[2], current[1] + current[2]
+    for opcode in _opcodes_until((len(a), len(b), 0), i, j):
+        yield opcode
+
+
+def _opcodes_until(block, i, j):
+    if block is None:
+        return
+    ai, bj, size = block
+    tag = ''
+    if i < ai and j < bj:
+        tag = 'replace'
+    elif i < ai:
+        tag = 'delete'
+    elif j < bj:
+        tag = 'insert'
+    if tag:
+        yield (tag, i, ai, j, bj)
+    if size:
+        yield ('equal', ai, ai + size, bj, bj + size)
+
+
+def get_grouped_opcodes(a, b, n=3):
+    """ Lazy version of difflib.SequenceMatcher.get_grouped_opcodes. """
+    codes = get_opcodes(a, b)
+    code = next(codes, None)
+    if code is None:
+        code = ('equal', 0, 1, 0, 1)
+    # Fixup leading and trailing groups if they show no changes.
+    if code[0] == 'equal':
+        tag, i1, i2, j1, j2 = code
+        code = tag, max(i1, i2 - n), i2, max(j1, j2 - n), j2
+
+    nn = n + n
+    group = []
+    next_code = next(codes, None)
+    while code is not None:
+        tag, i1, i2, j1, j2 = code
+        if next_code is None and tag == 'equal':
+            i2, j2 = min(i2, i1 + n), min(j2, j1 + n)
+        if tag == 'equal' and i2 - i1 > nn:
+            group.append((tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)))
+            yield group
+            group = []
+            i1, j1 = max(i1, i2 - n), max(j1, j2 - n)
+        group.append((tag, i1, i2, j1, j2))
+        code, next_code = next_code, next(codes, None)
+    if group and not (len(group) == 1 and group[0][0] == 'equal'):
+        yield group
+
+
+def _format_range_unified(start, stop):
+    beginning = start + 1
+    length = stop - start
+    if length == 1:
+        return '{}'.format(beginning)
+    if not length:
+        beginning -= 1
+    return '{},{}'.format(beginning, length)
+
+
+def unified_diff(a, b, fromfile='', tofile='', n=3, lineterm='\n'):
+    """
+    Yields the lines of the unified diff of the lists of lines a and b, in the same
+    format as difflib.unified_diff. The diff is computed as the lines are consumed.
+    """
+    started = False
+    for group in get_grouped_opcodes(a, b, n):
+        if not started:
+            started = True
+            yield '--- {}{}'.format(fromfile, lineterm)
+            yield '+++ {}{}'.format(tofile, lineterm)
+
+        first, last = group[0], group[-1]
+        file1_range = _format_range_unified(first[1], last[2])
+        file2_range = _format_range_unified(first[3], last[4])
+        yield '@@ -{} +{} @@{}'.format(file1_range, file2_range, lineterm)
+
+        for tag, i1, i2, j1, j2 in group:
+            if tag == 'equal':
+                for line in a[i1:i2]:
+                    yield ' ' + line
+                continue
+            if tag in {'replace', 'delete'}:
+                for line in a[i1:i2]:
+                    yield '-' + line
+            if tag in {'replace', 'insert'}:
+                for line in b[j1:j2]:
+                    yield '+' + line
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+Plugin that renders the feedback of the submissions in summary mode: only the
+result line of each test is sent with the page, and the details of a test (diff,
+stderr, input preview, executed code...) are requested when its panel is expanded.
+
+The details are rendered from the feedback stored with the submission, so they can
+be requested from any process of the webapp, by the users of the submission and
+by the staff of its course.
+
+Configuration (configuration.yaml):
+    plugins:
+      - plugin_module: inginious.frontend.plugins.feedback_details
+        min_cases: 10   # Feedbacks with fewer test cases are fully rendered
+"""
+
+import functools
+
+import web
+
+from inginious.frontend.pages.utils import INGIniousAuthPage
+from inginious.frontend.parsable_text import ParsableText
+
+_DETAILS_URL = "/feedback_details/{submission_id}/{test_id}"
+
+
+class FeedbackDetailsPage(INGIniousAuthPage):
+    """ Returns the html of the details of a test of the feedback of a submission """
+
+    def GET_AUTH(self, submission_id, test_id):  # pylint: disable=arguments-differ
+        submission = self.submission_manager.get_submission(submission_id, user_check=False)
+        if submission is None or "text" not in submission:
+            raise web.notfound()
+        try:
+            course = self.course_factory.get_course(submission["courseid"])
+        except Exception:
+            raise web.notfound()
+
+        is_staff = self.user_manager.has_staff_rights_on_course(course)
+        if not is_staff and self.user_manager.session_username() not in submission["username"]:
+            raise web.notfound()
+
+        details = ParsableText(submission["text"], "json", show_everything=is_staff).render_details(int(test_id))
+        web.header('Content-Type', 'text/html; charset=utf-8')
+        return details
+
+
+def _render_with_submission_id(get_feedback_from_submission):
+    """ Renders the feedback of a submission with the id needed to request the details of its tests """
+
+    @functools.wraps(get_feedback_from_submission)
+    def wrapper(submission, *args, **kwargs):
+        with ParsableText.rendering_submission(submission.get("_id")):
+            return get_feedback_from_submission(submission, *args, **kwargs)
+
+    return wrapper
+
+
+def init(plugin_manager, course_factory, client, plugin_config):  # pylint: disable=unused-argument
+    """ Init the plugin """
+    plugin_manager.add_page(r'/feedback_details/([0-9a-f]{24})/([0-9]+)', FeedbackDetailsPage)
+    submission_manager = plugin_manager.get_submission_manager()
+    submission_manager.get_feedback_from_submission = _render_with_submission_id(
+        submission_manager.get_feedback_from_submission)
+    ParsableText.lazy_details_url = _DETAILS_URL
+    ParsableText.lazy_details_min_cases = plugin_config.get("min_cases", 10)
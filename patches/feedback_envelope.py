@@ -0,0 +1,155 @@
+"""
+This module contains the envelope of the feedback stored in the submissions,
+shared by the graders (grading containers) and ParsableText (frontend).
+
+An envelope is a text with a header line and a payload:
+
+    UNCODE-FEEDBACK/<version> <codec> <size> <payload size>
+    <payload>
+
+size is the number of bytes of the utf-8 encoded feedback and payload size the
+number of bytes of the compressed feedback. The payload is the compressed
+feedback, base64 encoded, or the feedback itself with the identity codec. Texts
+without the header (plain json, rst...) are returned as they are by
+decode_feedback, so the feedback of older submissions is still read.
+
+The zstd codec requires the zstandard package. When it is not installed the
+feedback is compressed with zlib.
+
+Tools:
+    - encode_feedback: Wraps a feedback in an envelope.
+    - decode_feedback: Returns the feedback of an envelope, or the text itself.
+    - is_envelope: Whether a text is an envelope.
+    - EnvelopeError: Raised when an envelope can not be decoded.
+"""
+
+import base64
+import binascii
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ENVELOPE_MAGIC = "UNCODE-FEEDBACK/"
+ENVELOPE_VERSION = 1
+CODECS = ("identity", "zlib", "zstd")
+#  Feedbacks shorter than 1 KB are not worth compressing
+DEFAULT_MIN_SIZE = 2 ** 10
+#  64 MBs will be the max size of a decoded feedback
+DEFAULT_MAX_SIZE = (2 ** 20) * 64
+
+
+class EnvelopeError(Exception):
+    """ The envelope is corrupted, too large, or uses an unknown version or codec. """
+
+
+def is_envelope(text):
+    """ Whether the text is a feedback envelope """
+    return isinstance(text, str) and text.startswith(ENVELOPE_MAGIC)
+
+
+def encode_feedback(feedback, codec="zlib", min_size=DEFAULT_MIN_SIZE, level=6):
+    """
+    Wraps the feedback in an envelope.
+
+    Args:
+        - feedback (str): The feedback, e.g. the json list of the test cases.
+        - codec (str): "zlib", "zstd" or "identity". None returns the feedback without envelope.
+        - min_size (int): Feedbacks with fewer bytes are stored with the identity codec.
+        - level (int): Compression level.
+
+    Returns:
+        The text of the envelope.
+    """
+    if codec is None:
+        return feedback
+    if codec not in CODECS:
+        raise ValueError("Unknown feedback codec: " + str(codec))
+    data = feedback.encode("utf-8")
+    if codec == "zstd" and zstandard is None:
+        codec = "zlib"
+    if len(data) < min_size:
+        codec = "identity"
+
+    if codec == "identity":
+        payload = feedback
+        payload_size = len(data)
+    else:
+        if codec == "zstd":
+            compressed = zstandard.ZstdCompressor(level=level).compress(data)
+        else:
+            compressed = zlib.compress(data, level)
+        payload = base64.b64encode(compressed).decode("ascii")
+        payload_size = len(compressed)
+    return "{}{} {} {} {}\n{}".format(ENVELOPE_MAGIC, ENVELOPE_VERSION, codec, len(data), payload_size, payload)
+
+
+def _decompress_zlib(compressed, size):
+    decompressor = zlib.decompressobj()
+    try:
+        # Never inflates more than the size in the header (plus one, to detect a mismatch)
+        data = decompressor.decompress(compressed, size + 1)
+    except zlib.error:
+        raise EnvelopeError("Corrupted feedback payload")
+    if decompressor.unconsumed_tail or not decompressor.eof:
+        raise EnvelopeError("The size of the feedback does not match its header")
+    return data
+
+
+def _decompress_zstd(compressed, size):
+    if zstandard is None:
+        raise EnvelopeError("The feedback is compressed with zstd, which is not installed")
+    try:
+        return zstandard.ZstdDecompressor().decompress(compressed, max_output_size=size + 1)
+    except zstandard.ZstdError:
+        raise EnvelopeError("Corrupted feedback payload")
+
+
+def decode_feedback(text, max_size=DEFAULT_MAX_SIZE):
+    """
+    Returns the feedback of an envelope. Texts that are not envelopes are returned as they are.
+
+    Args:
+        - text (str): The stored feedback.
+        - max_size (int): Max number of bytes of the decoded feedback.
+
+    Raises:
+        EnvelopeError: If the envelope can not be decoded.
+    """
+    if not is_envelope(text):
+        return text
+    header, _separator, payload = text.partition("\n")
+    try:
+        version, codec, size, payload_size = header[len(ENVELOPE_MAGIC):].split(" ")
+        version, size, payload_size = int(version), int(size), int(payload_size)
+    except ValueError:
+        raise EnvelopeError("Malformed feedback header: " + header[:100])
+    if version != ENVELOPE_VERSION:
+        raise EnvelopeError("Unsupported feedback version: {}".format(version))
+    if codec not in CODECS:
+        raise EnvelopeError("Unknown feedback codec: " + codec)
+    if size > max_size:
+        raise EnvelopeError("The feedback exceeds {} bytes".format(max_size))
+    if codec == "identity":
+        if len(payload) > size or len(payload.encode("utf-8")) != size:
+            raise EnvelopeError("The size of the feedback does not match its header")
+        return payload
+
+    try:
+        compressed = base64.b64decode(payload.encode("ascii"), validate=True)
+    except (binascii.Error, UnicodeEncodeError):
+        raise EnvelopeError("Corrupted feedback payload")
+    if len(compressed) != payload_size:
+        raise EnvelopeError("The size of the feedback payload does not match its header")
+    if codec == "zstd":
+        data = _decompress_zstd(compressed, size)
+    else:
+        data = _decompress_zlib(compressed, size)
+    if len(data) != size:
+        raise EnvelopeError("The size of the feedback does not match its header")
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        raise EnvelopeError("Corrupted feedback payload")
@@ -0,0 +1,182 @@
+"""
+This module contains the html templates of the feedback of a test case, shared by
+feedback_tools.Diff (grading container) and ParsableText (frontend).
+
+The templates are translated with the builtin _ of the running environment. They
+are built once per language and cached, the key being the translation of their
+messages, so they follow the language of the current request in the frontend.
+
+Tools:
+    - get_templates: Returns the TestCaseTemplates of the current language.
+    - render_test_case: Builds the html block of a test case.
+    - render_test_case_details: Builds the debug info of a test case, without its summary line.
+    - render_test_case_summary: Builds the summary line of a test case whose debug info is loaded
+    when expanded.
+    - escape_text: Escapes a text to be embedded in a javascript template literal.
+    - get_file_feedback: Returns the debug info of a test case.
+"""
+
+import threading
+
+_TOGGLE_DIFF = "Toggle diff"
+_TOGGLE_DIFF_FOR_STAFF = "Toggle diff (only for staff)"
+_INPUT = """<p>Input preview: {title_input}</p>
+                                  <pre class="input-area" id="{block_id}-input">{input_text}</pre>
+                                  <div id="{title_input}_download_link"></div>
+                                  <script>createDownloadLink("{title_input}");</script>
+                                  """
+_CUSTOM_FEEDBACK = """<p>Custom feedback</p><pre>{custom_feedback}</pre><br>"""
+
+_TOGGLE_DEBUG_INFO = ["""<ul><li><strong>Test {test_id}: {result_name} </strong>
+                                    <a class="btn btn-default btn-link btn-xs" role="button" data-toggle="collapse" 
+                                    href="#{panel_id}" aria-expanded="false" aria-controls="{panel_id}">""",
+                      """</a> <div class="collapse" id="{panel_id}">""",
+                      """</div></li></ul>""",
+                      """</a> <div class="collapse lazy-details" id="{panel_id}" data-details-url="{details_url}">"""]
+_DIFF = """<pre id="{block_id}"></pre>
+                                <script>updateDiffBlock("{block_id}", `{diff_result}`);</script>"""
+_RUNTIME_ERROR = """<p>Error: </p><br><pre>{stderr}</pre>"""
+_NOT_DEBUG_INFO = """<ul><li><strong>Test {0}: {1} </strong></li></ul>"""
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+class TestCaseTemplates:
+    """
+    The translated templates of the feedback of a test case.
+
+    Attributes:
+        - toggle_debug_info (list): Opening and closing html of the collapsible debug info.
+        - toggle_debug_info_for_staff (list): Same as toggle_debug_info, for staff members.
+        - lazy_debug_info (list): Same as toggle_debug_info, with a panel filled when expanded.
+        - lazy_debug_info_for_staff (list): Same as lazy_debug_info, for staff members.
+        - input (str): Preview of the input of the test case.
+        - diff (str): Diff viewer.
+        - custom_feedback (str): Custom feedback given by the task creator.
+        - runtime_error (str): Standard error of the program.
+        - not_debug_info (str): Test case without debug info, formatted with the
+        test number and the result name.
+    """
+
+    def __init__(self, toggle_diff, toggle_diff_for_staff, input_template, custom_feedback):
+        self.toggle_debug_info = [_TOGGLE_DEBUG_INFO[0] + toggle_diff + _TOGGLE_DEBUG_INFO[1],
+                                  _TOGGLE_DEBUG_INFO[2]]
+        self.toggle_debug_info_for_staff = [_TOGGLE_DEBUG_INFO[0] + toggle_diff_for_staff + _TOGGLE_DEBUG_INFO[1],
+                                            _TOGGLE_DEBUG_INFO[2]]
+        self.lazy_debug_info = [_TOGGLE_DEBUG_INFO[0] + toggle_diff + _TOGGLE_DEBUG_INFO[3], _TOGGLE_DEBUG_INFO[2]]
+        self.lazy_debug_info_for_staff = [_TOGGLE_DEBUG_INFO[0] + toggle_diff_for_staff + _TOGGLE_DEBUG_INFO[3],
+                                          _TOGGLE_DEBUG_INFO[2]]
+        self.input = input_template
+        self.diff = _DIFF
+        self.custom_feedback = custom_feedback
+        self.runtime_error = _RUNTIME_ERROR
+        self.not_debug_info = _NOT_DEBUG_INFO
+
+
+def get_templates():
+    """ Returns the templates translated to the current language """
+    messages = (_(_TOGGLE_DIFF), _(_TOGGLE_DIFF_FOR_STAFF), _(_INPUT), _(_CUSTOM_FEEDBACK))
+    templates = _cache.get(messages)
+    if templates is None:
+        with _cache_lock:
+            templates = _cache.setdefault(messages, TestCaseTemplates(*messages))
+    return templates
+
+
+def _template_info(test_id, result_name, input_filename, input_text):
+    return {
+        "test_id": test_id + 1,
+        "result_name": result_name,
+        "panel_id": "collapseDiff" + str(test_id),
+        "block_id": "diffBlock" + str(test_id),
+        "input_text_id": "input_text_" + str(test_id),
+        "input_text": input_text,
+        "title_input": input_filename
+    }
+
+
+def _details_templates(templates, template_info, diff_result, stderr, custom_feedback, show_input):
+    template = []
+    if custom_feedback is not None:
+        template_info["custom_feedback"] = custom_feedback
+        template.append(templates.custom_feedback)
+
+    if show_input:
+        template.append(templates.input)
+
+    if diff_result is not None:
+        template_info["diff_result"] = escape_text(diff_result)
+        template.append(templates.diff)
+
+    if stderr is not None:
+        template_info["stderr"] = stderr
+        template.append(templates.runtime_error)
+    return template
+
+
+def render_test_case(templates, test_id, result_name, input_filename, input_text, diff_result=None, stderr=None,
+                     custom_feedback=None, show_input=False, is_staff=False):
+    """
+    Builds the html block with the debug info of a test case.
+
+    Args:
+        - templates (TestCaseTemplates): The templates to use.
+        - test_id (int): Index (starting at 0) of the test case.
+        - result_name (str): Name of the result of the test case.
+        - input_filename (str): Name of the input file of the test case.
+        - input_text (str): Sample of the input of the test case.
+        - diff_result (str): Diff of the outputs, None when there is no diff.
+        - stderr (str): Standard error to show, None when there was no runtime error.
+        - custom_feedback (str): Custom feedback of the test case, if any.
+        - show_input (bool): Whether the input sample is shown.
+        - is_staff (bool): Whether the block is shown to a staff member.
+
+    Returns:
+        The html block of the test case.
+    """
+    template_info = _template_info(test_id, result_name, input_filename, input_text)
+    toggle_template = templates.toggle_debug_info_for_staff if is_staff else templates.toggle_debug_info
+    template = [toggle_template[0]]
+    template.extend(_details_templates(templates, template_info, diff_result, stderr, custom_feedback, show_input))
+    template.append(toggle_template[1])
+    return "".join(template).format(**template_info)
+
+
+def render_test_case_details(templates, test_id, result_name, input_filename, input_text, diff_result=None,
+                             stderr=None, custom_feedback=None, show_input=False):
+    """
+    Builds the content of the collapsible panel of a test case, the arguments are
+    the same as in render_test_case.
+    """
+    template_info = _template_info(test_id, result_name, input_filename, input_text)
+    template = _details_templates(templates, template_info, diff_result, stderr, custom_feedback, show_input)
+    return "".join(template).format(**template_info)
+
+
+def render_test_case_summary(templates, test_id, result_name, details_url, is_staff=False):
+    """
+    Builds the summary line of a test case with an empty collapsible panel, which
+    is filled with the html returned by details_url when it is expanded.
+    """
+    template_info = _template_info(test_id, result_name, "", "")
+    template_info["details_url"] = details_url
+    lazy_template = templates.lazy_debug_info_for_staff if is_staff else templates.lazy_debug_info
+    return (lazy_template[0] + lazy_template[1]).format(**template_info)
+
+
+def get_file_feedback(debug_info, test_id, input_filename):
+    """
+    Returns the debug info (diff, stderr...) of a test case. The HDL grader stores it by the
+    index of the test case, since several test cases may share an input file; older feedbacks
+    and the other graders store it by the name of the input file.
+    """
+    files_feedback = debug_info.get("files_feedback", {})
+    file_feedback = files_feedback.get(str(test_id))
+    if file_feedback is None:
+        file_feedback = files_feedback.get(input_filename, {})
+    return file_feedback
+
+
+def escape_text(text):
+    return text.replace('\\', "\\\\").replace('`', "\\`").replace('\n', "\\n").replace("$", "\\$").replace('\t', "\\t")
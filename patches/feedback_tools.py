@@ -9,14 +9,22 @@ TO DO:
     - Charts: Donut, Bars
 """
 
-import difflib
+import collections
 import itertools
+import os
 import sys
+import threading
 
+import diff_engine
+import feedback_templates
+# Re-exported: escape_text was defined here, and the graders of the other containers import it from this module
+from feedback_templates import escape_text
 from graders_utils import reduce_text, html_to_rst as html2rst
 from inginious import feedback
 from results import GraderResult
 
+__all__ = ["Diff", "get_input_sample", "set_feedback", "escape_text"]
+
 
 class Diff:
     """
@@ -28,8 +36,8 @@ class Diff:
         - diff_context_lines (int): The diff tool context lines to use. # TODO Better Resume
         - output_diff_for (set): Group of str containing the test cases for which the diff
         tool is going to be used.
-        - testcase_template (str): Containing the html code for presenting the diff of
-        an specific test case
+        - templates (TestCaseTemplates): The html templates for presenting the diff of
+        an specific test case, shared with the frontend (check 'feedback_templates.py')
     """
 
     def __init__(self, options):
@@ -48,33 +56,14 @@ class Diff:
         self.custom_feedback = options.get("custom_feedback", {})
         self.show_input = options.get('show_input', False)
 
-        self.toggle_debug_info_template = ["""<ul><li><strong>Test {test_id}: {result_name} </strong>
-                                    <a class="btn btn-default btn-link btn-xs" role="button" data-toggle="collapse" 
-                                    href="#{panel_id}" aria-expanded="false" aria-controls="{panel_id}">""" +
-                                           _("Toggle diff") + """</a> <div class="collapse" id="{panel_id}">""",
-                                           """</div></li></ul>"""]
-        self.toggle_debug_info_template_for_staff = ["""<ul><li><strong>Test {test_id}: {result_name} </strong>
-                                    <a class="btn btn-default btn-link btn-xs" role="button" data-toggle="collapse" 
-                                    href="#{panel_id}" aria-expanded="false" aria-controls="{panel_id}">""" +
-                                           _("Toggle diff (only for staff)") + """</a> <div class="collapse" id="{panel_id}">""",
-                                           """</div></li></ul>"""]
-        self.input_template = _("""<p>Input preview: {title_input}</p>
-                                  <pre class="input-area" id="{block_id}-input">{input_text}</pre>
-                                  <div id="{title_input}_download_link"></div>
-                                  <script>createDownloadLink("{title_input}");</script>
-                                  """)
-        self.diff_template = """<pre id="{block_id}"></pre>
-                                <script>updateDiffBlock("{block_id}", `{diff_result}`);</script>"""
-        self.custom_feedback_template = _("""<p>Custom feedback</p><pre>{custom_feedback}</pre><br>""")
-        self.runtime_error_template = """<p>Error: </p><br><pre>{stderr}</pre>"""
-
-        self.not_debug_info_template = """<ul><li><strong>Test {0}: {1} </strong></li></ul>"""
+        self.templates = feedback_templates.get_templates()
 
     def compute(self, current_output, expected_output):
         """
         Computes a diff between the program output and the expected output.
         This function will strip the diff to diff_max_lines, and provide a context of diff_context_lines
-        for each difference found.
+        for each difference found. The diff is computed lazily, so the outputs are only compared up to
+        the last line shown.
 
         Args:
             - actual_output (str): First text given for the diff tool.
@@ -94,9 +83,9 @@ class Diff:
         if actual_output and actual_output[-1] == '\n':
             actual_output_lines.append("\n")
 
-        diff_generator = difflib.unified_diff(expected_output_lines, actual_output_lines, n=self.diff_context_lines,
-                                              fromfile="expected_output",
-                                              tofile="your_output")
+        diff_generator = diff_engine.unified_diff(expected_output_lines, actual_output_lines, n=self.diff_context_lines,
+                                                  fromfile="expected_output",
+                                                  tofile="your_output")
 
         # Remove file names (legend will be added in the frontend)
         start = 2
@@ -144,63 +133,76 @@ class Diff:
         """
         input_filename = test_case[0]
         if result in [GraderResult.ACCEPTED, GraderResult.INTERNAL_ERROR] or input_filename not in self.output_diff_for and not is_staff:
-            text = self.not_debug_info_template.format(
+            text = self.templates.not_debug_info.format(
                 test_id + 1, result.name)
             return html2rst(text)
 
-        diff_result = debug_info.get("files_feedback", {}).get(input_filename, {}).get("diff", None)
-        stderr = debug_info.get("files_feedback", {}).get(input_filename, {}).get("stderr", "")
-        diff_available = diff_result is not None
-        input_text = get_input_sample(test_case)
-        template_info = {
-            "test_id": test_id + 1,
-            "result_name": result.name,
-            "panel_id": "collapseDiff" + str(test_id),
-            "block_id": "diffBlock" + str(test_id),
-            "input_text_id": "input_text_" + str(test_id),
-            "input_text": input_text,
-            "title_input": test_case[0]
-        }
-        template = [self.toggle_debug_info_template[0]] if not is_staff else [self.toggle_debug_info_template_for_staff[0]]
-
+        file_feedback = feedback_templates.get_file_feedback(debug_info, test_id, input_filename)
+        diff_html = feedback_templates.render_test_case(
+            self.templates, test_id, result.name, input_filename, get_input_sample(test_case),
+            diff_result=file_feedback.get("diff", None),
+            stderr=file_feedback.get("stderr", "") if GraderResult.RUNTIME_ERROR == result else None,
+            custom_feedback=self.custom_feedback.get(input_filename, None),
+            show_input=self.show_input, is_staff=is_staff)
 
-        if input_filename in self.custom_feedback:
-            template_info["custom_feedback"] = self.custom_feedback[input_filename]
-            template.append(self.custom_feedback_template)
-
-        if self.show_input:
-            template.append(self.input_template)
+        return html2rst(diff_html)
 
-        if diff_available:
-            template_info["diff_result"] = escape_text(diff_result)
-            template.append(self.diff_template)
 
-        if GraderResult.RUNTIME_ERROR == result:
-            template_info["stderr"] = stderr
-            template.append(self.runtime_error_template)
+_INPUT_SAMPLE_MAX_LINES = 15
+_INPUT_SAMPLE_MAX_LENGTH = 2 ** 10
+#  Input samples kept in memory, by (file path, modification time, size)
+_INPUT_SAMPLE_CACHE_SIZE = 256
+_input_samples = collections.OrderedDict()
+_input_samples_lock = threading.Lock()
 
-        template.append(self.toggle_debug_info_template[1])
-        diff_html = "".join(template).format(**template_info)
 
-        return html2rst(diff_html)
+def _read_input_sample(file_name, max_lines=_INPUT_SAMPLE_MAX_LINES, max_length=_INPUT_SAMPLE_MAX_LENGTH):
+    """
+    Reads the sample of the file, without reading more than max_lines lines nor more than
+    max_length + 1 characters (plus one to know whether the sample is complete).
+    """
+    lines = []
+    length = 0
+    more_lines = False
+    with open(file_name, 'r') as input_file:
+        while len(lines) < max_lines and length <= max_length:
+            line = input_file.readline(max_length + 1 - length)
+            if not line:
+                break
+            lines.append(line)
+            length += len(line)
+        if len(lines) == max_lines and length <= max_length:
+            more_lines = input_file.read(1) != ''
+
+    input_sample = "".join(lines)
+    if more_lines:
+        input_sample += '...\n'
+    if len(input_sample) > max_length:
+        return input_sample[:max_length] + '...\n'
+    return input_sample
 
 
 def get_input_sample(test_case):
-    """ This method reads and gets an small sample of input that will be shown to students."""
-    max_lines = 15
-    max_length = 2 ** 10
-    with open(test_case[0], 'r') as input_file:
-        input_text = input_file.readlines()
-        if len(input_text) > max_lines:
-            input_sample = "".join(input_text[:max_lines] + ['...\n'])
-        else:
-            input_sample = "".join(input_text)
-
-        if len(input_sample) > max_length:
-            return input_sample[:max_length] + '...\n'
-        else:
+    """
+    This method reads and gets an small sample of input that will be shown to students.
+    Only the beginning of the file is read, and the sample is cached until the file changes.
+    """
+    file_name = test_case[0]
+    stat = os.stat(file_name)
+    key = (os.path.abspath(file_name), stat.st_mtime_ns, stat.st_size)
+    with _input_samples_lock:
+        input_sample = _input_samples.get(key)
+        if input_sample is not None:
+            _input_samples.move_to_end(key)
             return input_sample
 
+    input_sample = _read_input_sample(file_name)
+    with _input_samples_lock:
+        _input_samples[key] = input_sample
+        if len(_input_samples) > _INPUT_SAMPLE_CACHE_SIZE:
+            _input_samples.popitem(last=False)
+    return input_sample
+
 
 def set_feedback(results):
     """
@@ -219,6 +221,3 @@ def set_feedback(results):
     feedback.set_grade(results['grade'])
     feedback.set_global_feedback(results['global']['feedback'])
 
-
-def escape_text(text):
-    return text.replace('\\', "\\\\").replace('`', "\\`").replace('\n', "\\n").replace("$", "\\$").replace('\t', "\\t")
@@ -2,13 +2,28 @@ from distutils.log import debug
 import json
 import os
 import html
+import pickle
+import shutil
+import subprocess
 import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
 
 import projects
 from results import GraderResult, parse_non_zero_return_code
-from zipfile import ZipFile
 from base_grader import BaseGrader
 from feedback_tools import Diff, set_feedback, get_input_sample
+from feedback_templates import get_file_feedback
+from feedback_envelope import encode_feedback
+from hdl_trace import parse_trace, compare_traces, waveform_payload
+from hdl_stream import StreamingComparator, BoundedOutput, run_streaming, bound_output, STOPPED_BY_BYTES, \
+    STOPPED_BY_TIMEOUT, DEFAULT_HEAD_SIZE, DEFAULT_TAIL_SIZE
+from hdl_cache import GoldenOutputCache, DirectoryCache, ResultCache, hash_files, DEFAULT_CACHE_DIR, \
+    PERSISTENT_CACHE_DIR, DEFAULT_MAX_CACHE_SIZE, DEFAULT_RESULT_TTL, DEFAULT_GRACE_PERIOD
+from hdl_projects import create_split_project, OutputLimitExceeded, DEFAULT_TIME_LIMIT, DEFAULT_MAX_OUTPUT_SIZE
+from hdl_metrics import PhaseTimer, summarize_phases, append_metrics
+from hdl_pool import ProjectDirectoryPool, DEFAULT_POOL_DIR
+from hdl_archive import extract_sources, ArchiveError, SOURCE_EXTENSIONS, DEFAULT_MAX_FILES, DEFAULT_MAX_SIZE
 import graders_utils as gutils
 from submission_requests import SubmissionRequest
 from shutil import copyfile
@@ -23,75 +38,183 @@ class HDLGrader(BaseGrader):
         self.check_output = options.get('check_output', gutils.check_output)
         self.entity_name = options.get('entity_name', 'testbench')
         self.response_type = options.get('response_type','json')
+        # Codec of the envelope of the json feedback ("zlib", "zstd", "identity"), None stores plain json
+        self.feedback_compression = options.get('feedback_compression', 'zlib')
+        self.compare_traces = options.get('compare_traces', False)
+        self.unknown_as_wildcard = options.get('unknown_as_wildcard', False)
+        self.waveform = options.get('waveform', True)
+        # The waveform of a failed test case starts some rows before the first difference and is
+        # bounded to a number of value changes, so it stays in the order of size of the diff
+        self.waveform_max_changes = options.get('waveform_max_changes', 2000)
+        self.waveform_context_rows = options.get('waveform_context_rows', 20)
+        self.waveform_max_rows = options.get('waveform_max_rows', 50000)
+        self.streaming_comparison = options.get('streaming_comparison', False)
+        self.stream_max_mismatches = options.get('stream_max_mismatches', 50)
+        self.stream_max_bytes = options.get('stream_max_bytes', None)
+        # Limits of each command of the projects of hdl_projects.py (the time limit of the task, in seconds)
+        self.time_limit = options.get('time_limit', DEFAULT_TIME_LIMIT)
+        self.stream_timeout = options.get('stream_timeout', self.time_limit)
+        self.simulation_max_output = options.get('simulation_max_output', DEFAULT_MAX_OUTPUT_SIZE)
+        self.output_head_size = options.get('output_head_size', DEFAULT_HEAD_SIZE)
+        self.output_tail_size = options.get('output_tail_size', DEFAULT_TAIL_SIZE)
+        # Test cases simulated at once. The container has the CPU and memory limits of a single
+        # submission, so they are graded one after the other unless the task raises it
+        self.grading_workers = options.get('grading_workers', 1)
+        # Replaces the factory of the language, e.g. by a fake simulator in the tests of a regrade
+        self.project_factory = options.get('project_factory', None)
+        self.record_metrics = options.get('record_metrics', True)
+        self.metrics_log = options.get('metrics_log', os.environ.get('UNCODE_HDL_METRICS_LOG'))
+        self.archive_extensions = tuple(options.get('archive_extensions', SOURCE_EXTENSIONS))
+        self.archive_max_files = options.get('archive_max_files', DEFAULT_MAX_FILES)
+        self.archive_max_size = options.get('archive_max_size', DEFAULT_MAX_SIZE)
+        self.project_pool = None
+        if options.get('project_pool', False):
+            self.project_pool = ProjectDirectoryPool(options.get('project_pool_dir', DEFAULT_POOL_DIR),
+                                                     options.get('project_pool_size', None))
+        self.golden_cache = None
+        # Each submission is graded in a new container, so the cache is only useful in a persistent directory
+        if options.get('cache_golden_output', 'golden_cache_dir' in options or PERSISTENT_CACHE_DIR is not None):
+            self.golden_cache = GoldenOutputCache(options.get('golden_cache_dir', DEFAULT_CACHE_DIR),
+                                                  options.get('golden_cache_max_size', DEFAULT_MAX_CACHE_SIZE))
+        self.result_cache = None
+        if options.get('cache_results', 'result_cache_dir' in options or PERSISTENT_CACHE_DIR is not None):
+            self.result_cache = ResultCache(options.get('result_cache_dir', os.path.join(DEFAULT_CACHE_DIR, 'results')),
+                                            options.get('result_cache_max_size', DEFAULT_MAX_CACHE_SIZE),
+                                            options.get('result_cache_ttl', DEFAULT_RESULT_TTL))
+        self.options_key = _options_key(options)
+        self.teacher_library_cache = None
+        if options.get('precompile_teacher_units', False):
+            self.teacher_library_cache = DirectoryCache(
+                options.get('teacher_library_dir', os.path.join(DEFAULT_CACHE_DIR, 'libraries')),
+                options.get('teacher_library_max_size', DEFAULT_MAX_CACHE_SIZE),
+                options.get('teacher_library_grace_period', DEFAULT_GRACE_PERIOD))
 
-    def create_project(self, testbench_file_name, golden_file_name):
+    def task_files(self, testbench_file_name, golden_file_name):
         """
-        Creates a project (VHDL or Verilog) to test the code
+        Returns the task files of the project as a dict: name in the project directory -> path
+        of the file.
+        """
+        language_name = self.submission_request.language_name
+        extension = ".v" if language_name == 'verilog' else ".vhd"
+        if self.submission_request.problem_type == 'code_multiple_languages':
+            return {"testbench" + extension: testbench_file_name, "golden_model" + extension: golden_file_name}
+        if language_name == 'verilog':
+            # The name must not collide with the files of the student
+            return {"tmp_testbench.v": testbench_file_name}
+        return {os.path.basename(testbench_file_name): testbench_file_name}
+
+    def create_project(self, testbench_file_name, golden_file_name, project_directory=None):
+        """
+        Creates a project (VHDL or Verilog) to test the code. The project is created in
+        project_directory, or in a new temporary directory when it is None. The task files
+        already in project_directory (e.g. placed by the project directory pool) are not
+        copied again.
+
+        For code_file_multiple_languages, only the HDL sources (archive_extensions) of the
+        uploaded zip file are extracted, up to archive_max_files files and archive_max_size
+        bytes. ArchiveError is raised when the upload exceeds them.
         """
         # Create factory project
         language_name = self.submission_request.language_name
-        project_factory = projects.get_factory_from_name(language_name)
 
         # Create directory
-        project_directory = tempfile.mkdtemp(dir=projects.CODE_WORKING_DIR)
+        if project_directory is None:
+            project_directory = tempfile.mkdtemp(dir=projects.CODE_WORKING_DIR)
+
+        # Add the testbench and the golden model
+        for name, task_file_name in self.task_files(testbench_file_name, golden_file_name).items():
+            task_temp_name = os.path.join(project_directory, name)
+            if not os.path.exists(task_temp_name):
+                copyfile(task_file_name, task_temp_name)
 
         if self.submission_request.problem_type == 'code_multiple_languages':
             # Define the names of the 3 files
             file_names = {"students_code": "design", "testbench": "testbench", "teachers_code": "golden_model"}
             if language_name == 'verilog':
                 code_file_name = os.path.join(project_directory, file_names["students_code"] + ".v")
-                testbench_temp_name = os.path.join(project_directory, file_names["testbench"] + ".v")
-                golden_temp_name = os.path.join(project_directory, file_names["teachers_code"] + ".v")
             elif language_name == 'vhdl':
                 code_file_name = os.path.join(project_directory, file_names["students_code"] + ".vhd")
-                testbench_temp_name = os.path.join(project_directory, file_names["testbench"] + ".vhd")
-                golden_temp_name = os.path.join(project_directory, file_names["teachers_code"] + ".vhd")
 
             with open(code_file_name, "w+") as code_file:
                 code_file.write(self.submission_request.code)
-                copyfile(testbench_file_name, testbench_temp_name)
-                copyfile(golden_file_name, golden_temp_name)
 
+            if self._uses_split_projects():
+                # The simulation of the golden model can be skipped when its output is cached
+                return create_split_project(language_name, project_directory, file_names, self.entity_name,
+                                            self.time_limit, self.simulation_max_output)
             if language_name == 'verilog':
-                return project_factory.create_from_directory(project_directory, file_names)
+                return self._project_factory().create_from_directory(project_directory, file_names)
             elif language_name == 'vhdl':
-                return project_factory.create_from_directory(project_directory, self.entity_name, file_names)
+                return self._project_factory().create_from_directory(project_directory, self.entity_name, file_names)
 
         if self.submission_request.problem_type == 'code_file_multiple_languages':
-            project_directory = tempfile.mkdtemp(dir=projects.CODE_WORKING_DIR)
-
-            # Add source code to zip file
-            with open(project_directory + ".zip", "wb") as project_file:
-                project_file.write(self.submission_request.code)
-
-            # Unzip all the files on the project directory
-            with ZipFile(project_directory + ".zip") as project_file:
-                project_file.extractall(path=project_directory)
+            # Unzip the sources on the project directory, straight from the submitted bytes.
+            # The files of the student named as a task file are skipped.
+            extract_sources(self.submission_request.code, project_directory, self.archive_extensions,
+                            self.archive_max_files, self.archive_max_size)
 
             if language_name == 'verilog':
-                # Add the testbench
-                testbench_temp_name = tempfile.mkstemp(suffix=".v", dir=project_directory)[1]
-                copyfile(testbench_file_name, testbench_temp_name)
-                return project_factory.create_from_directory(project_directory)
+                return self._project_factory().create_from_directory(project_directory)
             elif language_name == 'vhdl':
-                testbench_temp_name = os.path.join(project_directory, testbench_file_name)
-                copyfile(testbench_file_name, testbench_temp_name)
-                return project_factory.create_from_directory(project_directory, self.entity_name)
+                return self._project_factory().create_from_directory(project_directory, self.entity_name)
+
+    def _project_factory(self):
+        """ The factory of the projects of the container for the language, unless project_factory is given """
+        return self.project_factory or projects.get_factory_from_name(self.submission_request.language_name)
 
-    def grade(self, testbench_file_name, expected_output_name):
+    def _uses_split_projects(self):
+        """ Whether the projects must simulate the student's design apart (see hdl_projects.py) """
+        return self.project_factory is None and (self.golden_cache is not None or
+                                                 self.teacher_library_cache is not None)
+
+    def grade(self, testbench_file_name, expected_output_name=None):
         """
         Creates, Runs ands Test the code from the user. Finally setting the feedback
         variables.
+
+        testbench_file_name can also be a list of (testbench, golden model) pairs, one per
+        test case. Test cases are graded on up to grading_workers processes (one by default)
+        and the grade is the percentage of accepted test cases.
+
+        The wall and CPU time of each phase (create_project, build, run, check_output, diff,
+        waveform, serialization) are stored in debug_info["metrics"] of every submission, and
+        appended to the metrics_log file when it is set. They are only shown to the staff.
+
+        When the result cache is enabled (by default, only with a persistent cache directory: see
+        hdl_cache), the feedback of an identical submission (same code, task files, language and
+        options) graded in the last result_cache_ttl seconds is set again without building the project.
+
+        Returns:
+            The feedback_info dict passed to publish_feedback.
         """
+        if expected_output_name is None:
+            test_cases = [tuple(test_case) for test_case in testbench_file_name]
+        else:
+            test_cases = [(testbench_file_name, expected_output_name)]
 
+        timer = PhaseTimer()
+        grading_start = time.perf_counter()
+        result_key = None
+        if self.result_cache is not None:
+            result_key = self.result_cache.key_for(
+                self.submission_request.code, [file_name for test_case in test_cases for file_name in test_case],
+                self.submission_request.problem_type, self.submission_request.language_name,
+                self.submission_request.is_staff, self.options_key)
+            cached_feedback = self.result_cache.get_result(result_key)
+            if cached_feedback is not None:
+                self.publish_feedback(cached_feedback)
+                self._append_metrics(test_cases, cached_feedback, grading_start, timer, cached=True)
+                return cached_feedback
         debug_info = {'files_feedback': {}}
-        # Create the project
-        project = self.create_project(testbench_file_name, expected_output_name)
-        # Run the project
-        try:
-            project.build()
-        except projects.BuildError as e:
-            debug_info["compilation_output"] = e.compilation_output
+        # Create, build and run a project per test case
+        test_results = self.grade_test_cases(test_cases)
+        for test_result in test_results:
+            timer.extend(test_result.get("metrics", []))
+        compilation_outputs = [test_result["compilation_output"] for test_result in test_results
+                               if "compilation_output" in test_result]
+        if compilation_outputs:
+            # The student's design is the same for every test case, report the first error
+            debug_info["compilation_output"] = compilation_outputs[0]
 
         if "compilation_output" in debug_info:
             feedback_info = {'global': {}, 'custom': {}}
@@ -100,21 +223,34 @@ class HDLGrader(BaseGrader):
             compilation_output = debug_info.get("compilation_output", "")
             feedback_str = gutils.feedback_str_for_compilation_error(compilation_output,"hdl",self.response_type)
         else:
-            results = project.run(None)
             res_type = self.response_type
-            result, debug_info['files_feedback'][testbench_file_name], feedback_info = self._construct_feedback(results)
-            test_cases = (testbench_file_name, expected_output_name)
+            results = []
+            for i, test_result in enumerate(test_results):
+                # By index, several test cases may share a testbench
+                debug_info['files_feedback'][str(i)] = test_result["debug_info"]
+                results.append(test_result["result"])
+
+            accepted_count = results.count(GraderResult.ACCEPTED)
+            feedback_info = {'global': {}, 'custom': {}}
+            feedback_info['global']['result'] = "success" if results and accepted_count == len(results) else "failed"
+            feedback_info['grade'] = 100.0 * accepted_count / len(results) if results else 0.0
+            if self.record_metrics:
+                # Recorded for every submission, only shown to the staff (see ParsableText.from_json).
+                # The serialization of the feedback is only recorded in the metrics log
+                debug_info["metrics"] = {"phases": summarize_phases(timer.phases),
+                                         "wall": time.perf_counter() - grading_start}
             #Saving feedback as json  
             if res_type == 'json':
                 feedback_list_json = []
-                #for the test case we save the info for the html templates on the frontend
-                feedback_obj = {
-                    "i":0,
-                    "result": result,
-                    "test_case": test_cases,
-                    "input_sample": get_input_sample(test_cases)
-                }
-                feedback_list_json.append(feedback_obj)
+                #for each test case we save the info for the html templates on the frontend
+                for i, (test_case, result) in enumerate(zip(test_cases, results)):
+                    feedback_obj = {
+                        "i": i,
+                        "result": result,
+                        "test_case": test_case,
+                        "input_sample": get_input_sample(test_case)
+                    }
+                    feedback_list_json.append(feedback_obj)
                 # We save the container's options required for the feedback
                 options_for_feedback = self.diff_tool.get_options_dict()
                 options_for_feedback["container_type"] = "hdl"
@@ -124,28 +260,241 @@ class HDLGrader(BaseGrader):
                 feedback_list_json.append(debug_info)
                 # Converting the list to a json format string
                 # The json object always have this structure on hdl
-                # [ feedback_obj_test_case , options_for_feedback , debug_info ]
-                feedback_str_json = json.dumps(feedback_list_json)
-                feedback_str = feedback_str_json
+                # [ feedback_obj_test_case_0, ..., feedback_obj_test_case_n , options_for_feedback , debug_info ]
+                with timer.phase("serialization") as phase:
+                    feedback_str_json = json.dumps(feedback_list_json)
+                    phase["json_bytes"] = len(feedback_str_json)
+                    # Compressed in a versioned envelope, decoded by ParsableText
+                    feedback_str = encode_feedback(feedback_str_json, self.feedback_compression)
+                    phase["feedback_bytes"] = len(feedback_str)
             #Saving feedback as rst
-            elif res_type == 'rst':                
-                feedback_str = self.diff_tool.hdl_to_html_block(0, result, test_cases, debug_info, self.submission_request.is_staff)
+            elif res_type == 'rst':
+                with timer.phase("serialization") as phase:
+                    feedback_str = '\n\n'.join(
+                        self.diff_tool.hdl_to_html_block(i, result, test_case, debug_info, self.submission_request.is_staff)
+                        for i, (test_case, result) in enumerate(zip(test_cases, results)))
+                    phase["feedback_bytes"] = len(feedback_str)
 
         feedback_info['global']['feedback'] = feedback_str
-        set_feedback(feedback_info)
+        self.publish_feedback(feedback_info)
+        if result_key is not None and _is_reproducible(test_results):
+            self.result_cache.set_result(result_key, feedback_info)
+        self._append_metrics(test_cases, feedback_info, grading_start, timer,
+                             compilation_error="compilation_output" in debug_info)
         # Return the grade and feedback of the code
+        return feedback_info
+
+    def publish_feedback(self, feedback_info):
+        """ Sets the feedback variables of the submission """
+        set_feedback(feedback_info)
+
+    def _append_metrics(self, test_cases, feedback_info, grading_start, timer, compilation_error=False,
+                        cached=False):
+        """ Appends the metrics of the grading to the metrics_log file, when it is set """
+        if not self.record_metrics or not self.metrics_log:
+            return
+        append_metrics(self.metrics_log, {
+            "timestamp": time.time(),
+            "problem_id": self.submission_request.problem_id,
+            "language": self.submission_request.language_name,
+            "test_cases": len(test_cases),
+            "grade": feedback_info['grade'],
+            "compilation_error": compilation_error,
+            "cached": cached,
+            "wall": time.perf_counter() - grading_start,
+            "phases": summarize_phases(timer.phases),
+        })
+
+    def grade_test_cases(self, test_cases):
+        """
+        Grades every test case, using a bounded pool of processes when there are several.
+
+        Returns:
+            A list with the result of grade_test_case for each test case, in order.
+        """
+        workers = min(self.grading_workers, len(test_cases))
+        if workers <= 1 or not _is_picklable(self):
+            return [self.grade_test_case(test_case) for test_case in test_cases]
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(_grade_test_case, [self] * len(test_cases), test_cases))
+
+    def grade_test_case(self, test_case):
+        """
+        Creates, builds and runs the project for a single (testbench, golden model) pair.
+
+        Returns:
+            A dict with the compilation_output when the build fails, otherwise with the
+            result and the debug_info of the test case.
+        """
+        testbench_file_name, golden_file_name = test_case
+        timer = PhaseTimer()
+        project_directory = None
+        if self.project_pool is not None:
+            project_directory = self.project_pool.acquire(self.task_files(testbench_file_name, golden_file_name))
+        if project_directory is not None:
+            try:
+                return self._grade_project(testbench_file_name, golden_file_name, project_directory, timer)
+            finally:
+                self.project_pool.release(project_directory)
 
-    def _construct_feedback(self, results):
+        # The pool is disabled or every directory is in use.
+        # The project directory is removed once the simulations ended
+        project_directory = tempfile.mkdtemp(dir=projects.CODE_WORKING_DIR)
+        try:
+            return self._grade_project(testbench_file_name, golden_file_name, project_directory, timer)
+        finally:
+            shutil.rmtree(project_directory, ignore_errors=True)
+
+    def _grade_project(self, testbench_file_name, golden_file_name, project_directory, timer):
+        try:
+            with timer.phase("create_project"):
+                project = self.create_project(testbench_file_name, golden_file_name, project_directory)
+        except ArchiveError as e:
+            # The upload is reported as a compilation error of the student's design
+            return {"compilation_output": str(e), "metrics": timer.phases}
+        golden_key = self._golden_cache_key(project, testbench_file_name, golden_file_name)
+        stdout_golden = self.golden_cache.get(golden_key) if golden_key is not None else None
+        try:
+            with timer.phase("build"):
+                self.build_project(project, testbench_file_name, golden_file_name,
+                                   design_only=stdout_golden is not None)
+        except projects.BuildError as e:
+            return {"compilation_output": e.compilation_output, "metrics": timer.phases}
+        except subprocess.TimeoutExpired:
+            return self._limit_result(GraderResult.TIME_LIMIT_EXCEEDED, "Compilation time limit exceeded", timer)
+        except OutputLimitExceeded as e:
+            return self._limit_result(GraderResult.OUTPUT_LIMIT_EXCEEDED, str(e), timer)
+
+        run_info = {}
+        try:
+            with timer.phase("run") as phase:
+                results = self.run_project(project, golden_key, stdout_golden, run_info)
+                phase["golden_bytes"] = len(results[0])
+                phase["stdout_bytes"] = len(results[1][1])
+                phase["stderr_bytes"] = len(results[1][2])
+        except subprocess.TimeoutExpired:
+            return self._limit_result(GraderResult.TIME_LIMIT_EXCEEDED, "Simulation time limit exceeded", timer)
+        except OutputLimitExceeded as e:
+            return self._limit_result(GraderResult.OUTPUT_LIMIT_EXCEEDED, str(e), timer)
+        result, debug_info, _feedback_info = self._construct_feedback(results, timer)
+        stream_report = run_info.get("stream")
+        if stream_report is not None:
+            # Record where the simulation was stopped
+            debug_info["stream"] = stream_report
+            if stream_report["stopped_reason"] == STOPPED_BY_BYTES:
+                result = GraderResult.OUTPUT_LIMIT_EXCEEDED
+            elif stream_report["stopped_reason"] == STOPPED_BY_TIMEOUT:
+                result = GraderResult.TIME_LIMIT_EXCEEDED
+        return {"result": result, "debug_info": debug_info, "metrics": timer.phases}
+
+    def _limit_result(self, result, message, timer):
+        """ Result of a test case whose compilation or simulation was killed by a limit of hdl_projects """
+        debug_info = {"input_file": "", "stdout": "", "stderr": html.escape(message), "return_code": None,
+                      "diff": None}
+        return {"result": result, "debug_info": debug_info, "metrics": timer.phases}
+
+    def _golden_cache_key(self, project, testbench_file_name, golden_file_name):
+        """
+        Returns the key of the golden output of the project, or None when it is not cached: the
+        golden_cache option is disabled, or the project can not simulate the golden model and the
+        student's design apart (the projects of the container, used for code_file_multiple_languages).
+        """
+        if self.golden_cache is None or getattr(project, "run_design", None) is None or \
+                getattr(project, "run_golden", None) is None:
+            return None
+        return self.golden_cache.key_for(testbench_file_name, golden_file_name,
+                                         self.submission_request.language_name, self.entity_name)
+
+    def build_project(self, project, testbench_file_name, golden_file_name, design_only=False):
+        """
+        Builds the project. When precompile_teacher_units is enabled and the project supports it
+        (the projects of hdl_projects.py, used for code_multiple_languages), the simulation of the
+        golden model is compiled once per version of the task files into a cached library, and only
+        the student's design is compiled and elaborated.
+
+        With design_only (the golden output is cached) only the simulation of the student's design
+        is built, if the project supports it.
+        """
+        build_design = getattr(project, "build_design", None)
+        if design_only and build_design is not None:
+            build_design()
+            return
+
+        build_library = getattr(project, "build_library", None)
+        build_with_library = getattr(project, "build_with_library", None)
+        if self.teacher_library_cache is None or build_library is None or build_with_library is None:
+            project.build()
+            return
+
+        library_key = hash_files([testbench_file_name, golden_file_name],
+                                 self.submission_request.language_name, self.entity_name)
+        library_dir = self.teacher_library_cache.get_or_create(library_key, build_library)
+        build_with_library(library_dir)
+
+    def run_project(self, project, golden_key=None, stdout_golden=None, run_info=None):
+        """
+        Runs the simulations of the project. The output of the golden model only depends
+        on the task files, so when it is cached (stdout_golden) only the student's design is
+        simulated. Otherwise both are simulated and the golden output is stored under
+        golden_key, if it is given (see _golden_cache_key) and the golden simulation succeeded.
+
+        With streaming_comparison, the student's simulation is compared line by line with
+        the cached golden output while it runs, and it is stopped once stream_max_mismatches
+        different lines or stream_max_bytes of output are reached, or after stream_timeout
+        seconds (the time_limit by default). The report of the
+        comparison is stored in run_info["stream"].
+        """
+        if golden_key is None:
+            return project.run(None)
+
+        design_command = getattr(project, "design_command", None)
+        if stdout_golden is not None and self.streaming_comparison and design_command is not None:
+            args, cwd = design_command(None)
+            comparator = StreamingComparator(stdout_golden, self.stream_max_mismatches, self.stream_max_bytes)
+            result_evaluation = run_streaming(args, cwd, comparator, self.stream_timeout,
+                                              BoundedOutput(self.output_head_size, self.output_tail_size))
+            if run_info is not None:
+                run_info["stream"] = comparator.report()
+            return stdout_golden, result_evaluation
+
+        if stdout_golden is not None:
+            return stdout_golden, project.run_design(None)
+
+        return_code_golden, stdout_golden, _stderr_golden = project.run_golden(None)
+        result_evaluation = project.run_design(None)
+        # A failed simulation of the golden model is not kept as the expected output of the task
+        if return_code_golden == 0:
+            self.golden_cache.set(golden_key, stdout_golden)
+        return stdout_golden, result_evaluation
+
+    def _construct_feedback(self, results, timer=None):
         # results contains the std output of the simulation of the golden model which is the expected output,
         # and the return_code, stdout and stderr of the simulation of the code in evaluation
         stdout_golden, result_evaluation = results
         return_code, stdout, stderr = result_evaluation
+        timer = timer if timer is not None else PhaseTimer()
 
         feedback_info = {'global': {}, 'custom': {}}
         result = GraderResult.WRONG_ANSWER
+        trace_comparison = None
+        expected_trace = actual_trace = None
+        if self.compare_traces or (self.generate_diff and self.waveform):
+            # Unless the traces are compared, only the first waveform_max_rows rows are parsed, so
+            # the time and memory used by the waveform of long outputs are bounded
+            max_rows = None if self.compare_traces else self.waveform_max_rows + 1
+            with timer.phase("parse_traces"):
+                expected_trace = parse_trace(stdout_golden, max_rows)
+                actual_trace = parse_trace(stdout, max_rows)
         if return_code == 0:
             expected_output = stdout_golden
-            correct = self.check_output(stdout, expected_output)
+            with timer.phase("check_output"):
+                if self.compare_traces and len(expected_trace):
+                    trace_comparison = compare_traces(expected_trace, actual_trace, self.unknown_as_wildcard)
+                if trace_comparison is not None:
+                    correct = trace_comparison.equal
+                else:
+                    correct = self.check_output(stdout, expected_output)
             feedback_info['global']['result'] = "success" if correct else "failed"
             feedback_info['grade'] = 100.0 if correct else 0.0
             if correct:
@@ -156,19 +505,61 @@ class HDLGrader(BaseGrader):
         diff = None
         if self.generate_diff:
             expected_output = stdout_golden
-            diff = self.diff_tool.compute(stdout, expected_output)
+            with timer.phase("diff") as phase:
+                diff = self.diff_tool.compute(stdout, expected_output)
+                phase["diff_bytes"] = len(diff)
 
+        # The outputs were compared in full, only their beginning and end are stored (escaped once)
         debug_info.update({
             "input_file": "",
-            "stdout": html.escape(stdout),
-            "stderr": html.escape(stderr),
+            "stdout": html.escape(bound_output(stdout, self.output_head_size, self.output_tail_size)),
+            "stderr": html.escape(bound_output(stderr, self.output_head_size, self.output_tail_size)),
             "return_code": return_code,
             "diff": None if diff is None else html.escape(diff),
         })
+        if trace_comparison is not None:
+            debug_info["trace_summary"] = trace_comparison.to_dict()
+        if (result != GraderResult.ACCEPTED and diff is not None and expected_trace is not None
+                and len(expected_trace)):
+            # Precomputed waveform for the feedback viewer, around the first difference
+            with timer.phase("waveform"):
+                debug_info["waveform"] = waveform_payload(expected_trace, actual_trace, self.waveform_max_changes,
+                                                          self.waveform_context_rows)
         return result, debug_info, feedback_info
 
 
-def handle_problem_action(problem_id, testbench, output, options=None):
+def _grade_test_case(grader, test_case):
+    return grader.grade_test_case(test_case)
+
+
+def _options_key(options):
+    """ Returns a stable text representation of the grader options, used in the result cache key """
+    def describe(value):
+        # Functions (e.g. check_output) are represented by their name
+        return getattr(value, "__module__", "") + "." + getattr(value, "__qualname__", type(value).__name__)
+    return json.dumps(options, sort_keys=True, default=describe)
+
+
+def _is_reproducible(test_results):
+    """ Whether grading the same submission again gives the same results (no time or memory limits) """
+    unstable_results = (GraderResult.TIME_LIMIT_EXCEEDED, GraderResult.MEMORY_LIMIT_EXCEEDED,
+                        GraderResult.INTERNAL_ERROR)
+    return all(test_result.get("result") not in unstable_results for test_result in test_results)
+
+
+def _is_picklable(obj):
+    try:
+        pickle.dumps(obj)
+    except (pickle.PicklingError, AttributeError, TypeError):
+        return False
+    return True
+
+
+def handle_problem_action(problem_id, testbench, output=None, options=None):
+    """
+    Grades the submission of the problem. testbench can be a single testbench file, with output
+    being its golden model, or a list of (testbench, golden model) pairs.
+    """
     sub_req = SubmissionRequest(problem_id)
     grader = HDLGrader(sub_req, options)
     grader.grade(testbench, output)
@@ -179,4 +570,13 @@ class DiffWaveDrom(Diff):
         html_block = self.to_html_block(test_id, result, test_case, debug_info, is_staff)
         if html_block.find("updateDiffBlock") != -1:
             html_block = html_block.replace("updateDiffBlock", "updateWaveDromBlock")
+            # Pass the precomputed waveform, if any, as the last argument
+            waveform = get_file_feedback(debug_info, test_id, test_case[0]).get("waveform", None)
+            if waveform is not None:
+                html_block = html_block.replace("`);</script>", "`, " + waveform_to_js(waveform) + ");</script>", 1)
         return html_block
+
+
+def waveform_to_js(waveform):
+    """ Serializes the waveform payload to be embedded in a script tag. """
+    return json.dumps(waveform, separators=(',', ':')).replace("</", "<\\/")
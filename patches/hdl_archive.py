@@ -0,0 +1,101 @@
+"""
+This module contains the extraction of the zip files uploaded in the
+code_file_multiple_languages tasks.
+
+The archive is read from the submitted bytes, without writing it to disk, and
+only the HDL sources and the data files read by the simulations ($readmemh,
+$readmemb, textio) are extracted; other files are skipped. The number of files and the uncompressed
+size are checked while the members are copied, so the sizes declared in the
+archive do not need to be trusted.
+
+Tools:
+    - extract_sources: Extracts the HDL sources and data files of an archive to a directory.
+    - ArchiveError: Raised when the archive is not valid or exceeds the limits.
+"""
+
+import io
+import os
+import posixpath
+import zipfile
+import zlib
+
+HDL_EXTENSIONS = (".v", ".vh", ".sv", ".svh", ".vhd", ".vhdl")
+#  Memory initialization and test vector files read by the designs and testbenches
+DATA_EXTENSIONS = (".mem", ".hex", ".bin", ".txt", ".dat", ".mif", ".coe", ".csv")
+SOURCE_EXTENSIONS = HDL_EXTENSIONS + DATA_EXTENSIONS
+DEFAULT_MAX_FILES = 100
+#  8 MBs will be the default max uncompressed size of an archive
+DEFAULT_MAX_SIZE = (2 ** 20) * 8
+
+_CHUNK_SIZE = 2 ** 16
+
+
+class ArchiveError(Exception):
+    """ The uploaded archive can not be extracted. The message is shown to the student. """
+
+
+def _member_path(name):
+    """ Returns the relative path where the member is extracted, None if it is not safe """
+    path = posixpath.normpath(name.replace("\\", "/"))
+    if path.startswith(("/", "../")) or path in (".", "..") or ":" in path:
+        return None
+    return path
+
+
+def extract_sources(data, directory, extensions=SOURCE_EXTENSIONS, max_files=DEFAULT_MAX_FILES,
+                    max_size=DEFAULT_MAX_SIZE):
+    """
+    Extracts the sources of a zip archive to a directory.
+
+    Args:
+        - data (bytes): The content of the zip file.
+        - directory (str): Existing directory where the sources are extracted.
+        - extensions (tuple): Extensions (lower case) of the extracted files, the rest are skipped.
+        - max_files (int): Max number of extracted files.
+        - max_size (int): Max total uncompressed size, in bytes, of the extracted files.
+
+    Returns:
+        The list of relative paths of the extracted files.
+
+    Raises:
+        ArchiveError: If the data is not a zip file, or a limit is exceeded.
+    """
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(data))
+    except (zipfile.BadZipFile, zipfile.LargeZipFile, ValueError):
+        raise ArchiveError("The uploaded file is not a valid zip file.")
+
+    extracted = []
+    remaining = max_size
+    with archive:
+        for member in archive.infolist():
+            if member.filename.endswith("/") or not member.filename.lower().endswith(extensions):
+                continue
+            path = _member_path(member.filename)
+            if path is None:
+                continue
+            if len(extracted) >= max_files:
+                raise ArchiveError("The uploaded file contains more than {} source files.".format(max_files))
+            if member.file_size > remaining:
+                raise ArchiveError("The sources of the uploaded file exceed {} KB.".format(max_size // 2 ** 10))
+
+            target = os.path.join(directory, path)
+            if os.path.lexists(target):
+                # The files already in the directory (the task files) take precedence
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            try:
+                with archive.open(member) as source, open(target, "wb") as target_file:
+                    while True:
+                        chunk = source.read(min(_CHUNK_SIZE, remaining + 1))
+                        if not chunk:
+                            break
+                        remaining -= len(chunk)
+                        if remaining < 0:
+                            raise ArchiveError(
+                                "The sources of the uploaded file exceed {} KB.".format(max_size // 2 ** 10))
+                        target_file.write(chunk)
+            except (zipfile.BadZipFile, zlib.error, NotImplementedError, RuntimeError, EOFError):
+                raise ArchiveError("The file {} of the uploaded zip file can not be extracted.".format(path))
+            extracted.append(path)
+    return extracted
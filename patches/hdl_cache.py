@@ -0,0 +1,339 @@
+"""
+This module contains the persistent caches used by the HDL grader.
+
+Caches:
+    - FileCache: Size-bounded, content-addressed cache stored on disk.
+    - GoldenOutputCache: Output of the golden model simulation of a task.
+    - DirectoryCache: Size-bounded cache of directories (e.g. compiled libraries).
+    - ResultCache: Feedback of the gradings, reused for identical resubmissions.
+
+The cache directory may be shared between grading containers (e.g. a mounted
+volume, given by the UNCODE_HDL_CACHE_DIR environment variable), so every write
+is atomic and no in-memory state is required.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+#  Directory kept between gradings (e.g. a volume mounted in the grading containers). Each submission is
+#  graded in a new container, so the caches are only enabled by default when it is set
+PERSISTENT_CACHE_DIR = os.environ.get("UNCODE_HDL_CACHE_DIR")
+DEFAULT_CACHE_DIR = PERSISTENT_CACHE_DIR or os.path.join(tempfile.gettempdir(), "uncode_hdl_cache")
+#  256 MBs will be the default max size of each cache directory
+DEFAULT_MAX_CACHE_SIZE = (2 ** 20) * 256
+#  Results of the gradings expire after 1 hour by default
+DEFAULT_RESULT_TTL = 3600
+#  Directories used in the last 10 minutes will not be evicted by default, as a grading may still be reading them
+DEFAULT_GRACE_PERIOD = 600
+
+
+def hash_files(file_names, *extra):
+    """
+    Computes a digest of the content of the given files and of the extra values.
+
+    Args:
+        - file_names (list): Names of the files to hash, the order is relevant.
+        - extra: Additional values (language, entity name...) that are part of the key.
+
+    Returns:
+        The hexadecimal sha256 digest.
+    """
+    digest = hashlib.sha256()
+    for file_name in file_names:
+        with open(file_name, 'rb') as hashed_file:
+            for chunk in iter(lambda: hashed_file.read(2 ** 16), b''):
+                digest.update(chunk)
+        digest.update(b'\0')
+    for value in extra:
+        digest.update(str(value).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class FileCache:
+    """
+    A content-addressed cache stored as one file per entry.
+
+    The least recently used entries are evicted when the total size of the
+    cache exceeds max_size. Reads refresh the modification time of an entry,
+    which is used as the recency information.
+
+    Attributes:
+        - cache_dir (str): Directory where the entries are stored.
+        - max_size (int): Maximum number of bytes stored by the cache.
+    """
+
+    suffix = ".entry"
+
+    def __init__(self, cache_dir, max_size=DEFAULT_MAX_CACHE_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key + self.suffix)
+
+    def get(self, key):
+        """ Returns the text stored for key, or None when the entry does not exist. """
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, 'r') as entry_file:
+                value = entry_file.read()
+            os.utime(entry_path, None)
+        except OSError:
+            return None
+        return value
+
+    def set(self, key, value):
+        """ Stores the text value for key, evicting old entries if needed. """
+        file_descriptor, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(file_descriptor, 'w') as temp_file:
+                temp_file.write(value)
+            os.replace(temp_path, self._entry_path(key))
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+        self.evict()
+
+    def delete(self, key):
+        """ Removes the entry for key, if any. """
+        try:
+            os.remove(self._entry_path(key))
+        except OSError:
+            pass
+
+    def evict(self):
+        """ Removes the least recently used entries until the cache fits in max_size. """
+        entries = []
+        total_size = 0
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith(self.suffix):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total_size += stat.st_size
+
+        entries.sort()
+        for _mtime, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total_size -= size
+
+
+class GoldenOutputCache(FileCache):
+    """
+    Caches the stdout of the golden model simulation.
+
+    The key is a digest of the testbench and golden model content together with
+    the language and the entity name. Besides, the cache remembers the last key
+    used for each pair of task file names, so the entry of an outdated version of
+    the task files is removed as soon as a new version is graded.
+    """
+
+    suffix = ".golden"
+
+    def key_for(self, testbench_file_name, golden_file_name, language_name, entity_name):
+        """
+        Returns the cache key for the given task files and invalidates the entry
+        of their previous version.
+        """
+        key = hash_files([testbench_file_name, golden_file_name], language_name, entity_name)
+        slot = hash_files([], os.path.abspath(testbench_file_name), os.path.abspath(golden_file_name),
+                          language_name, entity_name)
+        slot_path = os.path.join(self.cache_dir, slot + ".slot")
+        try:
+            with open(slot_path, 'r') as slot_file:
+                previous_key = slot_file.read().strip()
+        except OSError:
+            previous_key = None
+
+        if previous_key != key:
+            if previous_key:
+                self.delete(previous_key)
+            try:
+                with open(slot_path, 'w') as slot_file:
+                    slot_file.write(key)
+            except OSError:
+                pass
+        return key
+
+
+class ResultCache(FileCache):
+    """
+    Caches the feedback of the gradings, so an identical resubmission is answered
+    without building and simulating it again.
+
+    The key is a digest of the student's code, the task files, the language and
+    the grader options. Entries expire ttl seconds after they were stored, even if
+    they are read meanwhile.
+
+    Attributes:
+        - ttl (int): Seconds after which an entry expires.
+    """
+
+    suffix = ".result"
+
+    def __init__(self, cache_dir, max_size=DEFAULT_MAX_CACHE_SIZE, ttl=DEFAULT_RESULT_TTL):
+        super(ResultCache, self).__init__(cache_dir, max_size)
+        self.ttl = ttl
+
+    def key_for(self, code, task_file_names, *extra):
+        """
+        Returns the cache key of a submission.
+
+        Args:
+            - code (str or bytes): The student's code, or the uploaded file.
+            - task_file_names (list): Names of the task files (testbenches, golden models).
+            - extra: Additional values (language, options...) that are part of the key.
+        """
+        if isinstance(code, str):
+            code = code.encode('utf-8')
+        return hash_files(task_file_names, hashlib.sha256(code).hexdigest(), *extra)
+
+    def get_result(self, key, now=None):
+        """ Returns the feedback (dict) stored for key, or None when it does not exist or expired. """
+        value = self.get(key)
+        if value is None:
+            return None
+        try:
+            entry = json.loads(value)
+        except ValueError:
+            entry = None
+        now = time.time() if now is None else now
+        if not isinstance(entry, dict) or now - entry.get("stored", 0) > self.ttl:
+            self.delete(key)
+            return None
+        return entry["feedback"]
+
+    def set_result(self, key, feedback_info):
+        """ Stores the feedback (dict, as passed to set_feedback) of a grading. """
+        self.set(key, json.dumps({"stored": time.time(), "feedback": feedback_info}))
+
+
+def _directory_size(path):
+    size = 0
+    for root, _dirs, files in os.walk(path):
+        for file_name in files:
+            try:
+                size += os.path.getsize(os.path.join(root, file_name))
+            except OSError:
+                pass
+    return size
+
+
+class DirectoryCache:
+    """
+    A cache of directories, each one created once by a builder function.
+
+    Used to keep the compiled teacher units (VHDL work library, Verilog objects)
+    of each version of the task files. Directories are built in a temporary
+    location and renamed into place, so concurrent graders never see partial
+    entries.
+
+    Other graders (containers sharing the cache directory) may be using an entry
+    while it is evicted, so entries used within the last grace_period seconds are
+    kept even if the cache exceeds max_size, and the rest are renamed out of place
+    before being removed.
+
+    Attributes:
+        - cache_dir (str): Directory where the entries are stored.
+        - max_size (int): Maximum number of bytes stored by the cache.
+        - grace_period (int): Seconds after its last use during which an entry is not evicted.
+    """
+
+    def __init__(self, cache_dir, max_size=DEFAULT_MAX_CACHE_SIZE, grace_period=DEFAULT_GRACE_PERIOD):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.grace_period = grace_period
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def get_or_create(self, key, builder):
+        """
+        Returns the directory stored for key, creating it with builder if needed. The entry
+        is marked as used, so it is not evicted during the grace period.
+
+        Args:
+            - key (str): The cache key.
+            - builder (callable): Function receiving the path of an empty directory to fill.
+        """
+        entry_path = os.path.join(self.cache_dir, key)
+        try:
+            os.utime(entry_path, None)
+            if os.path.isdir(entry_path):
+                return entry_path
+        except OSError:
+            pass
+
+        temp_path = tempfile.mkdtemp(dir=self.cache_dir, prefix=key + ".", suffix=".tmp")
+        try:
+            builder(temp_path)
+        except BaseException:
+            shutil.rmtree(temp_path, ignore_errors=True)
+            raise
+
+        try:
+            os.rename(temp_path, entry_path)
+        except OSError:
+            # Another grader stored the same entry meanwhile
+            shutil.rmtree(temp_path, ignore_errors=True)
+            try:
+                os.utime(entry_path, None)
+            except OSError:
+                pass
+
+        self.evict(keep=key)
+        return entry_path
+
+    def evict(self, keep=None, now=None):
+        """
+        Removes the least recently used directories until the cache fits in max_size.
+        Directories used within the grace period are never removed.
+        """
+        entries = []
+        total_size = 0
+        for entry in os.scandir(self.cache_dir):
+            if not entry.is_dir() or entry.name.endswith(".tmp"):
+                continue
+            try:
+                mtime = entry.stat().st_mtime
+            except OSError:
+                continue
+            size = _directory_size(entry.path)
+            entries.append((mtime, size, entry.name, entry.path))
+            total_size += size
+
+        now = time.time() if now is None else now
+        entries.sort()
+        for mtime, size, name, path in entries:
+            if total_size <= self.max_size or now - mtime < self.grace_period:
+                break
+            if name == keep:
+                continue
+            # Graders looking the entry up from now on build it again instead of reading a partial removal
+            removed_path = tempfile.mkdtemp(dir=self.cache_dir, prefix=name + ".", suffix=".evicted.tmp")
+            moved_path = os.path.join(removed_path, name)
+            try:
+                os.rename(path, moved_path)
+                # A grader may have used it between the scan and the rename
+                if now - os.stat(moved_path).st_mtime < self.grace_period:
+                    os.rename(moved_path, path)
+                    os.rmdir(removed_path)
+                    continue
+            except OSError:
+                shutil.rmtree(removed_path, ignore_errors=True)
+                continue
+            shutil.rmtree(removed_path, ignore_errors=True)
+            total_size -= size
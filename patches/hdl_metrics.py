@@ -0,0 +1,88 @@
+"""
+This module contains the instrumentation of the HDL grader: the wall and CPU
+time, and the output sizes, of each phase of a grading.
+
+The CPU time includes the time of the child processes (compilers, simulators)
+that ended during the phase.
+
+Tools:
+    - PhaseTimer: Records the phases of a grading.
+    - summarize_phases: Adds up the phases of several test cases.
+    - append_metrics: Appends a record to a metrics log, one json object per line.
+"""
+
+import contextlib
+import json
+import os
+import time
+
+
+def _cpu_time():
+    times = os.times()
+    return times[0] + times[1] + times[2] + times[3]
+
+
+class PhaseTimer:
+    """
+    Records the phases of a grading, in order.
+
+    Attributes:
+        - phases (list): One dict per phase with its name, wall and cpu time (seconds) and
+        the sizes recorded during the phase.
+    """
+
+    def __init__(self):
+        self.phases = []
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """
+        Times the code of a with block. The yielded dict is the record of the phase, sizes
+        (e.g. "stdout_bytes") can be added to it.
+        """
+        record = {"name": name}
+        wall_start, cpu_start = time.perf_counter(), _cpu_time()
+        try:
+            yield record
+        finally:
+            record["wall"] = time.perf_counter() - wall_start
+            record["cpu"] = _cpu_time() - cpu_start
+            self.phases.append(record)
+
+    def extend(self, phases):
+        """ Adds the phases recorded by another timer (e.g. in a worker process) """
+        self.phases.extend(phases)
+
+
+def summarize_phases(phases):
+    """
+    Adds up the times and sizes of the phases with the same name.
+
+    Returns:
+        A dict name -> {"count", "wall", "cpu", sizes...}, in order of first appearance.
+    """
+    summary = {}
+    for phase in phases:
+        total = summary.setdefault(phase["name"], {"count": 0})
+        total["count"] += 1
+        for key, value in phase.items():
+            if key != "name" and isinstance(value, (int, float)):
+                total[key] = total.get(key, 0) + value
+    return summary
+
+
+def append_metrics(log_file_name, record):
+    """
+    Appends the record, as one json line, to the metrics log. Each line is written with a
+    single call in append mode, so concurrent graders sharing the log do not mix their lines.
+    Errors writing the log are ignored, metrics must never fail a grading.
+    """
+    line = json.dumps(record, sort_keys=True, separators=(',', ':')) + "\n"
+    try:
+        log_file = os.open(log_file_name, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(log_file, line.encode("utf-8"))
+        finally:
+            os.close(log_file)
+    except OSError:
+        pass
@@ -0,0 +1,133 @@
+"""
+This module contains a pool of project directories, reused between gradings.
+
+The pool is meant to be placed on a tmpfs (e.g. /dev/shm), so the files of the
+projects never reach the disk. Each directory keeps the task files (testbench,
+golden model) of its last grading, as read-only copies. A grading of the same
+task only checks them, instead of copying them again. They are never hard links
+to the task files: a simulation writing to one of them (e.g. $fopen or
+$writememh on a data file of the testbench) would change the teacher's file for
+every later grading.
+
+Directories are locked with flock while they are in use, so the pool can be
+shared by the worker processes of a grader and by concurrent containers. The
+lock is released by the system if the process dies.
+
+Tools:
+    - ProjectDirectoryPool: Hands out and resets the project directories.
+"""
+
+import errno
+import fcntl
+import os
+import shutil
+
+DEFAULT_POOL_DIR = "/dev/shm/uncode-projects"
+
+
+def _matches(target, source, source_stat):
+    """ Whether target is an unmodified copy of source """
+    try:
+        target_stat = os.lstat(target)
+    except OSError:
+        return False
+    if (target_stat.st_dev, target_stat.st_ino) == (source_stat.st_dev, source_stat.st_ino):
+        # A link left by a previous version of the pool
+        return False
+    # Copies are made with copy2, which keeps the modification time. Writing to a copy changes it,
+    # even when the simulation runs as root and ignores the permissions
+    return (target_stat.st_size == source_stat.st_size and target_stat.st_mtime == source_stat.st_mtime
+            and not target_stat.st_mode & 0o222)
+
+
+def _remove(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class ProjectDirectoryPool:
+    """
+    A fixed number of project directories, handed out one per grading.
+
+    Attributes:
+        - pool_dir (str): Directory containing the project directories.
+        - size (int): Number of project directories.
+    """
+
+    def __init__(self, pool_dir=DEFAULT_POOL_DIR, size=None):
+        self.pool_dir = pool_dir
+        self.size = size if size is not None else 2 * (os.cpu_count() or 1)
+        self._locks = {}
+        for index in range(self.size):
+            os.makedirs(self._directory(index), exist_ok=True)
+
+    def __getstate__(self):
+        # The locks belong to the process that acquired them
+        state = self.__dict__.copy()
+        state["_locks"] = {}
+        return state
+
+    def _directory(self, index):
+        return os.path.join(self.pool_dir, "project-{}".format(index))
+
+    def acquire(self, task_files):
+        """
+        Locks a free project directory and prepares it for a grading.
+
+        Args:
+            - task_files (dict): Name in the project directory -> path of the task file it must contain.
+
+        Returns:
+            The path of the directory, containing only the task files, or None when every
+            directory is in use.
+        """
+        start = os.getpid() % self.size
+        for offset in range(self.size):
+            directory = self._directory((start + offset) % self.size)
+            lock_file = os.open(directory + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError as e:
+                os.close(lock_file)
+                if e.errno in (errno.EAGAIN, errno.EACCES):
+                    continue
+                raise
+            try:
+                self._prepare(directory, task_files)
+            except BaseException:
+                os.close(lock_file)
+                raise
+            self._locks[directory] = (lock_file, task_files)
+            return directory
+        return None
+
+    def release(self, directory):
+        """ Removes the files of the grading, keeping the task files for the next one, and unlocks the directory """
+        lock_file, task_files = self._locks.pop(directory, (None, ()))
+        try:
+            self._clean(directory, keep=task_files)
+        finally:
+            if lock_file is not None:
+                os.close(lock_file)
+
+    def _clean(self, directory, keep):
+        for entry in os.listdir(directory):
+            if entry not in keep:
+                _remove(os.path.join(directory, entry))
+
+    def _prepare(self, directory, task_files):
+        """ Leaves only the task files in the directory, copying the missing or modified ones """
+        self._clean(directory, keep=task_files)
+        for name, source in task_files.items():
+            target = os.path.join(directory, name)
+            source_stat = os.stat(source)
+            if _matches(target, source, source_stat):
+                continue
+            _remove(target)
+            shutil.copy2(source, target)
+            os.chmod(target, 0o444)
@@ -0,0 +1,256 @@
+"""
+This module contains the HDL projects used by HDLGrader when the simulation of the
+student's design is needed apart from the one of the golden model.
+
+The projects of the grading container (projects.get_factory_from_name) build and
+simulate the golden model and the student's design together, so the output of
+the golden model can not be taken from a cache. These projects build each
+simulation in its own subdirectory of the project directory (the golden model and
+the design declare the same modules), with the file names of the
+code_multiple_languages tasks (design, testbench and golden_model). Verilog is
+simulated with Icarus Verilog (iverilog, vvp) and VHDL with GHDL.
+
+Every command is killed after the time limit of the project (subprocess.TimeoutExpired
+is raised) or once its output exceeds max_output_size bytes (OutputLimitExceeded is
+raised). The outputs are decoded as UTF-8, replacing the invalid bytes.
+
+Besides build and run, as the projects of the container, they provide:
+    - build_design: Builds only the simulation of the student's design.
+    - run_golden: Simulates only the golden model.
+    - run_design: Simulates only the student's design.
+    - design_command: Command simulating only the student's design, to compare its output while it runs.
+    - build_library: Builds the simulation of the golden model (the teacher units) in a directory.
+    - build_with_library: Builds the project taking the golden model simulation from such a directory.
+
+Tools:
+    - create_split_project: Returns the project of a directory for a language.
+    - OutputLimitExceeded: Raised when the output of a command is too long.
+    - VerilogSplitProject: Project simulated with iverilog and vvp.
+    - VHDLSplitProject: Project simulated with ghdl.
+"""
+
+import os
+import subprocess
+import threading
+
+import projects
+
+GOLDEN = "golden"
+DESIGN = "design"
+
+#  Source (key of the file names) of the model of each simulation, besides the testbench
+_MODELS = {GOLDEN: "teachers_code", DESIGN: "students_code"}
+
+#  30 seconds will be the default time limit of each command
+DEFAULT_TIME_LIMIT = 30
+#  64 MBs will be the default limit of the stdout and of the stderr of each command
+DEFAULT_MAX_OUTPUT_SIZE = (2 ** 20) * 64
+
+
+class OutputLimitExceeded(Exception):
+    """ The output of a command exceeded max_output_size bytes, the command was killed """
+
+
+def _read_limited(stream, chunks, max_size, process, exceeded):
+    """ Reads a stream into chunks, killing the process once more than max_size bytes were read """
+    size = 0
+    for chunk in iter(lambda: stream.read(2 ** 16), b""):
+        size += len(chunk)
+        if max_size is not None and size > max_size:
+            exceeded.set()
+            process.kill()
+            return
+        chunks.append(chunk)
+
+
+def _run(args, cwd, input_file=None, timeout=None, max_output_size=None):
+    """
+    Runs a command, returning a tuple (return_code, stdout, stderr). The command is killed and
+    subprocess.TimeoutExpired raised after timeout seconds, and OutputLimitExceeded is raised when
+    its stdout or stderr exceed max_output_size bytes.
+    """
+    stdin = open(input_file, "rb") if input_file else subprocess.DEVNULL
+    try:
+        process = subprocess.Popen(args, cwd=cwd, stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    finally:
+        if input_file:
+            stdin.close()
+    exceeded = threading.Event()
+    outputs = ([], [])
+    readers = [threading.Thread(target=_read_limited, args=(stream, chunks, max_output_size, process, exceeded))
+               for stream, chunks in zip((process.stdout, process.stderr), outputs)]
+    for reader in readers:
+        reader.daemon = True
+        reader.start()
+    try:
+        return_code = process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+        raise
+    finally:
+        for reader in readers:
+            reader.join()
+        process.stdout.close()
+        process.stderr.close()
+    if exceeded.is_set():
+        raise OutputLimitExceeded("The output of {} exceeded {} bytes".format(args[0], max_output_size))
+    stdout, stderr = (b"".join(chunks).decode("utf-8", errors="replace") for chunks in outputs)
+    return return_code, stdout, stderr
+
+
+class SplitProject:
+    """
+    A project whose golden model and student's design are built and simulated apart.
+
+    Attributes:
+        - directory (str): The project directory, containing the sources.
+        - file_names (dict): Names (without extension) of the students_code, testbench and teachers_code.
+        - entity_name (str): Top level entity of the testbench (VHDL).
+        - time_limit (float): Seconds after which each command (compilation or simulation) is killed.
+        - max_output_size (int): Bytes of stdout or stderr after which each command is killed.
+    """
+
+    extension = None
+
+    def __init__(self, directory, file_names, entity_name=None, time_limit=DEFAULT_TIME_LIMIT,
+                 max_output_size=DEFAULT_MAX_OUTPUT_SIZE):
+        self.directory = directory
+        self.file_names = file_names
+        self.entity_name = entity_name
+        self.time_limit = time_limit
+        self.max_output_size = max_output_size
+        # Build directories outside the project (libraries built with build_library), by simulation
+        self._libraries = {}
+
+    def _run(self, args, input_file=None):
+        return _run(args, self.directory, input_file, self.time_limit, self.max_output_size)
+
+    def _source(self, key):
+        return self.file_names[key] + self.extension
+
+    def _sources(self, side):
+        """ Sources of a simulation, relative to the project directory """
+        return [self._source(_MODELS[side]), self._source("testbench")]
+
+    def _build_directory(self, side):
+        if side in self._libraries:
+            return self._libraries[side]
+        build_directory = os.path.join(self.directory, side + "_build")
+        os.makedirs(build_directory, exist_ok=True)
+        return build_directory
+
+    def _compile(self, side, build_directory):
+        """
+        Compiles a simulation into build_directory. Raises projects.BuildError with the output of the
+        compiler if it fails. The sources are given relative to the project directory, so the result
+        can be used by any project with the same task files.
+        """
+        raise NotImplementedError()
+
+    def _simulation_command(self, side):
+        """ Returns the command of a simulation, run in the project directory """
+        raise NotImplementedError()
+
+    def build(self):
+        """ Builds the simulations of the golden model and of the student's design """
+        self._compile(GOLDEN, self._build_directory(GOLDEN))
+        self._compile(DESIGN, self._build_directory(DESIGN))
+
+    def build_design(self):
+        """ Builds only the simulation of the student's design """
+        self._compile(DESIGN, self._build_directory(DESIGN))
+
+    def build_library(self, library_dir):
+        """ Builds the simulation of the golden model in library_dir, an empty directory """
+        self._compile(GOLDEN, library_dir)
+
+    def build_with_library(self, library_dir):
+        """ Builds the simulation of the student's design, the one of the golden model is taken from library_dir """
+        self._libraries[GOLDEN] = library_dir
+        self.build_design()
+
+    def run(self, input_file):
+        """
+        Simulates the golden model and the student's design.
+
+        Returns:
+            A tuple (golden stdout, (return_code, stdout, stderr)), as the projects of the container.
+        """
+        _return_code, stdout_golden, _stderr = self.run_golden(input_file)
+        return stdout_golden, self.run_design(input_file)
+
+    def run_golden(self, input_file):
+        """ Simulates only the golden model, returning a tuple (return_code, stdout, stderr) """
+        return self._run(self._simulation_command(GOLDEN), input_file)
+
+    def run_design(self, input_file):
+        """ Simulates only the student's design, returning a tuple (return_code, stdout, stderr) """
+        return self._run(self._simulation_command(DESIGN), input_file)
+
+    def design_command(self, input_file):
+        """
+        Returns a tuple (command, working directory) simulating only the student's design. The
+        command reads no input, so input_file must be None.
+        """
+        if input_file:
+            raise ValueError("The streamed simulation does not read an input file")
+        return self._simulation_command(DESIGN), self.directory
+
+
+class VerilogSplitProject(SplitProject):
+    """
+    Project simulated with Icarus Verilog, each simulation compiled to its own vvp file. Icarus
+    Verilog has no separate compilation, so the library of the teacher units is the compiled
+    simulation of the golden model, and the testbench is compiled again with the student's design.
+    """
+
+    extension = ".v"
+
+    def _compile(self, side, build_directory):
+        executable = os.path.join(build_directory, "simulation.vvp")
+        return_code, stdout, stderr = self._run(["iverilog", "-o", executable] + self._sources(side))
+        if return_code != 0:
+            raise projects.BuildError(stdout + stderr)
+
+    def _simulation_command(self, side):
+        return ["vvp", "-n", os.path.join(self._build_directory(side), "simulation.vvp")]
+
+
+class VHDLSplitProject(SplitProject):
+    """ Project simulated with GHDL, each simulation analyzed in its own work library """
+
+    extension = ".vhd"
+
+    def _compile(self, side, build_directory):
+        workdir_flag = "--workdir=" + build_directory
+        for command in (["ghdl", "-a", workdir_flag] + self._sources(side),
+                        ["ghdl", "-e", workdir_flag, self.entity_name]):
+            return_code, stdout, stderr = self._run(command)
+            if return_code != 0:
+                raise projects.BuildError(stdout + stderr)
+
+    def _simulation_command(self, side):
+        # Elaborated again before running: both simulations have the same top level entity, and the
+        # executable is written to the project directory
+        return ["ghdl", "--elab-run", "--workdir=" + self._build_directory(side), self.entity_name]
+
+
+def create_split_project(language_name, directory, file_names, entity_name, time_limit=DEFAULT_TIME_LIMIT,
+                         max_output_size=DEFAULT_MAX_OUTPUT_SIZE):
+    """
+    Returns the SplitProject of a project directory.
+
+    Args:
+        - language_name (str): 'verilog' or 'vhdl'.
+        - directory (str): The project directory, containing the sources.
+        - file_names (dict): Names (without extension) of the students_code, testbench and teachers_code.
+        - entity_name (str): Top level entity of the testbench (VHDL).
+        - time_limit (float): Seconds after which each command is killed.
+        - max_output_size (int): Bytes of stdout or stderr after which each command is killed.
+    """
+    if language_name == 'verilog':
+        return VerilogSplitProject(directory, file_names, None, time_limit, max_output_size)
+    if language_name == 'vhdl':
+        return VHDLSplitProject(directory, file_names, entity_name, time_limit, max_output_size)
+    raise ValueError("Unknown HDL language: " + str(language_name))
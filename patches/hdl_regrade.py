@@ -0,0 +1,469 @@
+"""
+This module regrades every submission of an HDL task, e.g. after its testbench
+was fixed, inside the grading container where the simulators are installed.
+
+The submissions are read from a store, graded on a pool of processes with
+HDLGrader and their grades and feedback are written back in batches. The first
+submission is graded alone, so the teacher units are compiled and the golden
+output is simulated once, and the rest of the gradings take them from the caches
+(cache_golden_output and precompile_teacher_units are enabled, in a temporary
+directory unless the options give one). This needs projects that build and
+simulate the student's design apart (hdl_projects.py, code_multiple_languages).
+
+Each submission is graded in its own process, killed (with the simulations it
+started) after submission_timeout seconds: the submission is reported as failed
+and the regrade goes on.
+
+The ids of the saved submissions are appended to a progress file, so an
+interrupted regrade continues where it stopped. Failed submissions are not
+recorded, so they are graded again when the regrade is resumed. With dry_run nothing is saved
+and only the changes of grade are reported.
+
+Stores:
+    - JsonSubmissionStore: Submissions in a json file, e.g. to test a regrade locally.
+    - MongoSubmissionStore: Submissions of the INGInious database.
+
+Usage:
+    python hdl_regrade.py --problem-id <id> --test-case <testbench> <golden model> [--test-case ...]
+                          (--submissions FILE | --mongo-uri URI --database NAME --course ID --task ID)
+                          [--problem-type TYPE] [--staff USERNAME ...] [--course-descriptor FILE]
+                          [--evaluate best|last|student] [--options FILE] [--workers N]
+                          [--submission-timeout SECONDS] [--batch-size N] [--progress FILE] [--dry-run]
+"""
+
+import argparse
+import base64
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+
+from graders import HDLGrader
+
+DEFAULT_BATCH_SIZE = 50
+#  10 minutes will be the default time limit of the grading of a submission
+DEFAULT_SUBMISSION_TIMEOUT = 600
+
+
+class StoredSubmissionRequest:
+    """
+    The submission request of a stored submission, with the attributes used by HDLGrader.
+
+    Attributes:
+        - problem_id (str): Id of the problem in the task.
+        - code (str or bytes): The student's code, or the uploaded zip file.
+        - language_name (str): 'verilog' or 'vhdl'.
+        - problem_type (str): 'code_multiple_languages' or 'code_file_multiple_languages'.
+        - is_staff (bool): Whether the submission was made by a member of the staff.
+    """
+
+    def __init__(self, problem_id, code, language_name, problem_type, is_staff=False):
+        self.problem_id = problem_id
+        self.code = code
+        self.language_name = language_name
+        self.problem_type = problem_type
+        self.is_staff = is_staff
+
+
+class RegradeGrader(HDLGrader):
+    """ HDLGrader that returns the feedback instead of setting the feedback variables """
+
+    def publish_feedback(self, feedback_info):
+        pass
+
+
+class JsonSubmissionStore:
+    """
+    Submissions stored in a json file as a list of objects with the keys id, problem_id,
+    language, code, grade and, optionally, problem_type, is_staff, result, text and custom.
+    Uploaded zip files are given, base64 encoded, as code_base64 instead of code. The results
+    are written back to the same objects.
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+
+    def _read(self):
+        with open(self.file_name, "r") as store_file:
+            return json.load(store_file)
+
+    def load_submissions(self):
+        submissions = self._read()
+        for submission in submissions:
+            if "code_base64" in submission:
+                submission["code"] = base64.b64decode(submission.pop("code_base64"))
+        return submissions
+
+    def save_results(self, results):
+        results_by_id = {result["id"]: result for result in results}
+        submissions = self._read()
+        for submission in submissions:
+            result = results_by_id.get(submission["id"])
+            if result is not None:
+                submission.update(grade=result["grade"], result=result["result"], text=result["text"],
+                                  custom=result["custom"])
+        # Replace the file at once, so an interrupted regrade does not leave it truncated
+        file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.file_name)))
+        with os.fdopen(file_descriptor, "w") as temp_file:
+            json.dump(submissions, temp_file, indent=2)
+        os.replace(temp_path, self.file_name)
+
+
+def _select_submission(submissions, evaluate, current_id=None):
+    """
+    Returns the submission of a user that gives the grade of the task, as INGInious chooses it.
+
+    Args:
+        - submissions (list): The done submissions of the user, with _id, grade and submitted_on.
+        - evaluate (str): 'best' (highest grade, the latest one on ties), 'last' or 'student'
+        (the one chosen by the student, current_id).
+        - current_id: Id of the submission currently chosen.
+    """
+    if not submissions:
+        return None
+    if evaluate == "student":
+        return next((submission for submission in submissions if submission["_id"] == current_id), None)
+    if evaluate == "last":
+        return max(submissions, key=lambda submission: submission["submitted_on"])
+    return max(submissions, key=lambda submission: (submission.get("grade") or 0.0, submission["submitted_on"]))
+
+
+class MongoSubmissionStore:
+    """
+    The submissions of a task in the INGInious database. The input of each submission is
+    read from GridFS. After the results are saved, the submission giving the grade of each
+    of their users (see _select_submission) is chosen again and their user_tasks updated.
+
+    The staff of the course is not stored in the database (it is in course.yaml and the
+    configuration of the webapp), so its usernames are given as staff.
+    """
+
+    def __init__(self, database, course_id, task_id, problem_id, problem_type, staff=(), evaluate="best"):
+        import gridfs
+        self.database = database
+        self.gridfs = gridfs.GridFS(database)
+        self.course_id = course_id
+        self.task_id = task_id
+        self.problem_id = problem_id
+        self.problem_type = problem_type
+        self.staff = set(staff)
+        self.evaluate = evaluate
+        # Usernames of the loaded submissions, by id
+        self._usernames = {}
+
+    def load_submissions(self):
+        import bson
+        submissions = []
+        query = {"courseid": self.course_id, "taskid": self.task_id, "status": "done"}
+        for submission in self.database.submissions.find(query, {"input": 1, "grade": 1, "username": 1}):
+            input_data = bson.BSON(self.gridfs.get(submission["input"]).read()).decode()
+            code = input_data.get(self.problem_id)
+            if isinstance(code, dict):
+                # Uploaded file
+                code = code.get("value")
+            usernames = submission.get("username", [])
+            self._usernames[str(submission["_id"])] = usernames
+            submissions.append({
+                "id": str(submission["_id"]),
+                "problem_id": self.problem_id,
+                "problem_type": self.problem_type,
+                "language": input_data.get(self.problem_id + "/language"),
+                "code": code,
+                "grade": submission.get("grade"),
+                "is_staff": any(username in self.staff for username in usernames),
+            })
+        return submissions
+
+    def save_results(self, results):
+        from bson.objectid import ObjectId
+        from pymongo import UpdateOne
+        submission_updates = []
+        usernames = set()
+        for result in results:
+            values = {"grade": result["grade"], "result": result["result"], "text": result["text"]}
+            for key, value in result["custom"].items():
+                values["custom.custom_" + key] = value
+            submission_updates.append(UpdateOne({"_id": ObjectId(result["id"])}, {"$set": values}))
+            usernames.update(self._usernames.get(result["id"], []))
+        if submission_updates:
+            self.database.submissions.bulk_write(submission_updates, ordered=False)
+        if usernames:
+            self._update_user_tasks(sorted(usernames))
+
+    def _update_user_tasks(self, usernames):
+        """ Sets the grade of the task of each user from the submission that gives it, after the regrade """
+        from pymongo import UpdateOne
+        task_query = {"courseid": self.course_id, "taskid": self.task_id}
+        submissions_by_user = {username: [] for username in usernames}
+        query = dict(task_query, status="done", username={"$in": usernames})
+        for submission in self.database.submissions.find(query, {"username": 1, "grade": 1, "result": 1,
+                                                                  "submitted_on": 1}):
+            for username in submission["username"]:
+                if username in submissions_by_user:
+                    submissions_by_user[username].append(submission)
+
+        current_ids = {}
+        if self.evaluate == "student":
+            for user_task in self.database.user_tasks.find(dict(task_query, username={"$in": usernames}),
+                                                           {"username": 1, "submissionid": 1}):
+                current_ids[user_task["username"]] = user_task.get("submissionid")
+
+        user_task_updates = []
+        for username, submissions in submissions_by_user.items():
+            selected = _select_submission(submissions, self.evaluate, current_ids.get(username))
+            if selected is None:
+                continue
+            user_task_updates.append(UpdateOne(dict(task_query, username=username), {"$set": {
+                "submissionid": selected["_id"], "grade": selected.get("grade", 0.0),
+                "succeeded": selected.get("result") == "success"}}))
+        if user_task_updates:
+            self.database.user_tasks.bulk_write(user_task_updates, ordered=False)
+
+
+def _load_progress(progress_file_name):
+    """ Returns the ids of the submissions already saved """
+    done = set()
+    if not progress_file_name or not os.path.exists(progress_file_name):
+        return done
+    with open(progress_file_name, "r") as progress_file:
+        for line in progress_file:
+            try:
+                done.add(json.loads(line)["id"])
+            except (ValueError, KeyError):
+                # Last line of an interrupted write
+                pass
+    return done
+
+
+def _append_progress(progress_file_name, results):
+    if not progress_file_name:
+        return
+    with open(progress_file_name, "a") as progress_file:
+        for result in results:
+            progress_file.write(json.dumps({"id": result["id"], "old_grade": result["old_grade"],
+                                            "grade": result["grade"]}) + "\n")
+        progress_file.flush()
+        os.fsync(progress_file.fileno())
+
+
+def _regrade_submission(submission, test_cases, options):
+    request = StoredSubmissionRequest(submission["problem_id"], submission["code"], submission["language"],
+                                      submission.get("problem_type", "code_multiple_languages"),
+                                      submission.get("is_staff", False))
+    try:
+        feedback_info = RegradeGrader(request, options).grade(test_cases)
+    except Exception as e:  # pylint: disable=broad-except
+        return {"id": submission["id"], "old_grade": submission.get("grade"), "error": repr(e)}
+    return {
+        "id": submission["id"],
+        "old_grade": submission.get("grade"),
+        "grade": feedback_info["grade"],
+        "result": feedback_info["global"]["result"],
+        "text": feedback_info["global"]["feedback"],
+        "custom": feedback_info["custom"],
+    }
+
+
+def _regrade_in_process(argument, connection):
+    """ Grades a submission in a new process group, sending the result through connection """
+    # The simulations started by the grading are killed with it
+    os.setsid()
+    try:
+        connection.send(_regrade_submission(*argument))
+    finally:
+        connection.close()
+
+
+def _regrade_submissions(arguments, workers, timeout):
+    """
+    Grades the submissions of arguments, (submission, test_cases, options) tuples, each one in its own
+    process and up to workers at once. A grading still running after timeout seconds is killed.
+
+    Yields:
+        The results of _regrade_submission, in the order the gradings end.
+    """
+    # fork: the options (e.g. a fake project_factory) do not need to be picklable
+    context = multiprocessing.get_context("fork")
+    pending = list(reversed(arguments))
+    running = {}
+    while pending or running:
+        while pending and len(running) < workers:
+            argument = pending.pop()
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(target=_regrade_in_process, args=(argument, sender))
+            process.daemon = True
+            process.start()
+            sender.close()
+            deadline = time.monotonic() + timeout if timeout is not None else None
+            running[receiver] = (process, argument[0], deadline)
+
+        deadlines = [deadline for _process, _submission, deadline in running.values() if deadline is not None]
+        wait_time = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+        for receiver in multiprocessing.connection.wait(list(running), wait_time):
+            process, submission, _deadline = running.pop(receiver)
+            try:
+                result = receiver.recv()
+            except EOFError:
+                result = {"id": submission["id"], "old_grade": submission.get("grade"),
+                          "error": "the grading process exited with code {}".format(process.exitcode)}
+            receiver.close()
+            process.join()
+            yield result
+
+        now = time.monotonic()
+        for receiver, (process, submission, deadline) in list(running.items()):
+            if deadline is not None and now >= deadline:
+                del running[receiver]
+                try:
+                    os.killpg(process.pid, signal.SIGKILL)
+                except OSError:
+                    # The process ended, or did not create its group yet
+                    process.kill()
+                process.join()
+                receiver.close()
+                yield {"id": submission["id"], "old_grade": submission.get("grade"),
+                       "error": "timeout after {} seconds".format(timeout)}
+
+
+def regrade(store, test_cases, options=None, workers=None, progress_file_name=None, dry_run=False,
+            batch_size=DEFAULT_BATCH_SIZE, report=print, submission_timeout=DEFAULT_SUBMISSION_TIMEOUT):
+    """
+    Regrades the submissions of a store.
+
+    Args:
+        - store: JsonSubmissionStore, MongoSubmissionStore or any object with the methods
+        load_submissions() and save_results(results).
+        - test_cases (list): The (testbench, golden model) pairs of the task.
+        - options (dict): Options of HDLGrader. A fake simulator can be given as project_factory.
+        The golden output and teacher units caches are enabled, by default in a temporary directory.
+        - workers (int): Number of processes grading the submissions, by default one per CPU.
+        - progress_file_name (str): File where the saved submissions are recorded, to resume the regrade.
+        - dry_run (bool): Only report the changes of grade, without saving the results.
+        - batch_size (int): Number of results saved at once.
+        - report (callable): Receives the lines of the report.
+        - submission_timeout (float): Seconds after which the grading of a submission is stopped and the
+        submission reported as failed. None to wait for every grading.
+
+    Returns:
+        A dict with the number of submissions graded, changed, failed and skipped (already saved).
+    """
+    test_cases = [tuple(test_case) for test_case in test_cases]
+    # Each submission is graded in a single process, and the results of the fixed task must not be reused
+    options = dict(options or {}, grading_workers=1, cache_results=False)
+    # The teacher side is compiled and simulated once, the caches are only kept during the regrade
+    cache_dir = None
+    if "golden_cache_dir" not in options or "teacher_library_dir" not in options:
+        cache_dir = tempfile.mkdtemp(prefix="uncode_regrade_")
+        options.setdefault("golden_cache_dir", os.path.join(cache_dir, "golden"))
+        options.setdefault("teacher_library_dir", os.path.join(cache_dir, "libraries"))
+    options.setdefault("cache_golden_output", True)
+    options.setdefault("precompile_teacher_units", True)
+    workers = workers or os.cpu_count() or 1
+    try:
+        return _regrade(store, test_cases, options, workers, progress_file_name, dry_run, batch_size, report,
+                        submission_timeout)
+    finally:
+        if cache_dir is not None:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def _regrade(store, test_cases, options, workers, progress_file_name, dry_run, batch_size, report,
+             submission_timeout):
+
+    done = _load_progress(progress_file_name) if not dry_run else set()
+    submissions = [submission for submission in store.load_submissions() if submission["id"] not in done]
+    summary = {"graded": 0, "changed": 0, "failed": 0, "skipped": len(done)}
+    batch = []
+
+    def flush():
+        if batch and not dry_run:
+            store.save_results(batch)
+            _append_progress(progress_file_name, batch)
+        del batch[:]
+
+    def collect(result):
+        if "error" in result:
+            summary["failed"] += 1
+            report("{}: error {}".format(result["id"], result["error"]))
+            return
+        summary["graded"] += 1
+        if result["grade"] != result["old_grade"]:
+            summary["changed"] += 1
+            report("{}: {} -> {}".format(result["id"], result["old_grade"], result["grade"]))
+        batch.append(result)
+        if len(batch) >= batch_size:
+            flush()
+
+    arguments = [(submission, test_cases, options) for submission in submissions]
+    # Computes the golden output and the teacher units once, the rest of gradings take them from the caches
+    for result in _regrade_submissions(arguments[:1], 1, submission_timeout):
+        collect(result)
+    for result in _regrade_submissions(arguments[1:], workers, submission_timeout):
+        collect(result)
+    flush()
+
+    report("{graded} graded, {changed} changed, {failed} failed, {skipped} already saved".format(**summary)
+           + (" (dry run, nothing saved)" if dry_run else ""))
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Regrades every submission of an HDL task")
+    parser.add_argument("--problem-id", required=True, help="Id of the problem in the task")
+    parser.add_argument("--problem-type", default="code_multiple_languages",
+                        help="code_multiple_languages or code_file_multiple_languages")
+    parser.add_argument("--test-case", nargs=2, action="append", required=True, metavar=("TESTBENCH", "GOLDEN"),
+                        help="Testbench and golden model of a test case, can be repeated")
+    parser.add_argument("--submissions", metavar="FILE", help="Json file with the submissions")
+    parser.add_argument("--mongo-uri", help="Uri of the INGInious database")
+    parser.add_argument("--database", default="INGInious", help="Name of the INGInious database")
+    parser.add_argument("--course", help="Id of the course")
+    parser.add_argument("--task", help="Id of the task")
+    parser.add_argument("--staff", action="append", default=[], metavar="USERNAME",
+                        help="Username of a member of the staff (e.g. a superadmin), can be repeated")
+    parser.add_argument("--course-descriptor", metavar="FILE",
+                        help="course.yaml of the course, its admins and tutors are members of the staff")
+    parser.add_argument("--evaluate", choices=["best", "last", "student"], default="best",
+                        help="Submission giving the grade of the task, as the evaluate field of task.yaml")
+    parser.add_argument("--options", metavar="FILE", help="Json file with the options of the grader")
+    parser.add_argument("--workers", type=int, default=None, help="Number of grading processes")
+    parser.add_argument("--submission-timeout", type=float, default=DEFAULT_SUBMISSION_TIMEOUT,
+                        help="Seconds after which the grading of a submission is stopped")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Results saved at once")
+    parser.add_argument("--progress", metavar="FILE", help="Progress file, to resume an interrupted regrade")
+    parser.add_argument("--dry-run", action="store_true", help="Only report the changes of grade")
+    args = parser.parse_args(argv)
+
+    if args.submissions:
+        store = JsonSubmissionStore(args.submissions)
+    elif args.mongo_uri and args.course and args.task:
+        import pymongo
+        database = pymongo.MongoClient(args.mongo_uri)[args.database]
+        staff = set(args.staff)
+        if args.course_descriptor:
+            import yaml
+            with open(args.course_descriptor, "r") as descriptor_file:
+                descriptor = yaml.safe_load(descriptor_file) or {}
+            staff.update(descriptor.get("admins", []), descriptor.get("tutors", []))
+        store = MongoSubmissionStore(database, args.course, args.task, args.problem_id, args.problem_type,
+                                     staff, args.evaluate)
+    else:
+        parser.error("either --submissions or --mongo-uri, --course and --task are required")
+
+    options = {}
+    if args.options:
+        with open(args.options, "r") as options_file:
+            options = json.load(options_file)
+
+    summary = regrade(store, args.test_case, options, args.workers, args.progress, args.dry_run, args.batch_size,
+                      submission_timeout=args.submission_timeout)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
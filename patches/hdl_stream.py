@@ -0,0 +1,256 @@
+"""
+This module contains the tools for comparing the output of a simulation while
+it is running, so wrong or runaway simulations can be stopped early.
+
+Tools:
+    - StreamingComparator: Line by line comparison against the expected output.
+    - run_streaming: Runs a command feeding its stdout to a StreamingComparator.
+    - BoundedOutput: Keeps the beginning and the end of an output of unknown length.
+    - bound_output: Elides the middle of a long output.
+"""
+
+import codecs
+import subprocess
+import threading
+
+STOPPED_BY_MISMATCHES = "mismatches"
+STOPPED_BY_BYTES = "bytes"
+STOPPED_BY_TIMEOUT = "timeout"
+#  64 KBs will be the size of the chunks read from the output of the processes
+CHUNK_SIZE = (2 ** 10) * 64
+#  32 KBs will be the default length of the kept beginning and end of the outputs
+DEFAULT_HEAD_SIZE = (2 ** 10) * 32
+DEFAULT_TAIL_SIZE = (2 ** 10) * 32
+
+_ELISION_MARKER = "\n... ({} characters omitted) ...\n"
+
+
+class StreamingComparator:
+    """
+    Compares the lines of an output, as they are produced, with the expected output.
+
+    The output is fed line by line (feed) or in chunks that may split the lines (feed_text).
+
+    Attributes:
+        - max_mismatches (int): Number of different lines after which the comparison stops.
+        - max_bytes (int): Number of bytes of output after which the comparison stops.
+        - lines (int): Number of lines compared.
+        - bytes (int): Number of bytes compared.
+        - mismatches (int): Number of different lines.
+        - first_mismatch_line (int): Number (starting at 1) of the first different line.
+        - stopped_reason (str): STOPPED_BY_MISMATCHES or STOPPED_BY_BYTES when the limit
+        was reached, STOPPED_BY_TIMEOUT when run_streaming killed the process after its
+        timeout, None otherwise.
+    """
+
+    def __init__(self, expected_output, max_mismatches=50, max_bytes=None):
+        self._expected_lines = expected_output.splitlines()
+        self.max_mismatches = max_mismatches
+        #  By default the output may be twice as long as the expected one, plus 64 KBs
+        self.max_bytes = max_bytes if max_bytes is not None else 2 * len(expected_output) + (2 ** 10) * 64
+        self.lines = 0
+        self.bytes = 0
+        self.mismatches = 0
+        self.first_mismatch_line = None
+        self.stopped_reason = None
+        # The last line of the chunks fed, until its end is fed
+        self._partial_line = []
+        self._partial_size = 0
+
+    def feed(self, line):
+        """
+        Compares the next line of the output.
+
+        Returns:
+            False when a limit was reached and the output should not be read anymore.
+        """
+        self.bytes += len(line)
+        expected_line = self._expected_lines[self.lines] if self.lines < len(self._expected_lines) else None
+        self.lines += 1
+        if expected_line is None or line.rstrip() != expected_line.rstrip():
+            self.mismatches += 1
+            if self.first_mismatch_line is None:
+                self.first_mismatch_line = self.lines
+
+        if self.max_mismatches is not None and self.mismatches >= self.max_mismatches:
+            self.stopped_reason = STOPPED_BY_MISMATCHES
+        elif self.bytes > self.max_bytes:
+            self.stopped_reason = STOPPED_BY_BYTES
+        return self.stopped_reason is None
+
+    def feed_text(self, text):
+        """
+        Compares the complete lines of the next chunk of the output. The rest of the chunk
+        is kept until the end of its line is fed, but it counts against max_bytes at once,
+        so an output without newlines is stopped as soon as it exceeds it.
+
+        Returns:
+            False when a limit was reached and the output should not be read anymore.
+        """
+        start = 0
+        end = text.find("\n")
+        while end >= 0:
+            line = text[start:end + 1]
+            if self._partial_line:
+                line = "".join(self._partial_line) + line
+                self._partial_line = []
+                self._partial_size = 0
+            if not self.feed(line):
+                return False
+            start = end + 1
+            end = text.find("\n", start)
+        if start < len(text):
+            self._partial_line.append(text[start:])
+            self._partial_size += len(text) - start
+            if self.bytes + self._partial_size > self.max_bytes:
+                self.stopped_reason = STOPPED_BY_BYTES
+        return self.stopped_reason is None
+
+    def finish(self):
+        """ Compares the last line fed without newline, and accounts the expected lines that the output lacks. """
+        if self.stopped_reason is None and self._partial_line:
+            line = "".join(self._partial_line)
+            self._partial_line = []
+            self._partial_size = 0
+            self.feed(line)
+        if self.stopped_reason is None and self.lines < len(self._expected_lines):
+            self.mismatches += len(self._expected_lines) - self.lines
+            if self.first_mismatch_line is None:
+                self.first_mismatch_line = self.lines + 1
+
+    def report(self):
+        """ Returns a dict describing where (and why) the comparison stopped. """
+        return {
+            "stopped_reason": self.stopped_reason,
+            "lines": self.lines,
+            "bytes": self.bytes,
+            "mismatches": self.mismatches,
+            "first_mismatch_line": self.first_mismatch_line,
+        }
+
+
+class BoundedOutput:
+    """
+    Keeps the first head_size and the last tail_size characters written to it, so the
+    memory used does not depend on the length of the output.
+
+    Attributes:
+        - head_size (int): Number of characters kept from the beginning.
+        - tail_size (int): Number of characters kept from the end.
+        - size (int): Number of characters written.
+    """
+
+    def __init__(self, head_size=DEFAULT_HEAD_SIZE, tail_size=DEFAULT_TAIL_SIZE):
+        self.head_size = head_size
+        self.tail_size = tail_size
+        self.size = 0
+        self._head = []
+        self._head_length = 0
+        self._tail = ""
+
+    def write(self, text):
+        self.size += len(text)
+        if self._head_length < self.head_size:
+            head = text[:self.head_size - self._head_length]
+            self._head.append(head)
+            self._head_length += len(head)
+            text = text[len(head):]
+        if text and self.tail_size:
+            # The tail is trimmed once it doubles, so each character is copied a bounded number of times
+            self._tail += text
+            if len(self._tail) > 2 * self.tail_size:
+                self._tail = self._tail[-self.tail_size:]
+
+    def getvalue(self):
+        """ Returns the output, with an elision marker in place of the characters that were not kept """
+        tail = self._tail[-self.tail_size:] if self.tail_size else ""
+        omitted = self.size - self._head_length - len(tail)
+        if omitted > 0:
+            return "".join(self._head) + _ELISION_MARKER.format(omitted) + tail
+        return "".join(self._head) + tail
+
+
+def bound_output(text, head_size=DEFAULT_HEAD_SIZE, tail_size=DEFAULT_TAIL_SIZE):
+    """ Returns the text with its middle replaced by an elision marker when it exceeds head_size + tail_size """
+    if len(text) <= head_size + tail_size:
+        return text
+    tail = text[len(text) - tail_size:] if tail_size else ""
+    return text[:head_size] + _ELISION_MARKER.format(len(text) - head_size - len(tail)) + tail
+
+
+def _decoded_chunks(stream):
+    """ Yields the chunks read from a binary stream as text, replacing the invalid UTF-8 """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    for chunk in iter(lambda: stream.read1(CHUNK_SIZE), b""):
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+
+def _read_bounded(stream, output):
+    for text in _decoded_chunks(stream):
+        output.write(text)
+
+
+def run_streaming(args, cwd, comparator, timeout=None, stderr_output=None):
+    """
+    Runs a command, feeding its stdout in chunks of CHUNK_SIZE bytes to the comparator. The
+    process is killed as soon as the comparator reaches one of its limits, or after timeout
+    seconds, which sets the stopped_reason of the comparator to STOPPED_BY_TIMEOUT.
+
+    Args:
+        - args (list): The command to run.
+        - cwd (str): The working directory of the command.
+        - comparator (StreamingComparator): The comparator of the output.
+        - timeout (float): Seconds after which the process is killed.
+        - stderr_output (BoundedOutput): Where the stderr is kept, by default with the default sizes.
+        The stdout is not bounded here, its length is limited by the comparator.
+
+    Returns:
+        A tuple (return_code, stdout, stderr) with the output read until the process ended
+        or was stopped.
+    """
+    process = subprocess.Popen(args, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stderr_output = stderr_output if stderr_output is not None else BoundedOutput()
+    stderr_reader = None
+    timer = None
+    timed_out = threading.Event()
+    stdout_chunks = []
+
+    def kill_after_timeout():
+        timed_out.set()
+        process.kill()
+    # Until the whole output was read: a limit was reached, or the comparator or the reading raised
+    stopped = True
+    try:
+        stderr_reader = threading.Thread(target=_read_bounded, args=(process.stderr, stderr_output))
+        stderr_reader.daemon = True
+        stderr_reader.start()
+        if timeout is not None:
+            timer = threading.Timer(timeout, kill_after_timeout)
+            timer.start()
+
+        for text in _decoded_chunks(process.stdout):
+            stdout_chunks.append(text)
+            if not comparator.feed_text(text):
+                break
+        else:
+            stopped = False
+    finally:
+        if timer is not None:
+            timer.cancel()
+        # The simulation must not outlive the comparison
+        if stopped and process.poll() is None:
+            process.kill()
+        process.stdout.close()
+        return_code = process.wait()
+        if stderr_reader is not None:
+            stderr_reader.join()
+        process.stderr.close()
+    if timed_out.is_set() and comparator.stopped_reason is None:
+        comparator.stopped_reason = STOPPED_BY_TIMEOUT
+    comparator.finish()
+    return return_code, ''.join(stdout_chunks), stderr_output.getvalue()
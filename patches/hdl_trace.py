@@ -0,0 +1,474 @@
+"""
+This module contains the tools for comparing HDL simulation traces.
+
+The testbenches print one line per sampled time with the format:
+
+    T, <time>, INPUTS, <name>, <value>, ..., OUTPUTS, <name>, <value>, ...
+
+which is the same format parsed by parseHDLline in hdlgrader.js. Traces are
+parsed once into columns (one list of values per signal) and compared column
+by column, instead of comparing the raw text line by line.
+
+Tools:
+    - Trace: Columnar representation of a simulation trace.
+    - parse_trace: Builds a Trace from the simulation output.
+    - compare_traces: Signal level comparison of an expected and an actual trace.
+    - waveform_payload: Compact waveform of both traces for the feedback viewer.
+"""
+
+import bisect
+import collections
+import hashlib
+import itertools
+import operator
+
+# Unknown (X) and high impedance (Z) values, using the VHDL std_logic and Verilog letters
+_NORMALIZE_VALUE = str.maketrans("xuUwW-z", "XXXXXXZ")
+_UNKNOWN_VALUES = frozenset("XZ")
+
+
+class Trace:
+    """
+    Columnar representation of a simulation trace.
+
+    Attributes:
+        - times (list): Time of each row of the trace.
+        - columns (dict): Values of each signal, one per row. None when a row lacks the signal.
+        - directions (dict): "input" or "output" for each signal.
+        - widths (dict): Width in bits of each signal.
+        - ignored_lines (int): Number of lines that are not part of the trace.
+        - truncated (bool): Whether the parsing stopped before the end of the output.
+    """
+
+    def __init__(self):
+        self.times = []
+        self.columns = {}
+        self.directions = {}
+        self.widths = {}
+        self.ignored_lines = 0
+        self.truncated = False
+        # Digest of the stripped lines that are not part of the trace, in order
+        self._ignored_digest = hashlib.sha256()
+
+    def ignore_line(self, line):
+        """ Accounts a line that is not part of the trace """
+        self.ignored_lines += 1
+        self._ignored_digest.update(line.strip().encode("utf-8", "replace") + b"\n")
+
+    @property
+    def ignored_digest(self):
+        """ Digest of the lines that are not part of the trace, equal for two traces with the same ones """
+        return self._ignored_digest.hexdigest()
+
+    def __len__(self):
+        return len(self.times)
+
+    def add_rows(self, times, names, directions, columns):
+        """
+        Appends a block of rows that share the same signals.
+
+        Args:
+            - times (list): The simulation time of each row.
+            - names (list): Names of the signals in the block.
+            - directions (list): "input" or "output" for each signal.
+            - columns (list): Normalized values of each signal, one per row.
+        """
+        rows = len(self.times)
+        self.times.extend(times)
+        for name, direction, values in zip(names, directions, columns):
+            column = self.columns.get(name)
+            if column is None:
+                column = self.columns[name] = [None] * rows
+                self.directions[name] = direction
+                self.widths[name] = len(values[0]) if values else 0
+            column.extend(values)
+        for column in self.columns.values():
+            if len(column) < len(self.times):
+                column.extend([None] * (len(self.times) - len(column)))
+
+    def row_keys(self):
+        """ Returns a (time, occurrence) key per row, to align rows printed at the same time. """
+        occurrences = {}
+        keys = []
+        for time in self.times:
+            occurrence = occurrences.get(time, 0)
+            occurrences[time] = occurrence + 1
+            keys.append((time, occurrence))
+        return keys
+
+
+def _tuple_getter(positions):
+    if len(positions) == 1:
+        position = positions[0]
+        return lambda tokens: (tokens[position],)
+    return operator.itemgetter(*positions)
+
+
+class _LineLayout:
+    """
+    Positions of the tokens of a trace line. Consecutive lines usually print the same
+    signals in the same order, so they share the layout and only their values change.
+    """
+
+    def __init__(self, tokens):
+        self.size = len(tokens)
+        self.names = []
+        self.directions = []
+        fixed_positions = [0]
+        value_positions = []
+        direction = None
+        i = 2
+        while i < len(tokens):
+            token = tokens[i].strip()
+            if token == 'INPUTS' or token == 'OUTPUTS':
+                direction = "input" if token == 'INPUTS' else "output"
+                fixed_positions.append(i)
+                i += 1
+            elif direction is not None and i + 1 < len(tokens):
+                self.names.append(token)
+                self.directions.append(direction)
+                fixed_positions.append(i)
+                value_positions.append(i + 1)
+                i += 2
+            else:
+                fixed_positions.append(i)
+                i += 1
+        self._fixed_getter = _tuple_getter(fixed_positions)
+        self.fixed_tokens = self._fixed_getter(tokens)
+        self.values = _tuple_getter(value_positions) if value_positions else lambda tokens: ()
+
+    def matches(self, tokens):
+        return len(tokens) == self.size and self._fixed_getter(tokens) == self.fixed_tokens
+
+
+def normalize_value(value):
+    """ Strips a value and maps the unknown and high impedance letters to X and Z. """
+    return value.strip().translate(_NORMALIZE_VALUE)
+
+
+def _iter_lines(text):
+    """ Yields the lines of the text one by one, without splitting the whole text at once """
+    start = 0
+    while start < len(text):
+        end = text.find("\n", start)
+        if end < 0:
+            end = len(text)
+        yield text[start:end].rstrip("\r")
+        start = end + 1
+
+
+def parse_trace(text, max_rows=None):
+    """
+    Parses the output of a simulation into a Trace.
+
+    Lines sharing a layout are gathered as tuples of raw values and transposed
+    into columns at once, so every value is touched by a single map per column.
+
+    Args:
+        - text (str): The output of the simulation.
+        - max_rows (int): Number of rows after which the parsing stops, marking the trace
+        as truncated. The memory used then does not depend on the length of the output.
+    """
+    trace = Trace()
+    layout = None
+    times = []
+    rows = []
+
+    def flush():
+        if rows:
+            columns = [list(map(normalize_value, column)) for column in zip(*rows)]
+            trace.add_rows(times, layout.names, layout.directions, columns or [[]] * len(layout.names))
+        del times[:], rows[:]
+
+    for line in (text.splitlines() if max_rows is None else _iter_lines(text)):
+        tokens = line.split(',')
+        if len(tokens) < 2 or tokens[0].strip() != 'T':
+            if line.strip():
+                trace.ignore_line(line)
+            continue
+        try:
+            time = int(tokens[1])
+        except ValueError:
+            trace.ignore_line(line)
+            continue
+        if max_rows is not None and len(trace) + len(times) >= max_rows:
+            trace.truncated = True
+            break
+        if layout is None or not layout.matches(tokens):
+            flush()
+            layout = _LineLayout(tokens)
+        times.append(time)
+        rows.append(layout.values(tokens))
+    flush()
+    return trace
+
+
+def _is_unknown(value):
+    return value is not None and not _UNKNOWN_VALUES.isdisjoint(value)
+
+
+class SignalComparison:
+    """
+    Comparison of a single signal of two traces.
+
+    Attributes:
+        - name (str): Name of the signal.
+        - direction (str): "input" or "output".
+        - width (int): Width in bits of the signal on the expected trace.
+        - mismatches (int): Number of aligned rows where the values differ.
+        - first_mismatch_time (int): Time of the first mismatch, None if there is none.
+        - unknown_values (int): Number of X/Z values of the signal on the actual trace.
+    """
+
+    def __init__(self, name, direction, width):
+        self.name = name
+        self.direction = direction
+        self.width = width
+        self.mismatches = 0
+        self.first_mismatch_time = None
+        self.unknown_values = 0
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "direction": self.direction,
+            "width": self.width,
+            "mismatches": self.mismatches,
+            "first_mismatch_time": self.first_mismatch_time,
+            "unknown_values": self.unknown_values,
+        }
+
+
+class TraceComparison:
+    """
+    Result of comparing an expected and an actual trace.
+
+    Attributes:
+        - signals (list): SignalComparison of every signal of the expected trace.
+        - missing_rows (int): Rows of the expected trace without a counterpart.
+        - extra_rows (int): Rows of the actual trace without a counterpart.
+        - missing_signals (list): Signals of the expected trace that the actual trace lacks.
+        - extra_signals (list): Signals of the actual trace that the expected trace lacks.
+        - ignored_lines_differ (bool): Whether the lines that are not part of the traces (e.g.
+        messages of the testbench) differ.
+    """
+
+    def __init__(self):
+        self.signals = []
+        self.missing_rows = 0
+        self.extra_rows = 0
+        self.missing_signals = []
+        self.extra_signals = []
+        self.ignored_lines_differ = False
+
+    @property
+    def equal(self):
+        return (not self.missing_rows and not self.extra_rows and not self.missing_signals and
+                not self.extra_signals and not self.ignored_lines_differ and
+                all(signal.mismatches == 0 for signal in self.signals))
+
+    @property
+    def first_mismatch_time(self):
+        times = [signal.first_mismatch_time for signal in self.signals if signal.first_mismatch_time is not None]
+        return min(times) if times else None
+
+    def to_dict(self):
+        return {
+            "equal": self.equal,
+            "first_mismatch_time": self.first_mismatch_time,
+            "missing_rows": self.missing_rows,
+            "extra_rows": self.extra_rows,
+            "missing_signals": self.missing_signals,
+            "extra_signals": self.extra_signals,
+            "ignored_lines_differ": self.ignored_lines_differ,
+            "signals": [signal.to_dict() for signal in self.signals],
+        }
+
+
+def compare_traces(expected, actual, unknown_as_wildcard=False):
+    """
+    Compares two traces signal by signal. Rows are aligned by time (and by order
+    among the rows printed at the same time). The traces are only equal when they also
+    have the same signals and the same lines outside the trace, as check_output requires.
+
+    Args:
+        - expected (Trace): The trace of the golden model.
+        - actual (Trace): The trace of the student's design.
+        - unknown_as_wildcard (bool): Whether X/Z values on the expected trace match any value.
+
+    Returns:
+        A TraceComparison.
+    """
+    comparison = TraceComparison()
+    comparison.extra_signals = [name for name in actual.columns if name not in expected.columns]
+    comparison.ignored_lines_differ = (expected.ignored_lines != actual.ignored_lines or
+                                       expected.ignored_digest != actual.ignored_digest)
+
+    if expected.times == actual.times:
+        # Both simulations sampled the same times, rows are already aligned
+        expected_indexes = actual_indexes = None
+        aligned_times = expected.times
+    else:
+        actual_rows = {key: row for row, key in enumerate(actual.row_keys())}
+        expected_indexes = []
+        actual_indexes = []
+        for row, key in enumerate(expected.row_keys()):
+            actual_row = actual_rows.get(key)
+            if actual_row is not None:
+                expected_indexes.append(row)
+                actual_indexes.append(actual_row)
+        comparison.missing_rows = len(expected) - len(expected_indexes)
+        comparison.extra_rows = len(actual) - len(actual_indexes)
+        aligned_times = [expected.times[row] for row in expected_indexes]
+
+    for name, expected_column in expected.columns.items():
+        signal = SignalComparison(name, expected.directions[name], expected.widths[name])
+        comparison.signals.append(signal)
+        actual_column = actual.columns.get(name)
+        if actual_column is None:
+            comparison.missing_signals.append(name)
+            continue
+
+        # Signals take few distinct values, so X/Z detection is done once per distinct value
+        actual_counts = collections.Counter(actual_column)
+        signal.unknown_values = sum(count for value, count in actual_counts.items() if _is_unknown(value))
+
+        if expected_indexes is None:
+            expected_values, actual_values = expected_column, actual_column
+        else:
+            expected_values = list(map(expected_column.__getitem__, expected_indexes))
+            actual_values = list(map(actual_column.__getitem__, actual_indexes))
+        different = list(map(operator.ne, expected_values, actual_values))
+        if unknown_as_wildcard:
+            unknown = {value for value in set(expected_values) if _is_unknown(value)}
+            if unknown:
+                different = list(map(operator.gt, different, map(unknown.__contains__, expected_values)))
+
+        signal.mismatches = sum(different)
+        if signal.mismatches:
+            signal.first_mismatch_time = next(itertools.compress(aligned_times, different))
+
+    return comparison
+
+
+#  Values shown as unknown by the waveform viewer (see parseHDLline in hdlgrader.js)
+_WAVEFORM_UNKNOWN_BITS = frozenset("xXUZWLH_")
+_NO_VALUE = object()
+
+
+def _value_changes(times, column):
+    """ Returns the (time, value) pairs where the value of the column changes, skipping the rows without value. """
+    if None in column:
+        rows = [row for row, value in enumerate(column) if value is not None]
+        times = [times[row] for row in rows]
+        column = [column[row] for row in rows]
+    changed = map(operator.ne, column, itertools.chain((_NO_VALUE,), column))
+    return [(times[row], column[row]) for row in itertools.compress(range(len(column)), changed)]
+
+
+def _encode_changes(changes, width):
+    """ Delta encodes the times of the changes: [[time - previous time, value], ...]. """
+    encoded = []
+    previous_time = 0
+    for time, value in changes:
+        if width == 1 and value in _WAVEFORM_UNKNOWN_BITS:
+            value = 'X'
+        encoded.append([time - previous_time, value])
+        previous_time = time
+    return encoded
+
+
+def _first_difference_time(expected_changes, actual_changes):
+    """ Time of the first change that differs between the changes of two traces, None if they are equal """
+    for expected_change, actual_change in zip(expected_changes, actual_changes):
+        if expected_change != actual_change:
+            return min(expected_change[0], actual_change[0])
+    if len(expected_changes) == len(actual_changes):
+        return None
+    longer = expected_changes if len(expected_changes) > len(actual_changes) else actual_changes
+    return longer[min(len(expected_changes), len(actual_changes))][0]
+
+
+def _changes_from(changes, start_time):
+    """ The changes from start_time on, the value at start_time being the one of the last earlier change """
+    times = [time for time, _value in changes]
+    first = bisect.bisect_left(times, start_time)
+    if first == 0 or (first < len(changes) and changes[first][0] == start_time):
+        return changes[first:]
+    return [(start_time, changes[first - 1][1])] + changes[first:]
+
+
+def waveform_payload(expected, actual, max_changes=2000, context_rows=20):
+    """
+    Builds the waveform shown in the feedback, so the browser does not have to parse the traces.
+
+    Every signal has the value changes of the expected trace and, only when they are
+    different, the ones of the actual trace. Changes are run-length encoded (a value is
+    only listed when it changes) and their times are delta encoded. When a trace was
+    truncated (see parse_trace), the changes after the last time of both are dropped.
+
+    Only a window of the traces is kept: it starts context_rows rows of the expected trace
+    before the first difference (at the beginning when there is none) and ends after
+    max_changes changes.
+
+    Args:
+        - expected (Trace): The trace of the golden model.
+        - actual (Trace): The trace of the student's design.
+        - max_changes (int): Maximum number of changes in the payload. Later changes are dropped.
+        - context_rows (int): Rows of the expected trace shown before the first difference.
+
+    Returns:
+        A dict {"version", "time_scale", "start_time", "truncated", "signals": [{"name",
+        "direction", "width", "expected", "student"}, ...]}.
+    """
+    # Times after the end of a truncated trace are only known for the other trace
+    end_times = [trace.times[-1] for trace in (expected, actual) if trace.truncated and len(trace)]
+    end_time = min(end_times) if end_times else None
+
+    signals = []
+    difference_times = []
+    for name, column in expected.columns.items():
+        expected_changes = _value_changes(expected.times, column)
+        actual_column = actual.columns.get(name)
+        actual_changes = [] if actual_column is None else _value_changes(actual.times, actual_column)
+        if end_time is not None:
+            expected_changes = [change for change in expected_changes if change[0] <= end_time]
+            actual_changes = [change for change in actual_changes if change[0] <= end_time]
+        difference_time = _first_difference_time(expected_changes, actual_changes)
+        if difference_time is not None:
+            difference_times.append(difference_time)
+        signals.append((name, expected.directions[name], expected.widths[name], expected_changes,
+                        None if difference_time is None else actual_changes))
+
+    start_time = 0
+    if difference_times:
+        difference_row = bisect.bisect_left(expected.times, min(difference_times))
+        start_row = max(difference_row - context_rows, 0)
+        start_time = expected.times[start_row] if start_row < len(expected) else min(difference_times)
+    if start_time > 0:
+        signals = [signal[:3] + tuple(None if changes is None else _changes_from(changes, start_time)
+                                      for changes in signal[3:]) for signal in signals]
+
+    truncated = expected.truncated or actual.truncated
+    change_times = sorted(time for signal in signals for changes in signal[3:] if changes
+                          for time, _value in changes)
+    if len(change_times) > max_changes:
+        truncated = True
+        last_time = change_times[max_changes]
+        signals = [signal[:3] + tuple(None if changes is None else changes[:bisect.bisect_left(
+            [time for time, _value in changes], last_time)] for changes in signal[3:]) for signal in signals]
+
+    return {
+        "version": 1,
+        #  The viewer uses times multiplied by 1000 (see separateData in hdlgrader.js)
+        "time_scale": 1000,
+        "start_time": start_time,
+        "truncated": truncated,
+        "signals": [{
+            "name": name,
+            "direction": direction,
+            "width": width,
+            "expected": _encode_changes(expected_changes, width),
+            "student": None if actual_changes is None else _encode_changes(actual_changes, width),
+        } for name, direction, width, expected_changes, actual_changes in signals],
+    }
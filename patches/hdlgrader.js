@@ -1,100 +1,601 @@
-async function updateWaveDromBlock(blockId, text) {
-  await loadScript("https://cdn.jsdelivr.net/npm/d3@7.9.0/dist/d3.min.js");
-  await loadScript("https://cdn.jsdelivr.net/npm/@fortawesome/free-solid-svg-icons@6.7.2/index.min.js");
-  await loadScript("https://cdn.jsdelivr.net/gh/pablogalay/d3-waveMOD@master/dist/d3-wave.js");
+// Este archivo también se carga en el worker de hdlgrader_worker.js, donde no hay document
+const HDL_GRADER_SCRIPT_URL = typeof document !== "undefined" && document.currentScript
+    ? document.currentScript.src
+    : null;
 
+// Los recursos del visor de formas de onda se sirven desde el subdirectorio vendor del
+// directorio static del plugin (copiados por patch_system.sh), sin depender de internet
+const WAVE_VIEWER_ASSETS_URL = HDL_GRADER_SCRIPT_URL ? new URL("vendor/", HDL_GRADER_SCRIPT_URL).href : "vendor/";
+
+// Si un recurso no está en vendor se carga desde el CDN, en la versión fijada en patches/vendor/README.md.
+// integrity es el hash SRI del archivo (sha384) y se comprueba cuando se conoce.
+const WAVE_VIEWER_ASSETS = {
+  d3: {
+    file: "d3.min.js",
+    cdn: "https://cdn.jsdelivr.net/npm/d3@7.9.0/dist/d3.min.js",
+    integrity: null
+  },
+  icons: {
+    file: "free-solid-svg-icons.min.js",
+    cdn: "https://cdn.jsdelivr.net/npm/@fortawesome/free-solid-svg-icons@6.7.2/index.min.js",
+    integrity: null
+  },
+  wave: {
+    file: "d3-wave.js",
+    // Fuente original del visor, hasta fijar un commit (ver patches/vendor/README.md)
+    cdn: "https://cdn.jsdelivr.net/gh/pablogalay/d3-waveMOD@master/dist/d3-wave.js",
+    integrity: null
+  }
+};
+
+// Carga un recurso desde vendor y, si falla, desde el CDN
+function loadWaveViewerAsset(asset) {
+  return loadScript(WAVE_VIEWER_ASSETS_URL + asset.file)
+    .catch(() => loadScript(asset.cdn, asset.integrity));
+}
+
+// Promesa compartida por todos los bloques: los scripts se cargan una única vez por página
+let waveViewerAssets = null;
+
+function loadWaveViewerAssets() {
+  if (!waveViewerAssets) {
+    // d3 y los iconos se cargan en paralelo, d3-wave necesita d3
+    waveViewerAssets = Promise.all([
+      window.d3 ? Promise.resolve() : loadWaveViewerAsset(WAVE_VIEWER_ASSETS.d3),
+      loadWaveViewerAsset(WAVE_VIEWER_ASSETS.icons)
+    ]).then(() => (window.d3 && d3.WaveGraph) ? undefined : loadWaveViewerAsset(WAVE_VIEWER_ASSETS.wave));
+    // Si falla la carga, el siguiente bloque lo vuelve a intentar
+    waveViewerAssets.catch(() => { waveViewerAssets = null; });
+  }
+  return waveViewerAssets;
+}
+
+async function updateWaveDromBlock(blockId, text, waveform) {
   const target = document.getElementById(blockId);
   if (!target) {
     console.warn(`Elemento con ID '${blockId}' no encontrado.`);
     return;
   }
 
-  // Si el contenedor aún no existe, se crea 
-  let svg = document.getElementById("wave-graph");
-  if (!svg) {
-    // Estilos
-    if (!document.getElementById("wave-style")) {
-      const style = document.createElement("style");
-      //Se añaden los estilos básicos para la librería
-      style.id = "wave-style";
-      style.textContent = `
-        #wave-graph {
-          width: 100%;
-          min-width: 300px;
-          height: 400px;
-          margin-top: 30px;
+  // Cada bloque tiene su propio contenedor, así varios tests se inicializan en paralelo
+  const svgId = blockId + "-wave-graph";
+  if (document.getElementById(svgId)) return;
+
+  // Estilos
+  if (!document.getElementById("wave-style")) {
+    const style = document.createElement("style");
+    //Se añaden los estilos básicos para la librería
+    style.id = "wave-style";
+    style.textContent = `
+      .wave-graph {
+        width: 100%;
+        min-width: 300px;
+        height: 400px;
+        margin-top: 30px;
+      }
+    `;
+    document.head.appendChild(style);
+  }
+
+  // Las trazas se analizan en un worker mientras se cargan los scripts, la página sigue respondiendo
+  const assets = loadWaveViewerAssets();
+  const trace = await parseTrace(text, waveform);
+
+  //Lineas encargadas de imprimir los resultados de la ejecución del código
+  let block = $('#' + blockId);
+  let wavedromNotice = "";
+  if (trace.wavedromError) {
+    wavedromNotice = traceNotice("No se pudo generar el diagrama de la traza: " + trace.wavedromError);
+  } else if (trace.wavedromSkipped) {
+    wavedromNotice = traceNotice("Traza demasiado larga: se muestra la vista por ventanas.");
+  }
+  block.html(parseOutputDiff(text) + trace.wavedrom + wavedromNotice);
+
+  // Crear contenedor y SVG
+  const container = document.createElement("div");
+  container.className = "wave-container";
+  container.style.width = "100%";
+  container.style.height = "480px";
+
+  const svg = document.createElementNS("http://www.w3.org/2000/svg", "svg");
+  svg.id = svgId;
+  svg.classList.add("wave-graph");
+
+  container.appendChild(svg);
+  target.appendChild(container);
+
+  if (!trace.graph) {
+    console.error("Error al inicializar wave graph:", trace.graphError);
+    container.style.height = "auto";
+    container.innerHTML = traceNotice("No se pudo mostrar el visor de formas de onda: " + trace.graphError);
+    return;
+  }
+  try {
+    await assets;
+  } catch (e) {
+    console.error("No se pudieron cargar los recursos del visor de formas de onda:", e);
+    container.style.height = "auto";
+    container.innerHTML = traceNotice("No se pudieron cargar los recursos del visor de formas de onda.");
+    return;
+  }
+
+  // El SVG ya está en el documento, se inicializa directamente
+  try {
+    // Solo se dibuja el intervalo visible, con a lo sumo un cambio de valor cada 2 píxeles
+    const view = new WaveformView(trace.graph);
+    const waveGraph = new d3.WaveGraph(d3.select(svg));
+    const visibleData = () => view.window(Math.max(50, Math.floor(svg.clientWidth / 2)));
+
+    waveGraph.bindData(visibleData());
+    waveGraph.setSizes();
+    waveGraph.bindData(visibleData());
+
+    let pendingRender = null;
+    const render = () => {
+      if (pendingRender === null) {
+        pendingRender = requestAnimationFrame(() => {
+          pendingRender = null;
+          waveGraph.bindData(visibleData());
+        });
+      }
+    };
+    container.insertBefore(createWaveformToolbar(view, render), svg);
+
+    // Evento con espacio de nombres propio, para no reemplazar el de los otros bloques
+    d3.select(window).on("resize." + svgId, () => {
+      waveGraph.setSizes();
+      render();
+    });
+  } catch (e) {
+    // Si ocurre un error durante la inicializacion
+    console.error("Error al inicializar wave graph:", e);
+  }
+}
+
+// Botones para desplazar y ampliar el intervalo visible de un WaveformView
+function createWaveformToolbar(view, render) {
+  const toolbar = document.createElement("div");
+  toolbar.className = "wave-toolbar";
+  const label = document.createElement("span");
+  label.className = "wave-range";
+  const updateLabel = () => {
+    label.textContent = ` ${Math.round(view.start)} - ${Math.round(view.end)}` +
+        (view.aggregated ? " (zona con muchos cambios mostrada como X)" : "");
+  };
+  const buttons = [
+    ["-", "Alejar", () => view.zoom(2)],
+    ["+", "Acercar", () => view.zoom(0.5)],
+    ["\u25C0", "Anterior", () => view.pan(-0.5)],
+    ["\u25B6", "Siguiente", () => view.pan(0.5)],
+    ["\u21BA", "Ver todo", () => view.reset()]
+  ];
+  for (const [text, title, action] of buttons) {
+    const button = document.createElement("button");
+    button.type = "button";
+    button.className = "btn btn-default btn-xs";
+    button.title = title;
+    button.textContent = text;
+    button.addEventListener("click", () => {
+      action();
+      render();
+      updateLabel();
+    });
+    toolbar.appendChild(button);
+  }
+  toolbar.appendChild(label);
+  // La etiqueta se actualiza después del primer dibujo (view.aggregated)
+  requestAnimationFrame(updateLabel);
+  return toolbar;
+}
+
+// Intervalo visible de los datos de d3-wave. Solo se generan los cambios de valor de ese intervalo y,
+// cuando hay más cambios que segmentos dibujables, los de cada segmento se agregan en uno solo (nivel
+// de detalle). Cada par de señales distintas (nombre y nombre*) tiene una pista "nombre ≠" que vale 1
+// donde difieren; al agregar se conserva el 1, así las diferencias siguen resaltadas al alejarse.
+class WaveformView {
+  constructor(graph) {
+    this.graph = graph;
+    this.groups = graph.children.map((group) => {
+      const signals = [];
+      const byName = new Map(group.children.map((signal) => [signal.name, signal]));
+      for (const signal of group.children) {
+        signals.push(WaveformView.index(signal, false));
+        // La pista de diferencias va tras la segunda señal del par
+        const pair = signal.name.endsWith("*") ? byName.get(signal.name.slice(0, -1)) : null;
+        if (pair) {
+          const mismatch = WaveformView.mismatchTrack(pair, signal);
+          if (mismatch) signals.push(WaveformView.index(mismatch, true));
+        }
+      }
+      return {name: group.name, type: group.type, signals: signals};
+    });
+    let first = Infinity;
+    let last = -Infinity;
+    for (const group of this.groups) {
+      for (const signal of group.signals) {
+        if (signal.times.length) {
+          first = Math.min(first, signal.times[0]);
+          last = Math.max(last, signal.times[signal.times.length - 1]);
         }
-      `;
-      document.head.appendChild(style);
+      }
     }
+    this.first = first === Infinity ? 0 : first;
+    this.last = last === -Infinity ? 0 : last;
+    this.aggregated = false;
+    this.reset();
+  }
 
-    //Lineas encargadas de imprimir los resultados de la ejecución del código
-    let block = $('#' + blockId);
-    block.html(parseOutputDiff(text) + parseHDL(text));
-    
+  static index(signal, isMismatch) {
+    const times = new Float64Array(signal.data.length);
+    const values = new Array(signal.data.length);
+    signal.data.forEach(([time, value], i) => {
+      times[i] = time;
+      values[i] = value;
+    });
+    return {name: signal.name, type: signal.type, times: times, values: values, isMismatch: isMismatch};
+  }
 
-    // Crear contenedor y SVG
-    const container = document.createElement("div");
-    container.id = "wave-container";
-    container.style.width = "100%";
-    container.style.height = "450px";
+  // Señal de ancho 1 que vale 1 donde los valores de las dos señales difieren, null si no difieren nunca
+  static mismatchTrack(signal, pair) {
+    const changes = [];
+    let i = 0;
+    let j = 0;
+    let value = undefined;
+    let pairValue = undefined;
+    let different = false;
+    while (i < signal.data.length || j < pair.data.length) {
+      const time = Math.min(i < signal.data.length ? signal.data[i][0] : Infinity,
+                            j < pair.data.length ? pair.data[j][0] : Infinity);
+      while (i < signal.data.length && signal.data[i][0] === time) value = signal.data[i++][1];
+      while (j < pair.data.length && pair.data[j][0] === time) pairValue = pair.data[j++][1];
+      const nowDifferent = value !== pairValue;
+      if (changes.length === 0 || nowDifferent !== different) {
+        changes.push([time, nowDifferent ? "1" : "0"]);
+        different = nowDifferent;
+      }
+    }
+    if (!changes.some(([, flag]) => flag === "1")) return null;
+    return {name: signal.name.replace(/\*$/, "") + " \u2260", type: {width: 1, name: "wire"}, data: changes};
+  }
 
-    svg = document.createElementNS("http://www.w3.org/2000/svg", "svg");
-    svg.id = "wave-graph";
+  reset() {
+    this.start = this.first;
+    this.end = Math.max(this.last, this.first + 1);
+  }
 
-    container.appendChild(svg);
-    target.appendChild(container);
+  zoom(factor) {
+    const center = (this.start + this.end) / 2;
+    const span = Math.max(1, Math.min((this.end - this.start) * factor, this.last - this.first + 1));
+    this.start = center - span / 2;
+    this.end = center + span / 2;
+    this.pan(0);
   }
 
+  pan(fraction) {
+    const span = this.end - this.start;
+    this.start = Math.min(Math.max(this.start + span * fraction, this.first), Math.max(this.last - span, this.first));
+    this.end = this.start + span;
+  }
 
-  const intervalId = setInterval(() => {
-    // Se comprubea si el SVG ya está disponible
-    const currentSvg = document.getElementById("wave-graph");
-    if (currentSvg) {
-      // Si el SVG ya está disponible, se procede a inicializar el wave graph
-      try {
-        const jsonData = parseHDLToJSON(text);
-        const data = JSON.parse(jsonData);
-        const d3svg = d3.select("#wave-graph");
-        const waveGraph = new d3.WaveGraph(d3svg);
- 
-        waveGraph.bindData(data);
-        waveGraph.setSizes();
- 
-        function draw(signalData){
-            waveGraph.bindData(signalData);
+  // Primer índice con tiempo mayor que time (búsqueda binaria)
+  static upperBound(times, time) {
+    let low = 0;
+    let high = times.length;
+    while (low < high) {
+      const middle = (low + high) >> 1;
+      if (times[middle] <= time) low = middle + 1;
+      else high = middle;
+    }
+    return low;
+  }
+
+  // Datos de d3-wave del intervalo visible, con a lo sumo segments cambios por señal
+  window(segments) {
+    const start = this.start;
+    const end = this.end;
+    const segment = (end - start) / segments;
+    this.aggregated = false;
+    const children = this.groups.map((group) => ({
+      name: group.name,
+      type: group.type,
+      children: group.signals.map((signal) => ({
+        name: signal.name,
+        type: signal.type,
+        data: this.windowData(signal, start, end, segment, segments)
+      }))
+    }));
+    return {name: this.graph.name, type: this.graph.type, children: children};
+  }
+
+  // Añade un cambio de valor; si coincide con el tiempo del anterior (bordes de segmentos agregados) lo
+  // reemplaza, así los tiempos de los datos son estrictamente crecientes
+  static pushChange(data, time, value) {
+    const last = data[data.length - 1];
+    if (last && last[0] >= time) {
+      last[1] = value;
+    } else {
+      data.push([time, value]);
+    }
+  }
+
+  windowData(signal, start, end, segment, segments) {
+    const {times, values} = signal;
+    // Valor al inicio del intervalo y cambios dentro de él
+    const from = Math.max(WaveformView.upperBound(times, start) - 1, 0);
+    const to = WaveformView.upperBound(times, end);
+    if (from >= to) return [];
+    const data = [[Math.max(times[from], start), values[from]]];
+    if (to - from <= segments) {
+      for (let i = from + 1; i < to; i++) WaveformView.pushChange(data, times[i], values[i]);
+    } else {
+      // Los cambios de cada segmento se agregan: X (o 1 en las pistas de diferencias) si hay varios
+      let i = from + 1;
+      while (i < to) {
+        const bucket = Math.floor((times[i] - start) / segment);
+        const bucketEnd = start + (bucket + 1) * segment;
+        let j = i;
+        let mismatch = false;
+        while (j < to && times[j] < bucketEnd) {
+          mismatch = mismatch || values[j] === "1";
+          j++;
         }
- 
-        function resize() {
-            waveGraph.setSizes();
+        if (j - i === 1) {
+          WaveformView.pushChange(data, times[i], values[i]);
+        } else {
+          this.aggregated = true;
+          WaveformView.pushChange(data, start + bucket * segment,
+                                  signal.isMismatch ? (mismatch ? "1" : values[j - 1]) : "X");
+          // Valor tras el segmento agregado
+          if (j < to ? times[j] > bucketEnd : bucketEnd < end) {
+            WaveformView.pushChange(data, bucketEnd, values[j - 1]);
+          }
         }
- 
-        d3.select(window).on("resize", resize);
-        draw(data);
-       
-        // Se elimina el intervalo una vez que se ha inicializado correctamente
-        clearInterval(intervalId);
+        i = j;
+      }
+    }
+    // El último valor se prolonga hasta el final del intervalo
+    if (data[data.length - 1][0] < end) data.push([end, data[data.length - 1][1]]);
+    return data;
+  }
+}
+
+// Función para cargar un script, comprobando su hash SRI si se indica
+function loadScript(url, integrity) {
+  return new Promise((resolve, reject) => {
+    const script = document.createElement('script');
+    script.src = url;
+    if (integrity) {
+      script.integrity = integrity;
+      script.crossOrigin = "anonymous";
+    }
+    script.onload = resolve;
+    script.onerror = () => reject(new Error("No se pudo cargar " + url));
+    document.head.appendChild(script);
+  });
+}
+
+
+// Worker compartido que analiza las trazas (null si el navegador no lo permite)
+let traceWorker;
+const traceWorkerRequests = new Map();
+let traceWorkerNextId = 0;
+
+function getTraceWorker() {
+  if (traceWorker === undefined) {
+    traceWorker = null;
+    if (typeof Worker !== "undefined" && HDL_GRADER_SCRIPT_URL) {
+      try {
+        traceWorker = new Worker(new URL("hdlgrader_worker.js", HDL_GRADER_SCRIPT_URL).href);
+        traceWorker.onmessage = (event) => {
+          const request = traceWorkerRequests.get(event.data.id);
+          traceWorkerRequests.delete(event.data.id);
+          if (event.data.error !== undefined) {
+            request.reject(new Error(event.data.error));
+          } else {
+            request.resolve({
+              wavedrom: event.data.wavedrom,
+              wavedromSkipped: event.data.wavedromSkipped,
+              wavedromError: event.data.wavedromError,
+              graph: event.data.graph ? unpackWaveGraph(event.data.graph) : null,
+              graphError: event.data.graphError
+            });
+          }
+        };
+        traceWorker.onerror = (event) => {
+          // El worker no se pudo cargar: las peticiones pendientes y las siguientes se analizan en el hilo principal
+          event.preventDefault();
+          traceWorker = null;
+          for (const request of traceWorkerRequests.values()) request.reject(new Error(event.message));
+          traceWorkerRequests.clear();
+        };
       } catch (e) {
-        // Si ocurre un error durante la inicializacion
-        console.error("Error al inicializar wave graph:", e);
+        traceWorker = null;
       }
     }
-  }, 2000); // Se intenta cada 2 segundos
+  }
+  return traceWorker;
+}
+
+// Los diagramas WaveDrom tienen un carácter por señal y paso de tiempo: con trazas más largas solo se
+// muestra el visor de d3-wave, que dibuja únicamente el intervalo visible
+const WAVEDROM_MAX_STEPS = 2000;
+
+// Último tiempo de la traza de un diff (segundo campo de cada línea, como en parseHDL)
+function traceLastTime(diff) {
+  let lastTime = 0;
+  for (const line of diff.split('\n')) {
+    if (line.startsWith("---") || line.startsWith("+++") || line.startsWith("@@")) continue;
+    const time = parseInt(line.replace(/ /g, "").split(",")[1]);
+    if (time > lastTime) lastTime = time;
+  }
+  return lastTime;
 }
 
-// Función para cargar un script 
-async function loadScript(url) {
-            return new Promise((resolve, reject) => {
-                const script = document.createElement('script');
-                script.src = url;
-                script.onload = resolve;
-                script.onerror = reject;
-                document.head.appendChild(script);
+// Aviso mostrado en el bloque de un test en lugar de un diagrama
+function traceNotice(message) {
+  return $('<div class="alert alert-warning" role="alert"></div>').text(message)[0].outerHTML;
+}
+
+// Analiza la traza de un diff: devuelve el bloque WaveDrom (wavedrom, vacío si la traza es demasiado
+// larga, wavedromSkipped) y los datos de d3-wave (graph), o los errores que impidieron obtenerlos
+// (wavedromError, graphError). Nunca lanza excepciones.
+function parseTraceSync(text, waveform) {
+  const result = {wavedrom: "", wavedromSkipped: false, wavedromError: null, graph: null, graphError: null};
+  try {
+    if (traceLastTime(text) <= WAVEDROM_MAX_STEPS) {
+      result.wavedrom = parseHDL(text);
+    } else {
+      result.wavedromSkipped = true;
+    }
+  } catch (e) {
+    result.wavedromError = String(e);
+  }
+  try {
+    // Si el calificador envió el waveform precalculado no es necesario analizar el diff
+    result.graph = waveform ? waveformToWaveGraph(waveform) : buildWaveGraph(text);
+  } catch (e) {
+    result.graphError = String(e);
+  }
+  return result;
+}
+
+// Igual que parseTraceSync, en el worker si está disponible. Si el worker falla la traza no se vuelve a
+// analizar en el hilo principal (lo bloquearía justo con las trazas que el worker debía descargar): se
+// muestra el error
+function parseTrace(text, waveform) {
+  const worker = getTraceWorker();
+  if (!worker) return Promise.resolve(parseTraceSync(text, waveform));
+  const id = traceWorkerNextId++;
+  return new Promise((resolve, reject) => {
+    traceWorkerRequests.set(id, {resolve, reject});
+    worker.postMessage({id, text, waveform});
+  }).catch((e) => ({
+    wavedrom: "", wavedromSkipped: false, wavedromError: String(e), graph: null, graphError: String(e)
+  }));
+}
+
+// Empaqueta los datos de d3-wave para enviarlos desde el worker sin copiarlos: los tiempos y los
+// índices de los valores (en la tabla values) de todas las señales van en dos buffers transferibles
+function packWaveGraph(graph) {
+  let total = 0;
+  for (const group of graph.children) {
+    for (const signal of group.children) total += signal.data.length;
+  }
+  const times = new Float64Array(total);
+  const codes = new Uint32Array(total);
+  const values = [];
+  const valueCodes = new Map();
+  const signals = [];
+  let offset = 0;
+  graph.children.forEach((group, groupIndex) => {
+    for (const signal of group.children) {
+      signals.push({group: groupIndex, name: signal.name, type: signal.type, offset: offset, length: signal.data.length});
+      for (const [time, value] of signal.data) {
+        let code = valueCodes.get(value);
+        if (code === undefined) {
+          code = values.length;
+          values.push(value);
+          valueCodes.set(value, code);
+        }
+        times[offset] = time;
+        codes[offset] = code;
+        offset++;
+      }
+    }
+  });
+  return {
+    name: graph.name,
+    type: graph.type,
+    groups: graph.children.map((group) => ({name: group.name, type: group.type})),
+    signals: signals,
+    values: values,
+    times: times,
+    codes: codes
+  };
+}
+
+function unpackWaveGraph(packed) {
+  const children = packed.groups.map((group) => ({name: group.name, type: group.type, children: []}));
+  for (const signal of packed.signals) {
+    const data = new Array(signal.length);
+    for (let i = 0; i < signal.length; i++) {
+      data[i] = [packed.times[signal.offset + i], packed.values[packed.codes[signal.offset + i]]];
+    }
+    children[signal.group].children.push({name: signal.name, type: signal.type, data: data});
+  }
+  return {name: packed.name, type: packed.type, children: children};
+}
+
+// Convierte el waveform precalculado por el calificador (cambios de valor con tiempos
+// codificados como diferencias) a la estructura que usa d3-wave
+function waveformToWaveGraph(waveform) {
+    const resultJSON = {
+        name: "Results",
+        type: {
+            name: "struct"
+        },
+        children: [
+            {
+                name: "Inputs",
+                type: {
+                    name: "struct"
+                },
+                children: []
+            },
+            {
+                name: "Outputs",
+                type: {
+                    name: "struct"
+                },
+                children: []
+            }
+        ]
+    };
+
+    function decodeChanges(changes) {
+        const data = [];
+        let time = 0;
+        for (const [delta, value] of changes) {
+            time += delta;
+            data.push([time * waveform.time_scale, value.length > 1 ? 'b' + value : value]);
+        }
+        return data;
+    }
+
+    for (const signal of waveform.signals) {
+        if (signal.expected.length === 0) continue;
+        const group = resultJSON.children[signal.direction === "input" ? 0 : 1].children;
+        // Igual que en parseHDLToJSON: la señal sin '*' es la del estudiante y con '*' la esperada
+        group.push({
+            name: signal.name,
+            type: {
+                width: signal.width,
+                name: "wire"
+            },
+            // Un array vacío (el estudiante no produjo cambios) también es la señal del estudiante
+            data: decodeChanges(signal.student != null ? signal.student : signal.expected)
+        });
+        if (signal.student != null) {
+            group.push({
+                name: signal.name + '*',
+                type: {
+                    width: signal.width,
+                    name: "wire"
+                },
+                data: decodeChanges(signal.expected)
             });
         }
+    }
 
+    return resultJSON;
+}
 
 function parseHDLToJSON(diff) {
+    return JSON.stringify(buildWaveGraph(diff));
+}
+
+// Construye los datos de d3-wave a partir de las líneas del diff
+function buildWaveGraph(diff) {
     const lines = diff.split('\n');
  
     const inputs = new Map();
@@ -190,7 +691,7 @@ function parseHDLToJSON(diff) {
         resultJSON.children[1].children.push(outputJSON);
     }
  
-    return JSON.stringify(resultJSON, null, 2);
+    return resultJSON;
 }
  
  
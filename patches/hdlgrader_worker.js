@@ -0,0 +1,16 @@
+// Worker que analiza las trazas de los diffs HDL fuera del hilo principal (ver parseTrace en hdlgrader.js)
+importScripts("hdlgrader.js");
+
+self.onmessage = (event) => {
+  const {id, text, waveform} = event.data;
+  try {
+    const result = parseTraceSync(text, waveform);
+    const graph = result.graph ? packWaveGraph(result.graph) : null;
+    // Los buffers de la traza se transfieren, no se copian
+    self.postMessage({id, wavedrom: result.wavedrom, wavedromSkipped: result.wavedromSkipped,
+                      wavedromError: result.wavedromError, graph, graphError: result.graphError},
+                     graph ? [graph.times.buffer, graph.codes.buffer] : []);
+  } catch (e) {
+    self.postMessage({id, error: String(e)});
+  }
+};
@@ -4,20 +4,41 @@
 # more information about the licensing of this file.
 
 """ Tools to parse text """
+import copy
 import html
+import io
 import json
+import re
 from enum import IntEnum
 import gettext
 from datetime import datetime
 import collections
+import contextlib
+import hashlib
+import threading
 import tidylib
 from docutils import core, nodes, utils
-from docutils.parsers.rst import directives, Directive
+from docutils.parsers.rst import directives, Directive, Parser as RstParser
+from docutils.readers import standalone
 from docutils.statemachine import StringList
 from docutils.writers import html4css1
 import ast
+import builtins
 
 from inginious.frontend.accessible_time import parse_date
+from inginious.frontend.feedback_templates import escape_text, get_file_feedback, get_templates, \
+    render_test_case, render_test_case_details, render_test_case_summary
+from inginious.frontend.feedback_envelope import decode_feedback
+
+
+_render_state = threading.local()
+
+
+def _note_render_expiry(expires):
+    """ Records that the text being rendered must not be cached after the date expires """
+    current = getattr(_render_state, "expires", None)
+    if current is None or expires < current:
+        _render_state.expires = expires
 
 
 class HiddenUntilDirective(Directive, object):
@@ -40,6 +61,9 @@ class HiddenUntilDirective(Directive, object):
         translation = self.state.document.settings.translation
 
         after_deadline = hidden_until <= datetime.now()
+        if not after_deadline:
+            # The output changes once the date passes, so cached renders must expire then
+            _note_render_expiry(hidden_until)
         if after_deadline or force_show:
             output = []
 
@@ -122,6 +146,86 @@ class _CustomHTMLWriter(html4css1.Writer, object):
             return html4css1.HTMLTranslator.starttag(self, node, tagname, suffix, empty, **attributes)
 
 
+#  Text made only of these characters, with no line starting with whitespace, '.', '/' or '-', has no
+#  rst markup other than paragraphs. Lines made only of punctuation (section adornments) and list
+#  enumerators are checked separately.
+_PLAIN_TEXT = re.compile(r"[^\W_]|[ \n,.;!?'\"()%&/-]")
+_PLAIN_TEXT_LINE_START = re.compile(r"^[ ./-]", re.MULTILINE)
+_PLAIN_TEXT_ENUMERATOR = re.compile(r"^\(?[^\W_]+[.)](?:\s|$)", re.MULTILINE)
+_PLAIN_TEXT_ADORNMENT = re.compile(r"^[^\w\n]+$", re.MULTILINE)
+_PLAIN_TEXT_BLANK_LINES = re.compile(r"\n\n+")
+
+
+def _is_plain_text(string):
+    """ Returns True when the string is rendered by docutils as plain paragraphs """
+    stripped = "\n".join(line.rstrip(" ") for line in string.split("\n")).strip("\n")
+    return (len(_PLAIN_TEXT.sub("", stripped)) == 0 and not _PLAIN_TEXT_LINE_START.search(stripped)
+            and not _PLAIN_TEXT_ENUMERATOR.search(stripped) and not _PLAIN_TEXT_ADORNMENT.search(stripped))
+
+
+def _plain_text_to_html(string):
+    """ Renders a plain text string exactly as docutils does """
+    stripped = "\n".join(line.rstrip(" ") for line in string.split("\n")).strip("\n")
+    if not stripped:
+        return ""
+    paragraphs = _PLAIN_TEXT_BLANK_LINES.split(stripped)
+    return "".join("<p>" + paragraph.replace("&", "&amp;").replace('"', "&quot;") + "</p>\n"
+                   for paragraph in paragraphs)
+
+
+class RstRenderer(object):
+    """
+    Renders reStructuredText fragments reusing the docutils reader, parser, writer and settings,
+    which are otherwise rebuilt for each fragment. Text without markup is escaped directly.
+    Renderers are not thread-safe, get() returns the one of the current thread.
+    """
+
+    _local = threading.local()
+
+    def __init__(self, initial_header_level=3):
+        overrides = {
+            'report_level': utils.Reporter.SEVERE_LEVEL, #DEBUG_LEVEL,INFO_LEVEL,WARNING_LEVEL,ERROR_LEVEL,SEVERE_LEVEL, severe is chosen to avoid errors injected in the parsed text unless truly severe
+            'initial_header_level': initial_header_level,
+            'doctitle_xform': False,
+            'syntax_highlight': 'none',
+            'force_show_hidden_until': False,
+            'translation': gettext.NullTranslations(),
+            'math_output': 'MathJax'
+        }
+        self._parser = RstParser()
+        self._reader = standalone.Reader(parser=self._parser)
+        self._writer = _CustomHTMLWriter()
+        publisher = core.Publisher(self._reader, self._parser, self._writer)
+        publisher.process_programmatic_settings(None, overrides, None)
+        self._settings = publisher.settings
+
+    @classmethod
+    def get(cls, initial_header_level=3):
+        """ Returns the renderer of the current thread for the given initial header level """
+        renderers = getattr(cls._local, "renderers", None)
+        if renderers is None:
+            renderers = cls._local.renderers = {}
+        if initial_header_level not in renderers:
+            renderers[initial_header_level] = cls(initial_header_level)
+        return renderers[initial_header_level]
+
+    def render(self, string, show_everything=False, translation=gettext.NullTranslations()):
+        """ Renders a fragment, returns the same html as docutils.core.publish_parts """
+        if _is_plain_text(string):
+            return _plain_text_to_html(string)
+        settings = copy.copy(self._settings)
+        settings.force_show_hidden_until = show_everything
+        settings.translation = translation
+        settings.record_dependencies = utils.DependencyList()
+        parts = core.publish_parts(source=string, reader=self._reader, parser=self._parser, writer=self._writer,
+                                   settings=settings)
+        return parts['body_pre_docinfo'] + parts['fragment']
+
+    def render_batch(self, strings, show_everything=False, translation=gettext.NullTranslations()):
+        """ Renders a list of fragments """
+        return [self.render(string, show_everything, translation) for string in strings]
+
+
 class GraderResult(IntEnum):
     """
     Represents a result of the grader. Results are ordered by precedence (lower values override
@@ -138,9 +242,200 @@ class GraderResult(IntEnum):
     WRONG_ANSWER = 90
     ACCEPTED = 100
     
+class RenderCache(object):
+    """
+    Process-wide LRU cache of parsed texts, bounded by the total length of the stored renders.
+    Entries rendered from time-dependent content (hidden-until directive) expire at the
+    date where their output changes.
+    """
+
+    def __init__(self, max_size=64 * 2 ** 20):
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """ Returns the render stored for key, or None """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is not None and entry[1] <= datetime.now():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, parsed, expires=None, size=None):
+        """ Stores a render, evicting the least recently used ones if needed. size defaults to len(parsed) """
+        size = len(parsed) if size is None else size
+        if size > self.max_size:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (parsed, expires, size)
+            self.size += size
+            while self.size > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self.size -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        """ Returns the hit/miss counters and the current usage """
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries), "size": self.size}
+
+
+class _HTMLBuilder(object):
+    """
+    Writes html into a single buffer. Markup is written as is, text fields are escaped once and
+    truncated, with a marker, when they do not fit in the budget (number of characters).
+    """
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size
+        self.size = 0
+        self.truncated = False
+        self._buffer = io.StringIO()
+
+    def remaining(self):
+        """ Returns the number of characters that can still be written, None if unbounded """
+        return None if self.max_size is None else max(self.max_size - self.size, 0)
+
+    def is_full(self):
+        return self.max_size is not None and self.size >= self.max_size
+
+    def markup(self, markup):
+        """ Writes trusted html """
+        self._buffer.write(markup)
+        self.size += len(markup)
+
+    def text(self, text, max_size=None):
+        """ Writes an escaped text field, truncated to the remaining budget and to max_size """
+        remaining = self.remaining()
+        if max_size is not None:
+            remaining = max_size if remaining is None else min(remaining, max_size)
+        if remaining is not None:
+            # Escaping never shortens the text
+            text = text[:remaining + 1]
+        escaped = html.escape(text, quote=False)
+        if remaining is not None and len(escaped) > remaining:
+            escaped = escaped[:remaining]
+            # Do not cut an entity in half
+            entity_start = escaped.rfind("&", max(len(escaped) - 5, 0))
+            if entity_start != -1 and ";" not in escaped[entity_start:]:
+                escaped = escaped[:entity_start]
+            self.truncated = True
+            escaped += "\n" + _("... (truncated)")
+        self._buffer.write(escaped)
+        self.size += len(escaped)
+
+    def getvalue(self):
+        return self._buffer.getvalue()
+
+
+def _decode_client_grader_dump(dump, max_size):
+    """
+    Returns the functions or variables of a client grader test as a dict (name -> value).
+    Results store them as a dict, results stored before as the repr of a dict, which is
+    evaluated when it is not larger than max_size. Otherwise, or when it cannot be
+    evaluated, the raw text is returned as a single entry.
+    """
+    if isinstance(dump, dict):
+        return dump
+    if not dump:
+        return {}
+    if len(dump) <= max_size:
+        try:
+            decoded = ast.literal_eval(dump)
+        except (ValueError, SyntaxError, MemoryError, RecursionError):
+            decoded = None
+        if isinstance(decoded, dict):
+            return decoded
+    return {_("Raw dump"): dump}
+
+
+def _split_template(template, field):
+    """ Splits a template in the markup before and after the {field} placeholder """
+    before, _separator, after = template.partition("{" + field + "}")
+    return before, after
+
+
+def _translation_key(translation):
+    """ Identifies the language of a translation object """
+    if type(translation) is gettext.NullTranslations:
+        return ""
+    language = translation.info().get("language", "") if hasattr(translation, "info") else ""
+    return language or "{}:{}".format(type(translation).__name__, id(translation))
+
+
+#  Messages translated to identify the catalog of a builtin _ that is not a known translation object
+_LANGUAGE_PROBES = ("Toggle diff", "Expand test results", "**Compilation error**:\n\n", "{} more not shown",
+                    "... (truncated)")
+
+
+def _builtin_translation_key():
+    """
+    Identifies the catalog of the builtin _, which translates the json and dict templates. INGInious
+    installs the gettext method of the application, which uses the catalog of the session language.
+    """
+    translate = builtins.__dict__.get("_")
+    if translate is None:
+        return ""
+    owner = getattr(translate, "__self__", None)
+    if isinstance(owner, gettext.NullTranslations):
+        return _translation_key(owner)
+    get_translation_obj = getattr(owner, "get_translation_obj", None)
+    if get_translation_obj is not None:
+        return _translation_key(get_translation_obj())
+    # Any other function: its translations of the messages of the templates identify the catalog
+    return hashlib.sha1("\0".join(translate(message) for message in _LANGUAGE_PROBES).encode("utf-8")).hexdigest()
+
+
+#  Fills the lazy panels of the test cases with their details the first time they are expanded
+_LAZY_DETAILS_SCRIPT = """<script>
+if (!window.lazyDetailsLoaded) {
+    window.lazyDetailsLoaded = true;
+    $(document).on("show.bs.collapse", ".lazy-details", function (event) {
+        var panel = $(this);
+        if (event.target !== this || panel.data("loaded")) return;
+        panel.data("loaded", true);
+        panel.html('<i class="fa fa-spinner fa-pulse"></i>');
+        $.get(panel.data("details-url")).done(function (details) {
+            panel.html(details);
+        }).fail(function () {
+            panel.data("loaded", false);
+            panel.html('<p>""" + "{reload_message}" + """</p>');
+        });
+    });
+}
+</script>"""
+
+
 class ParsableText(object):
     """Allow to parse a string with different parsers"""
 
+    # Shared by all the instances. Set to None to disable the cache.
+    render_cache = RenderCache()
+    # Set by the feedback_details plugin, formatted with the id of the submission and the test index.
+    # When None, or when the submission is unknown (see rendering_submission), the details are always
+    # rendered with the summary lines.
+    lazy_details_url = None
+    # Minimum number of test cases of a feedback rendered in summary mode
+    lazy_details_min_cases = 0
+
     def __init__(self, content, mode="json", show_everything=False, translation=gettext.NullTranslations(),options={}):
         """
             content             The string to be parsed.
@@ -155,6 +450,19 @@ class ParsableText(object):
         self._translation = translation
         self._mode = mode
         self._show_everything = show_everything
+        self._options = options
+        # The details of the tests of the feedback of a submission can be requested by its id
+        self._submission_id = None
+        if mode == "json" and self.lazy_details_url is not None and options.get("lazy_details", True):
+            self._submission_id = getattr(_render_state, "submission_id", None)
+        # Budgets (number of characters) of the html of a notebook test and of a whole feedback
+        self.notebook_test_max_size = options.get("notebook_test_max_size", 2 ** 18)
+        self.feedback_max_size = options.get("feedback_max_size", 2 ** 22)
+        self._feedback_remaining = self.feedback_max_size
+        # Limits of the functions and variables of client grader tests
+        self.client_grader_max_items = options.get("client_grader_max_items", 50)
+        self.client_grader_item_max_size = options.get("client_grader_item_max_size", 2 ** 13)
+        self.client_grader_legacy_max_size = options.get("client_grader_legacy_max_size", 2 ** 20)
         
         #Strings variables to format json
         self.diff_max_lines = options.get("diff_max_lines", 100)
@@ -164,47 +472,78 @@ class ParsableText(object):
         self.show_input = options.get('show_input', False)
         self.is_staff = options.get("is_staff", False)
         
-        self.toggle_debug_info_template = ["""<ul><li><strong>Test {test_id}: {result_name} </strong>
-                                    <a class="btn btn-default btn-link btn-xs" role="button" data-toggle="collapse" 
-                                    href="#{panel_id}" aria-expanded="false" aria-controls="{panel_id}">""" +
-                                           _("Toggle diff") + """</a> <div class="collapse" id="{panel_id}">""",
-                                           """</div></li></ul>"""]
-        self.toggle_debug_info_template_for_staff = ["""<ul><li><strong>Test {test_id}: {result_name} </strong>
-                                    <a class="btn btn-default btn-link btn-xs" role="button" data-toggle="collapse" 
-                                    href="#{panel_id}" aria-expanded="false" aria-controls="{panel_id}">""" +
-                                           _("Toggle diff (only for staff)") + """</a> <div class="collapse" id="{panel_id}">""",
-                                           """</div></li></ul>"""]
-        self.input_template = _("""<p>Input preview: {title_input}</p>
-                                  <pre class="input-area" id="{block_id}-input">{input_text}</pre>
-                                  <div id="{title_input}_download_link"></div>
-                                  <script>createDownloadLink("{title_input}");</script>
-                                  """)
-        self.diff_template = """<pre id="{block_id}"></pre>
-                                <script>updateDiffBlock("{block_id}", `{diff_result}`);</script>"""
-        self.custom_feedback_template = _("""<p>Custom feedback</p><pre>{custom_feedback}</pre><br>""")
-        self.runtime_error_template = """<p>Error: </p><br><pre>{stderr}</pre>"""
-        self.not_debug_info_template = """<ul><li><strong>Test {0}: {1} </strong></li></ul>"""
+        self.templates = get_templates()
 
     def original_content(self):
         """ Returns the original content """
         return self._content
 
+    def _cache_key(self):
+        """ Key of the render cache: the content and everything in the viewer context affecting the render """
+        content = self._content
+        if not isinstance(content, str):
+            content = json.dumps(content, sort_keys=True, default=str)
+        context = json.dumps([self._mode, self._show_everything, self.is_staff, self._options, self.lazy_details_url,
+                              self.lazy_details_min_cases, self._submission_id], sort_keys=True, default=str)
+        return (hashlib.sha1(content.encode("utf-8")).hexdigest(), hashlib.sha1(context.encode("utf-8")).hexdigest(),
+                _translation_key(self._translation), _builtin_translation_key())
+
     def parse(self):
         """Returns parsed text"""
         if self._parsed is None:
-            try:
-                if self._mode == "html":
-                    self._parsed = self.html(self._content, self._show_everything, self._translation)
-                elif self._mode == "json":
-                    self._parsed = self.from_json(self._content, self._show_everything, self._translation)
-                elif self._mode == "dict":
-                    self._parsed = self.from_dict(self._content, self._show_everything, self._translation)
-                else:
-                    self._parsed = self.rst(self._content, self._show_everything, self._translation)
-            except:
-                self._parsed = self._translation.gettext("<b>Parsing failed</b>: <pre>{}</pre>").format(html.escape(self._content))
+            if self.render_cache is None:
+                self._parsed = self._render()
+            else:
+                cache_key = self._cache_key()
+                self._parsed = self.render_cache.get(cache_key)
+                if self._parsed is None:
+                    _render_state.expires = None
+                    self._parsed = self._render()
+                    self.render_cache.set(cache_key, self._parsed, _render_state.expires)
         return self._parsed
 
+    @classmethod
+    @contextlib.contextmanager
+    def rendering_submission(cls, submission_id):
+        """
+        Within the block, json feedbacks are rendered as the feedback of the submission submission_id
+        (in summary mode, with the details_url of the feedback_details plugin).
+        """
+        previous = getattr(_render_state, "submission_id", None)
+        _render_state.submission_id = None if submission_id is None else str(submission_id)
+        try:
+            yield
+        finally:
+            _render_state.submission_id = previous
+
+    def render_details(self, test_id):
+        """ Renders the content of the collapsible panel of the test with index test_id of a json feedback """
+        feedback = json.loads(decode_feedback(self._content))
+        if isinstance(feedback, dict):
+            return ""
+        debug_info = feedback.pop(-1)
+        self._load_feedback_options(feedback.pop(-1))
+        for case in feedback:
+            if case["i"] == test_id:
+                return self._case_to_html_block(case, debug_info, details_only=True) or ""
+        return ""
+
+    def _render(self):
+        """Parses the text with the parser of its mode"""
+        try:
+            # The feedback stored by the graders may be compressed in an envelope
+            content = decode_feedback(self._content) if isinstance(self._content, str) else self._content
+            if self._mode == "html":
+                return self.html(content, self._show_everything, self._translation)
+            elif self._mode == "json":
+                return self.from_json(content, self._show_everything, self._translation)
+            elif self._mode == "dict":
+                return self.from_dict(content, self._show_everything, self._translation)
+            else:
+                return self.rst(content, self._show_everything, self._translation)
+        except:
+            return self._translation.gettext("<b>Parsing failed</b>: <pre>{}</pre>").format(html.escape(self._content))
+
     def __str__(self):
         """Returns parsed text"""
         return self.parse()
@@ -253,43 +592,75 @@ class ParsableText(object):
         # The json list always have this structure
         # [ feedback_obj_test_cases , options_for_feedback , debug_info ]
         debug_info = feedback.pop(-1)
-        options = feedback.pop(-1)
+        self._load_feedback_options(feedback.pop(-1))
+
+        # In summary mode only the result line of each test is rendered, its details are requested when expanded
+        lazy = self._submission_id is not None and len(feedback) >= self.lazy_details_min_cases
 
-        self.diff_max_lines = options.get("diff_max_lines", 100)
-        self.diff_context_lines = options.get("diff_context_lines", 3)
-        self.output_diff_for = set(options.get("output_diff_for", []))
-        self.custom_feedback = options.get("custom_feedback", {})
-        self.show_input = options.get('show_input', False)
-        container_type = options.get("container_type","")
-        self.is_staff = options.get("is_staff", False)
-        
         feed_list = []
         for case in feedback:
-            i = case["i"]
-            if container_type == "multilang" or container_type == "hdl":
-                result = GraderResult(case["result"])
-                input_sample = case["input_sample"]
-                test = case["test_case"]
-                if container_type == "multilang":
-                    feed_list.append(self.to_html_block(i, result, test, input_sample, debug_info, self.is_staff))
-                elif container_type == "hdl":
-                    feed_list.append(self.hdl_to_html_block(i, result, test, input_sample, debug_info, self.is_staff))
-            elif container_type == "notebook":
-                test_result = case["test_result"]
-                weights = case["weights"]
-                show_debug_info = case["show_debug_info"]
-                test_custom_feedback = case["test_custom_feedback"]
-                feed_list.append(self.notebook_result_to_html_block(i, test_result, weights, show_debug_info, test_custom_feedback,self.is_staff))
-                
+            details_url = self.lazy_details_url.format(submission_id=self._submission_id,
+                                                       test_id=case["i"]) if lazy else None
+            html_block = self._case_to_html_block(case, debug_info, details_url=details_url)
+            if html_block is not None:
+                feed_list.append(html_block)
+        if show_everything and "metrics" in debug_info:
+            # The grading metrics are recorded for every submission, only the staff sees them
+            feed_list.append(self._metrics_to_html(debug_info["metrics"]))
+        if lazy:
+            feed_list.append(_LAZY_DETAILS_SCRIPT.replace("{reload_message}", html.escape(
+                _("The details could not be loaded, please reload the page."), quote=True)))
                     
         feedback_str = '\n\n'.join(feed_list) 
             
         return feedback_str
+
+    def _metrics_to_html(self, metrics):
+        """ Renders the wall time of the grading and of each of its phases (see hdl_metrics.summarize_phases) """
+        phases = ", ".join("{}: {:.2f} s".format(html.escape(str(name)), phase.get("wall", 0))
+                           for name, phase in metrics.get("phases", {}).items())
+        return "<p><small>{}</small></p>".format(html.escape(_("Grading time: {:.2f} s").format(
+            metrics.get("wall", 0))) + (" (" + phases + ")" if phases else ""))
+
+    def _load_feedback_options(self, options):
+        """ Loads the options stored by the grader in the json feedback """
+        self.diff_max_lines = options.get("diff_max_lines", 100)
+        self.diff_context_lines = options.get("diff_context_lines", 3)
+        self.output_diff_for = set(options.get("output_diff_for", []))
+        self.custom_feedback = options.get("custom_feedback", {})
+        self.show_input = options.get('show_input', False)
+        self.container_type = options.get("container_type","")
+        self.is_staff = options.get("is_staff", False)
+        self._feedback_remaining = self.feedback_max_size
+
+    def _case_to_html_block(self, case, debug_info, details_url=None, details_only=False):
+        """ Renders a test case of a json feedback, see to_html_block for details_url and details_only """
+        i = case["i"]
+        container_type = self.container_type
+        if container_type == "multilang" or container_type == "hdl":
+            result = GraderResult(case["result"])
+            input_sample = case["input_sample"]
+            test = case["test_case"]
+            if container_type == "multilang":
+                return self.to_html_block(i, result, test, input_sample, debug_info, self.is_staff,
+                                          details_url, details_only)
+            elif container_type == "hdl":
+                return self.hdl_to_html_block(i, result, test, input_sample, debug_info, self.is_staff,
+                                              details_url, details_only)
+        elif container_type == "notebook":
+            test_result = case["test_result"]
+            weights = case["weights"]
+            show_debug_info = case["show_debug_info"]
+            test_custom_feedback = case["test_custom_feedback"]
+            return self.notebook_result_to_html_block(i, test_result, weights, show_debug_info, test_custom_feedback,
+                                                      self.is_staff, details_url, details_only)
+        return None
     
     def escape_text(self, text):
-        return text.replace('\\', "\\\\").replace('`', "\\`").replace('\n', "\\n").replace("$", "\\$").replace('\t', "\\t")
+        return escape_text(text)
    
-    def to_html_block(self, test_id, result, test_case, input_sample, debug_info, is_staff):
+    def to_html_block(self, test_id, result, test_case, input_sample, debug_info, is_staff, details_url=None,
+                      details_only=False):
         """
         This method creates a html block for a single test case.
 
@@ -298,6 +669,9 @@ class ParsableText(object):
             - result: Represents the results for the feedback (check 'results.py')
             - test_case (tuple): A pair of names. The input filename and the expected output filename
             - debug_info (dict): Debugging information about the execution of the source code.
+            - details_url (str): When given, only the summary line is rendered, and the details
+            are loaded from this url when the test is expanded.
+            - details_only (bool): Renders only the details (the content of the collapsible panel).
 
         Returns:
             An string representing the html block to be presented in the feedback about 
@@ -305,58 +679,48 @@ class ParsableText(object):
         """
         input_filename = test_case[0]
         if result in [GraderResult.INTERNAL_ERROR] or input_filename not in self.output_diff_for and not self.is_staff:
-            text = self.not_debug_info_template.format(
+            if details_only:
+                return ""
+            text = self.templates.not_debug_info.format(
                 test_id + 1, result.name)
             
             return text
 
-        diff_result = debug_info.get("files_feedback", {}).get(input_filename, {}).get("diff", None)
-        stderr = debug_info.get("files_feedback", {}).get(input_filename, {}).get("stderr", "")
-        diff_available = diff_result is not None
-        
-        input_text = input_sample
-        template_info = {
-            "test_id": test_id + 1,
-            "result_name": result.name,
-            "panel_id": "collapseDiff" + str(test_id),
-            "block_id": "diffBlock" + str(test_id),
-            "input_text_id": "input_text_" + str(test_id),
-            "input_text": input_text,
-            "title_input": test_case[0]
-        }
-        template = [self.toggle_debug_info_template[0]] if not is_staff else [self.toggle_debug_info_template_for_staff[0]]
-
-        if input_filename in self.custom_feedback:
-            template_info["custom_feedback"] = self.custom_feedback[input_filename]
-            template.append(self.custom_feedback_template)
-
-        if self.show_input:
-            template.append(self.input_template)
-
-        if diff_available:
-            template_info["diff_result"] = self.escape_text(diff_result)
-            template.append(self.diff_template)
-
-        if GraderResult.RUNTIME_ERROR == result:
-            template_info["stderr"] = stderr
-            template.append(self.runtime_error_template)
-
-        template.append(self.toggle_debug_info_template[1])
-        diff_html = "".join(template).format(**template_info)
-        return diff_html
+        if details_url is not None:
+            return render_test_case_summary(self.templates, test_id, result.name, details_url, is_staff)
 
-    def hdl_to_html_block(self, test_id, result, test_case, input_sample, debug_info, is_staff):
-        html_block = self.to_html_block(test_id, result, test_case, input_sample, debug_info, is_staff)
+        file_feedback = get_file_feedback(debug_info, test_id, input_filename)
+        details = {
+            "diff_result": file_feedback.get("diff", None),
+            "stderr": file_feedback.get("stderr", "") if GraderResult.RUNTIME_ERROR == result else None,
+            "custom_feedback": self.custom_feedback.get(input_filename, None),
+            "show_input": self.show_input,
+        }
+        if details_only:
+            return render_test_case_details(self.templates, test_id, result.name, input_filename, input_sample,
+                                            **details)
+        return render_test_case(self.templates, test_id, result.name, input_filename, input_sample,
+                                is_staff=is_staff, **details)
+
+    def hdl_to_html_block(self, test_id, result, test_case, input_sample, debug_info, is_staff, details_url=None,
+                          details_only=False):
+        html_block = self.to_html_block(test_id, result, test_case, input_sample, debug_info, is_staff, details_url,
+                                        details_only)
         if html_block.find("updateDiffBlock") != -1:
             html_block = html_block.replace("updateDiffBlock", "updateWaveDromBlock")
+            # The grader precomputes the waveform, so the browser does not parse the diff for the viewer
+            waveform = get_file_feedback(debug_info, test_id, test_case[0]).get("waveform", None)
+            if waveform is not None:
+                waveform_js = json.dumps(waveform, separators=(',', ':')).replace("</", "<\\/")
+                html_block = html_block.replace("`);</script>", "`, " + waveform_js + ");</script>", 1)
         return html_block
 
     def client_grader_result_to_html_block(self, test):
         """Parse each test of client grader submissions into html"""
 
-        test_functions = ast.literal_eval(test["functions"])
+        test_functions = _decode_client_grader_dump(test.get("functions"), self.client_grader_legacy_max_size)
         
-        test_variables = ast.literal_eval(test["variables"])
+        test_variables = _decode_client_grader_dump(test.get("variables"), self.client_grader_legacy_max_size)
 
         test_name_template_html = [
             _("""<ul class="list_disc" style="font-size:12px;"><li>
@@ -383,18 +747,12 @@ class ParsableText(object):
 
         if len(test_functions) > 0:
             result_html.append(test_functions_template_html[0])
-            for function in test_functions:
-                function_def = _("<strong>" + str(function) + """: </strong><pre class="language-python"><code
-                class="language-python" data-language="python">""" + str(test_functions[function]) + """</code></pre>""")
-                result_html.append(function_def)
+            result_html.append(self._client_grader_items_to_html(test_functions))
             result_html.append(test_functions_template_html[1])
 
         if len(test_variables) > 0:
             result_html.append(test_variables_template_html[0])
-            for variable in test_variables:
-                variable_def = _("<strong>" + str(variable) + """: </strong><pre class="language-python"><code
-                class="language-python" data-language="python">""" + str(test_variables[variable]) + """</code></pre>""")
-                result_html.append(variable_def)
+            result_html.append(self._client_grader_items_to_html(test_variables))
             result_html.append(test_variables_template_html[1])
 
         result_html.append(test_results_template_html[1])
@@ -403,7 +761,31 @@ class ParsableText(object):
 
         return result_html
 
-    def notebook_result_to_html_block(self, test_id, test_result, weight, show_debug_info, test_custom_feedback, is_staff):
+    def _client_grader_items_to_html(self, items):
+        """ Renders the functions or variables of a client grader test, within the size limits """
+        builder = _HTMLBuilder()
+        for position, (name, value) in enumerate(items.items()):
+            if self.client_grader_max_items is not None and position >= self.client_grader_max_items:
+                builder.markup("<p><i>" + html.escape(_("{} more not shown").format(len(items) - position)) + "</i></p>")
+                break
+            builder.markup("<strong>")
+            builder.text(str(name), self.client_grader_item_max_size)
+            builder.markup(""": </strong><pre class="language-python"><code
+                class="language-python" data-language="python">""")
+            builder.text(value if isinstance(value, str) else str(value), self.client_grader_item_max_size)
+            builder.markup("""</code></pre>""")
+        return builder.getvalue()
+
+    def notebook_result_to_html_block(self, test_id, test_result, weight, show_debug_info, test_custom_feedback, is_staff,
+                                      details_url=None, details_only=False):
+        """
+        Creates the html block of a notebook test. When details_url is given only the summary line is
+        rendered, and the debug info of the cases is loaded from the url when expanded. When details_only
+        is True, only the content of the collapsible panel is rendered.
+
+        The html is written into a single buffer, escaping each field once. The debug info is truncated
+        when the block exceeds notebook_test_max_size or the feedback exceeds feedback_max_size.
+        """
         cases_debug_info = test_result["cases"]
 
         template_info = {
@@ -414,7 +796,12 @@ class ParsableText(object):
             "block_id": "debugBlock" + str(test_id),
             "weight": weight,
             "total": "%.2f" % test_result["total"],
+            "details_url": details_url,
         }
+        if details_url is None:
+            panel_template_html = """<div class="collapse" id="{panel_id}">"""
+        else:
+            panel_template_html = """<div class="collapse lazy-details" id="{panel_id}" data-details-url="{details_url}">"""
         test_name_template_html = [
             """<ul class="list_disc" style="font-size:12px;"><li>
             <strong style="font-size:15px"> {test_name}: </strong><i>{result_name} - {total} / {weight} </i>""",
@@ -424,14 +811,14 @@ class ParsableText(object):
             """<a class="btn btn-default btn-link btn-xs" role="button"
             data-toggle="collapse" href="#{panel_id}" aria-expanded="false" aria-controls="{panel_id}">""" +
             _("Expand test results") +
-            """</a><div class="collapse" id="{panel_id}">""",
+            """</a>""" + panel_template_html,
             "</div>"
         ]
         test_results_template_for_staff_html = [
             """<a class="btn btn-default btn-link btn-xs" role="button"
             data-toggle="collapse" href="#{panel_id}" aria-expanded="false" aria-controls="{panel_id}">""" +
             _("Expand test results (only for staff)") +
-            """</a><div class="collapse" id="{panel_id}">""",
+            """</a>""" + panel_template_html,
             "</div>"
         ]
 
@@ -454,50 +841,72 @@ class ParsableText(object):
                                     'class="language-python" data-language="python">{case_code}</code></pre>' +
                                     '<script>highlight_code();</script>')
 
-        result_html = [test_name_template_html[0]]
-        if cases_debug_info and show_debug_info:
-            result_html.append(test_results_template_html[0] if not is_staff else test_results_template_for_staff_html[0])
-            if test_custom_feedback:
-                template_info['custom_feedback'] = test_custom_feedback
-                result_html.append(test_custom_feedback_template_html)
-            cases_debug_info_sorted = collections.OrderedDict(sorted(cases_debug_info.items()))
-            for i, case_debug_info in cases_debug_info_sorted.items():
-                debug_info = []
-                if case_debug_info["is_runtime_error"]:
-                    debug_info.append(test_case_error_template_html.format(case_error=case_debug_info["error"]).
-                                    replace("{", "{{").replace("}", "}}"))
-                if "case_code" in case_debug_info:
-                    debug_info.append(test_case_executed_code.format(
-                        case_code=case_debug_info["case_code"].replace("{", "{{").replace("}", "}}")))
-                if not case_debug_info["is_runtime_error"]:
-                    case_output_diff = case_debug_info["case_output_diff"].replace("/n", "\n").replace("<", "&lt;"). \
-                        replace("{", "{{").replace("}", "}}")
-                    debug_info.append(test_case_wrong_answer_template_html.format(case_output_diff=case_output_diff.
-                                                                                replace("{", "{{").replace("}", "}}")))
-                case_data = {
-                    "case_id": i,
-                    "case_panel_id": "collapse_debug_test_%s_case_%s" % (str(test_id), str(i)),
-                    "debug_info": ''.join(debug_info).replace("{", "{{").replace("}", "}}")
-                }
-                result_html.append(test_case_debug_info_template_html.format(**case_data) if not is_staff else test_case_debug_info_template_for_staff_html.format(**case_data))
-            result_html.append(test_results_template_html[1] if not is_staff else test_results_template_for_staff_html[1])
-
-        result_html.append(test_name_template_html[1])
-        result_html = ''.join(result_html).format(**template_info)
-
-        return result_html
+        if not (cases_debug_info and show_debug_info):
+            if details_only:
+                return ""
+            return ''.join(test_name_template_html).format(**template_info)
+
+        results_template_html = test_results_template_html if not is_staff else test_results_template_for_staff_html
+        summary_before = (test_name_template_html[0] + results_template_html[0]).format(**template_info)
+        summary_after = (results_template_html[1] + test_name_template_html[1]).format(**template_info)
+        if details_url is not None:
+            return summary_before + summary_after
+
+        max_size = self.notebook_test_max_size
+        if self._feedback_remaining is not None:
+            max_size = self._feedback_remaining if max_size is None else min(max_size, self._feedback_remaining)
+        builder = _HTMLBuilder(max_size)
+        if not details_only:
+            builder.markup(summary_before)
+
+        if test_custom_feedback:
+            before, after = _split_template(test_custom_feedback_template_html, "custom_feedback")
+            builder.markup(before)
+            builder.text(test_custom_feedback)
+            builder.markup(after)
+
+        case_template_html = test_case_debug_info_template_html if not is_staff else test_case_debug_info_template_for_staff_html
+        case_before, case_after = _split_template(case_template_html, "debug_info")
+        error_before, error_after = _split_template(test_case_error_template_html, "case_error")
+        code_before, code_after = _split_template(test_case_executed_code, "case_code")
+        diff_before, diff_after = _split_template(test_case_wrong_answer_template_html, "case_output_diff")
+        cases_debug_info_sorted = sorted(cases_debug_info.items())
+        for position, (i, case_debug_info) in enumerate(cases_debug_info_sorted):
+            if builder.is_full():
+                builder.markup("<p><i>" + html.escape(_("{} more cases not shown").format(
+                    len(cases_debug_info_sorted) - position)) + "</i></p>")
+                break
+            case_data = {
+                "case_id": i,
+                "case_panel_id": "collapse_debug_test_%s_case_%s" % (str(test_id), str(i)),
+            }
+            builder.markup(case_before.format(**case_data))
+            if case_debug_info["is_runtime_error"]:
+                builder.markup(error_before)
+                builder.text(case_debug_info["error"])
+                builder.markup(error_after)
+            if "case_code" in case_debug_info:
+                builder.markup(code_before)
+                builder.text(case_debug_info["case_code"])
+                builder.markup(code_after)
+            if not case_debug_info["is_runtime_error"]:
+                builder.markup(diff_before)
+                builder.text(case_debug_info["case_output_diff"].replace("/n", "\n"))
+                builder.markup(diff_after)
+            builder.markup(case_after.format(**case_data))
+
+        if not details_only:
+            builder.markup(summary_after)
+        if self._feedback_remaining is not None:
+            self._feedback_remaining = max(self._feedback_remaining - builder.size, 0)
+        return builder.getvalue()
    
     @classmethod
     def rst(cls, string, show_everything=False, translation=gettext.NullTranslations(), initial_header_level=3):
         """Parses reStructuredText"""
-        overrides = {
-            'report_level': utils.Reporter.SEVERE_LEVEL, #DEBUG_LEVEL,INFO_LEVEL,WARNING_LEVEL,ERROR_LEVEL,SEVERE_LEVEL, severe is chosen to avoid errors injected in the parsed text unless truly severe
-            'initial_header_level': initial_header_level,
-            'doctitle_xform': False,
-            'syntax_highlight': 'none',
-            'force_show_hidden_until': show_everything,
-            'translation': translation,
-            'math_output': 'MathJax'
-        }
-        parts = core.publish_parts(source=string, writer=_CustomHTMLWriter(), settings_overrides=overrides)
-        return parts['body_pre_docinfo'] + parts['fragment']
+        return RstRenderer.get(initial_header_level).render(string, show_everything, translation)
+
+    @classmethod
+    def rst_batch(cls, strings, show_everything=False, translation=gettext.NullTranslations(), initial_header_level=3):
+        """Parses a list of reStructuredText fragments, returns the list of renders"""
+        return RstRenderer.get(initial_header_level).render_batch(strings, show_everything, translation)
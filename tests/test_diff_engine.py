@@ -0,0 +1,111 @@
+"""
+Tests of diff_engine against difflib.unified_diff.
+
+On simulation traces (lines mostly unique, thanks to the times) both produce the same
+hunks. On arbitrary lines the patience algorithm may choose other matching lines than
+difflib, so only the validity of the diff is checked.
+"""
+
+import difflib
+import os
+import random
+import re
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+import environment  # noqa: E402
+
+environment.setup()
+
+import generators  # noqa: E402
+import diff_engine  # noqa: E402
+
+_HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@$")
+
+
+def _apply(a, diff):
+    """ Rebuilds b from a and the unified diff, checking the context and removed lines against a """
+    b = []
+    position = 0
+    for line in diff[2:]:
+        match = _HUNK_HEADER.match(line.rstrip("\n"))
+        if match:
+            start = int(match.group(1))
+            start = start - 1 if match.group(2) != "0" else start
+            b.extend(a[position:start])
+            position = start
+        elif line[0] == "+":
+            b.append(line[1:])
+        else:
+            assert a[position] == line[1:], "line {} is not {!r}".format(position, line[1:])
+            if line[0] == " ":
+                b.append(line[1:])
+            position += 1
+    b.extend(a[position:])
+    return b
+
+
+class DiffEngineTest(unittest.TestCase):
+
+    def assertSameDiff(self, a, b, n=3):
+        self.assertEqual(list(diff_engine.unified_diff(a, b, n=n)), list(difflib.unified_diff(a, b, n=n)))
+
+    def test_edge_cases(self):
+        cases = {
+            "empty": ([], []),
+            "empty expected": ([], ["T, 0, OUTPUTS, y, 1\n"]),
+            "empty actual": (["T, 0, OUTPUTS, y, 1\n"], []),
+            "identical": (["a\n", "b\n", "c\n"], ["a\n", "b\n", "c\n"]),
+            "only insertions": (["a\n", "c\n", "e\n"], ["a\n", "b\n", "c\n", "d\n", "e\n", "f\n"]),
+            "only deletions": (["a\n", "b\n", "c\n", "d\n", "e\n", "f\n"], ["b\n", "d\n", "e\n"]),
+            "trailing newline": (["a\n", "b\n"], ["a\n", "b"]),
+            "no context": (["a\n", "b\n", "c\n"], ["a\n", "x\n", "c\n"]),
+        }
+        for name, (a, b) in cases.items():
+            with self.subTest(name):
+                self.assertSameDiff(a, b)
+                self.assertSameDiff(a, b, n=0)
+
+    def test_identical_input_has_no_diff(self):
+        trace = generators.hdl_trace(random.Random(1), 10000).splitlines(True)
+        self.assertEqual(list(diff_engine.unified_diff(trace, list(trace))), [])
+
+    def test_mutated_traces(self):
+        for seed in range(20):
+            with self.subTest(seed=seed):
+                rng = random.Random(seed)
+                trace = generators.hdl_trace(rng, 20000)
+                mutated = generators.mutate_trace(rng, trace, rng.choice((0.001, 0.02, 0.2)))
+                self.assertSameDiff(trace.splitlines(True), mutated.splitlines(True))
+
+    def test_traces_with_inserted_and_deleted_lines(self):
+        for seed in range(20):
+            with self.subTest(seed=seed):
+                rng = random.Random(seed)
+                expected = generators.hdl_trace(rng, 5000).splitlines(True)
+                actual = list(expected)
+                for _edit in range(5):
+                    row = rng.randrange(len(actual))
+                    edit = rng.random()
+                    if edit < 1 / 3:
+                        del actual[row]
+                    elif edit < 2 / 3:
+                        actual.insert(row, "T, {}, INPUTS, a, 1, OUTPUTS, y, 0\n".format(rng.randint(0, 10 ** 6)))
+                    else:
+                        actual[row] = actual[row].replace("y, 0", "y, 1")
+                self.assertSameDiff(expected, actual)
+
+    def test_random_lines_give_a_valid_diff(self):
+        for seed in range(200):
+            with self.subTest(seed=seed):
+                rng = random.Random(seed)
+                a = [rng.choice("abcde") + "\n" for _line in range(rng.randint(0, 40))]
+                b = [rng.choice("abcde") + "\n" for _line in range(rng.randint(0, 40))]
+                diff = list(diff_engine.unified_diff(a, b, n=rng.randint(0, 3)))
+                self.assertEqual(_apply(a, diff), b)
+                self.assertEqual(diff == [], a == b)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+"""
+Tests of the feedback envelopes of feedback_envelope.
+"""
+
+import base64
+import json
+import os
+import sys
+import unittest
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+import environment  # noqa: E402
+
+environment.setup()
+
+import feedback_envelope  # noqa: E402
+from feedback_envelope import encode_feedback, decode_feedback, is_envelope, EnvelopeError  # noqa: E402
+
+FEEDBACK = json.dumps([{"i": i, "result": 100, "test_case": ["tb.vhd", "out.txt"], "input_sample": "ñ → µ"}
+                       for i in range(200)])
+
+
+def _envelope(codec, data, size=None, payload_size=None, version=1):
+    """ An envelope with the given header, the data being compressed with zlib unless the codec is identity """
+    if codec == "identity":
+        payload = data.decode("utf-8")
+        compressed_size = len(data)
+    else:
+        compressed = zlib.compress(data)
+        payload = base64.b64encode(compressed).decode("ascii")
+        compressed_size = len(compressed)
+    return "UNCODE-FEEDBACK/{} {} {} {}\n{}".format(
+        version, codec, len(data) if size is None else size,
+        compressed_size if payload_size is None else payload_size, payload)
+
+
+class RoundTripTest(unittest.TestCase):
+
+    def test_zlib(self):
+        envelope = encode_feedback(FEEDBACK, "zlib")
+        self.assertTrue(envelope.startswith("UNCODE-FEEDBACK/1 zlib "))
+        self.assertLess(len(envelope), len(FEEDBACK))
+        self.assertEqual(decode_feedback(envelope), FEEDBACK)
+
+    @unittest.skipIf(feedback_envelope.zstandard is None, "zstandard is not installed")
+    def test_zstd(self):
+        envelope = encode_feedback(FEEDBACK, "zstd")
+        self.assertTrue(envelope.startswith("UNCODE-FEEDBACK/1 zstd "))
+        self.assertEqual(decode_feedback(envelope), FEEDBACK)
+
+    @unittest.skipIf(feedback_envelope.zstandard is not None, "zstandard is installed")
+    def test_zstd_falls_back_to_zlib(self):
+        envelope = encode_feedback(FEEDBACK, "zstd")
+        self.assertTrue(envelope.startswith("UNCODE-FEEDBACK/1 zlib "))
+        self.assertEqual(decode_feedback(envelope), FEEDBACK)
+
+    def test_identity(self):
+        envelope = encode_feedback(FEEDBACK, "identity")
+        self.assertEqual(envelope.partition("\n")[2], FEEDBACK)
+        self.assertEqual(decode_feedback(envelope), FEEDBACK)
+
+    def test_short_feedback_is_not_compressed(self):
+        envelope = encode_feedback("[]", "zlib")
+        self.assertTrue(envelope.startswith("UNCODE-FEEDBACK/1 identity 2 2\n"))
+        self.assertEqual(decode_feedback(envelope), "[]")
+
+    def test_text_without_envelope(self):
+        self.assertFalse(is_envelope(FEEDBACK))
+        self.assertEqual(decode_feedback(FEEDBACK), FEEDBACK)
+
+    def test_unknown_codec_is_not_encoded(self):
+        with self.assertRaises(ValueError):
+            encode_feedback(FEEDBACK, "lzma")
+
+
+class RejectionTest(unittest.TestCase):
+
+    data = FEEDBACK.encode("utf-8")
+
+    def assertRejected(self, envelope, **options):
+        with self.assertRaises(EnvelopeError):
+            decode_feedback(envelope, **options)
+
+    def test_valid_envelope(self):
+        self.assertEqual(decode_feedback(_envelope("zlib", self.data)), FEEDBACK)
+
+    def test_unknown_version(self):
+        self.assertRejected(_envelope("zlib", self.data, version=2))
+
+    def test_unknown_codec(self):
+        self.assertRejected(_envelope("zlib", self.data).replace(" zlib ", " lzma ", 1))
+
+    def test_malformed_header(self):
+        self.assertRejected("UNCODE-FEEDBACK/1 zlib\n")
+
+    def test_truncated_base64(self):
+        envelope = _envelope("zlib", self.data)
+        self.assertRejected(envelope[:-3])
+        self.assertRejected(envelope[:len(envelope) // 2])
+
+    def test_truncated_compressed_payload(self):
+        compressed = zlib.compress(self.data)[:-10]
+        self.assertRejected("UNCODE-FEEDBACK/1 zlib {} {}\n{}".format(
+            len(self.data), len(compressed), base64.b64encode(compressed).decode("ascii")))
+
+    def test_oversized_feedback(self):
+        self.assertRejected(_envelope("zlib", self.data), max_size=len(self.data) - 1)
+        self.assertRejected(_envelope("identity", self.data), max_size=len(self.data) - 1)
+
+    def test_payload_larger_than_its_header(self):
+        # A payload inflating to more bytes than the header declares is never inflated in full
+        bomb = b"0" * (2 ** 24)
+        self.assertRejected(_envelope("zlib", bomb, size=1000), max_size=2000)
+        self.assertRejected(_envelope("identity", self.data, size=1000), max_size=2000)
+
+
+if __name__ == "__main__":
+    unittest.main()
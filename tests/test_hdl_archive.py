@@ -0,0 +1,90 @@
+"""
+Tests of the extraction of the uploaded projects by hdl_archive.
+"""
+
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+import environment  # noqa: E402
+
+environment.setup()
+
+from hdl_archive import extract_sources, ArchiveError  # noqa: E402
+
+
+def _zip(files, compression=zipfile.ZIP_DEFLATED):
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, "w", compression) as archive:
+        for name, content in files.items():
+            archive.writestr(name, content)
+    return data.getvalue()
+
+
+class ExtractSourcesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _read(self, path):
+        with open(os.path.join(self.directory, path)) as extracted:
+            return extracted.read()
+
+    def test_sources_and_data_files(self):
+        extracted = extract_sources(_zip({
+            "design.v": "module design; endmodule",
+            "rtl/alu.VHD": "entity alu is end;",
+            "rom.mem": "00\nff\n",
+            "vectors/inputs.txt": "0 1\n",
+            "notes.pdf": "%PDF",
+            "build/design.vvp": "#! vvp",
+        }), self.directory)
+        self.assertEqual(sorted(extracted), ["design.v", "rom.mem", "rtl/alu.VHD", "vectors/inputs.txt"])
+        self.assertEqual(self._read("rom.mem"), "00\nff\n")
+        self.assertFalse(os.path.exists(os.path.join(self.directory, "notes.pdf")))
+
+    def test_custom_extensions(self):
+        extracted = extract_sources(_zip({"design.v": "", "rom.mem": ""}), self.directory, extensions=(".v",))
+        self.assertEqual(extracted, ["design.v"])
+
+    def test_unsafe_paths_are_skipped(self):
+        extracted = extract_sources(_zip({"../escape.v": "", "/absolute.v": "", "c:design.v": "", "ok.v": ""}),
+                                    self.directory)
+        self.assertEqual(extracted, ["ok.v"])
+        self.assertEqual(os.listdir(self.directory), ["ok.v"])
+
+    def test_task_files_take_precedence(self):
+        with open(os.path.join(self.directory, "testbench.v"), "w") as task_file:
+            task_file.write("task")
+        extracted = extract_sources(_zip({"testbench.v": "student", "design.v": ""}), self.directory)
+        self.assertEqual(extracted, ["design.v"])
+        self.assertEqual(self._read("testbench.v"), "task")
+
+    def test_max_files(self):
+        files = {"unit{}.v".format(index): "" for index in range(4)}
+        files["skipped.pdf"] = ""
+        self.assertEqual(len(extract_sources(_zip(files), self.directory, max_files=4)), 4)
+        with self.assertRaises(ArchiveError):
+            extract_sources(_zip(files), tempfile.mkdtemp(dir=self.directory), max_files=3)
+
+    def test_max_size(self):
+        files = {"a.v": "x" * 600, "b.mem": "x" * 400, "skipped.pdf": "x" * 4000}
+        self.assertEqual(len(extract_sources(_zip(files), self.directory, max_size=1000)), 2)
+        with self.assertRaises(ArchiveError):
+            extract_sources(_zip(files), tempfile.mkdtemp(dir=self.directory), max_size=999)
+
+    def test_not_a_zip_file(self):
+        with self.assertRaises(ArchiveError):
+            extract_sources(b"module design; endmodule", self.directory)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+"""
+Tests of the eviction of the DirectoryCache of hdl_cache.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+import environment  # noqa: E402
+
+environment.setup()
+
+from hdl_cache import DirectoryCache  # noqa: E402
+
+
+def _builder(size):
+    def build(directory):
+        with open(os.path.join(directory, "work.cf"), "w") as library:
+            library.write("x" * size)
+    return build
+
+
+class DirectoryCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _age(self, path, seconds):
+        past = time.time() - seconds
+        os.utime(path, (past, past))
+
+    def test_entries_in_use_are_not_evicted(self):
+        cache = DirectoryCache(self.directory, max_size=150, grace_period=60)
+        first = cache.get_or_create("first", _builder(100))
+        second = cache.get_or_create("second", _builder(100))
+        # Both were used within the grace period, the cache stays over max_size
+        self.assertTrue(os.path.isdir(first))
+        self.assertTrue(os.path.isdir(second))
+
+    def test_least_recently_used_entry_is_evicted_after_the_grace_period(self):
+        cache = DirectoryCache(self.directory, max_size=150, grace_period=60)
+        first = cache.get_or_create("first", _builder(100))
+        self._age(first, 120)
+        second = cache.get_or_create("second", _builder(100))
+        self.assertFalse(os.path.exists(first))
+        self.assertTrue(os.path.isdir(second))
+        self.assertEqual(os.listdir(self.directory), ["second"])
+
+    def test_reading_an_entry_renews_it(self):
+        cache = DirectoryCache(self.directory, max_size=150, grace_period=60)
+        first = cache.get_or_create("first", _builder(100))
+        self._age(first, 120)
+        self.assertEqual(cache.get_or_create("first", _builder(100)), first)
+        cache.get_or_create("second", _builder(100))
+        self.assertTrue(os.path.isdir(first))
+
+    def test_failed_builder_leaves_no_entry(self):
+        cache = DirectoryCache(self.directory)
+
+        def build(directory):
+            raise RuntimeError("compilation failed")
+
+        with self.assertRaises(RuntimeError):
+            cache.get_or_create("first", build)
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,176 @@
+"""
+Tests of the projects of hdl_projects and of their limits in HDLGrader, with fake iverilog
+and vvp commands.
+
+The fake iverilog writes the sources to the output file, and the fake vvp prints the lines
+of the sources starting with OUT. A source can also make the simulation loop forever, exit
+with a return code, print invalid UTF-8 or flood its output.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+import environment  # noqa: E402
+
+environment.setup()
+
+from graders import HDLGrader  # noqa: E402
+from hdl_projects import create_split_project, OutputLimitExceeded  # noqa: E402
+from results import GraderResult  # noqa: E402
+
+FAKE_IVERILOG = """
+import sys
+output = sys.argv[sys.argv.index("-o") + 1]
+sources = [argument for argument in sys.argv[1:] if argument.endswith(".v")]
+with open(output, "w") as output_file:
+    for source in sources:
+        with open(source) as source_file:
+            output_file.write(source_file.read() + "\\n")
+"""
+
+FAKE_VVP = """
+import sys, time
+with open(sys.argv[-1]) as simulation:
+    lines = simulation.read().splitlines()
+for line in lines:
+    if line.startswith("OUT "):
+        print(line[4:], flush=True)
+    elif line == "LOOP":
+        while True:
+            time.sleep(0.05)
+    elif line == "INVALID":
+        sys.stdout.buffer.write(b"bad \\xff byte\\n")
+    elif line == "FLOOD":
+        sys.stdout.write("x" * (2 ** 20))
+    elif line.startswith("EXIT "):
+        sys.exit(int(line[5:]))
+"""
+
+FILE_NAMES = {"students_code": "design", "testbench": "testbench", "teachers_code": "golden_model"}
+
+
+class Request:
+    def __init__(self, code):
+        self.problem_id = "p"
+        self.code = code
+        self.language_name = "verilog"
+        self.problem_type = "code_multiple_languages"
+        self.is_staff = False
+
+
+class SilentGrader(HDLGrader):
+    def publish_feedback(self, feedback_info):
+        pass
+
+
+class FakeSimulatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        bin_directory = os.path.join(self.directory, "bin")
+        os.mkdir(bin_directory)
+        for name, script in (("iverilog", FAKE_IVERILOG), ("vvp", FAKE_VVP)):
+            path = os.path.join(bin_directory, name)
+            with open(path, "w") as script_file:
+                script_file.write("#!" + sys.executable + "\n" + textwrap.dedent(script))
+            os.chmod(path, 0o755)
+        self.path = os.environ["PATH"]
+        os.environ["PATH"] = bin_directory + os.pathsep + self.path
+
+    def tearDown(self):
+        os.environ["PATH"] = self.path
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, "w") as source:
+            source.write(content)
+        return path
+
+
+class SplitProjectTest(FakeSimulatorTest):
+
+    def _project(self, design, golden="OUT 1", **limits):
+        project_directory = os.path.join(self.directory, "project")
+        os.mkdir(project_directory)
+        for name, content in (("design.v", design), ("golden_model.v", golden), ("testbench.v", "")):
+            with open(os.path.join(project_directory, name), "w") as source:
+                source.write(content)
+        project = create_split_project("verilog", project_directory, FILE_NAMES, None, **limits)
+        project.build()
+        return project
+
+    def test_runs_the_simulations_apart(self):
+        project = self._project("OUT 0")
+        self.assertEqual(project.run_golden(None), (0, "1\n", ""))
+        self.assertEqual(project.run_design(None), (0, "0\n", ""))
+
+    def test_invalid_utf8_is_replaced(self):
+        return_code, stdout, _stderr = self._project("INVALID").run_design(None)
+        self.assertEqual(return_code, 0)
+        self.assertEqual(stdout, "bad � byte\n")
+
+    def test_return_code(self):
+        self.assertEqual(self._project("OUT 0\nEXIT 3").run_design(None), (3, "0\n", ""))
+
+    def test_looping_simulation_is_killed(self):
+        project = self._project("LOOP", time_limit=0.5)
+        start = time.monotonic()
+        with self.assertRaises(subprocess.TimeoutExpired):
+            project.run_design(None)
+        self.assertLess(time.monotonic() - start, 5)
+
+    def test_long_output_is_killed(self):
+        project = self._project("FLOOD\nLOOP", max_output_size=2 ** 16)
+        with self.assertRaises(OutputLimitExceeded):
+            project.run_design(None)
+
+
+class GraderLimitsTest(FakeSimulatorTest):
+
+    def _grade(self, design, golden="OUT 1", **options):
+        options = dict({"golden_cache_dir": os.path.join(self.directory, "cache"), "cache_results": False},
+                       **options)
+        grader = SilentGrader(Request(design), options)
+        test_case = (self.write("tb.v", ""), self.write("golden.v", golden))
+        return grader, grader.grade_test_case(test_case)
+
+    def test_accepted(self):
+        _grader, test_result = self._grade("OUT 1")
+        self.assertEqual(test_result["result"], GraderResult.ACCEPTED)
+
+    def test_time_limit_exceeded(self):
+        _grader, test_result = self._grade("LOOP", time_limit=0.5)
+        self.assertEqual(test_result["result"], GraderResult.TIME_LIMIT_EXCEEDED)
+
+    def test_output_limit_exceeded(self):
+        _grader, test_result = self._grade("FLOOD", simulation_max_output=2 ** 16)
+        self.assertEqual(test_result["result"], GraderResult.OUTPUT_LIMIT_EXCEEDED)
+
+    def test_streamed_simulation_time_limit_exceeded(self):
+        # The first grading caches the golden output, the second one streams the student's simulation
+        self._grade("OUT 1")
+        _grader, test_result = self._grade("OUT 1\nLOOP", streaming_comparison=True, time_limit=0.5)
+        self.assertEqual(test_result["debug_info"]["stream"]["stopped_reason"], "timeout")
+        self.assertEqual(test_result["result"], GraderResult.TIME_LIMIT_EXCEEDED)
+
+    def test_failed_golden_simulation_is_not_cached(self):
+        grader, _test_result = self._grade("OUT 1", golden="OUT 1\nEXIT 1")
+        key = grader.golden_cache.key_for(os.path.join(self.directory, "tb.v"),
+                                          os.path.join(self.directory, "golden.v"), "verilog", "testbench")
+        self.assertIsNone(grader.golden_cache.get(key))
+        grader, _test_result = self._grade("OUT 1")
+        key = grader.golden_cache.key_for(os.path.join(self.directory, "tb.v"),
+                                          os.path.join(self.directory, "golden.v"), "verilog", "testbench")
+        self.assertEqual(grader.golden_cache.get(key), "1\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
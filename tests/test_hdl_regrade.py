@@ -0,0 +1,223 @@
+"""
+Tests of hdl_regrade, with a fake simulator and a stand-in for the database.
+
+The modules of the grading container that are not installed are replaced by the
+offline versions of the benchmarks (see benchmarks/environment.py).
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+import environment  # noqa: E402
+
+environment.setup()
+
+import projects  # noqa: E402
+import hdl_regrade  # noqa: E402
+
+#  File where the fake simulator records its calls, one action per line. The submissions are
+#  graded in other processes
+CALLS_FILE = None
+
+
+def _record(action):
+    with open(CALLS_FILE, "a") as calls_file:
+        calls_file.write(action + "\n")
+
+
+def _calls():
+    with open(CALLS_FILE, "r") as calls_file:
+        return calls_file.read().split()
+
+
+class FakeProject:
+    """
+    A project whose golden model prints the testbench, and whose design prints it as well when the
+    code contains 'good', or with every 1 replaced by a 0 otherwise. Code containing 'syntax error'
+    does not build, the simulation of code containing 'hang' never ends and the one of code
+    containing 'raise' raises.
+    """
+
+    def __init__(self, directory, *args):
+        self.directory = directory
+
+    def _read(self, name):
+        with open(os.path.join(self.directory, name), "r") as source:
+            return source.read()
+
+    def build(self):
+        _record("build_golden")
+        self.build_design()
+
+    def build_design(self):
+        _record("build_design")
+        if "syntax error" in self._read("design.v"):
+            raise projects.BuildError("syntax error in design.v")
+
+    def build_library(self, library_dir):
+        _record("build_golden")
+
+    def build_with_library(self, library_dir):
+        self.build_design()
+
+    def run(self, input_file):
+        return self.run_golden(input_file)[1], self.run_design(input_file)
+
+    def run_golden(self, input_file):
+        _record("run_golden")
+        return 0, self._read("testbench.v"), ""
+
+    def run_design(self, input_file):
+        _record("run_design")
+        code = self._read("design.v")
+        if "hang" in code:
+            while True:
+                time.sleep(0.05)
+        if "raise" in code:
+            raise RuntimeError("simulator crashed")
+        testbench = self._read("testbench.v")
+        return 0, testbench if "good" in self._read("design.v") else testbench.replace("1", "0"), ""
+
+
+class FakeFactory:
+    def create_from_directory(self, directory, *args):
+        return FakeProject(directory, *args)
+
+
+class MemorySubmissionStore:
+    """ Stand-in for the database, keeping the submissions and the saved results in memory """
+
+    def __init__(self, submissions):
+        self.submissions = submissions
+        self.saved = []
+
+    def load_submissions(self):
+        return [dict(submission) for submission in self.submissions]
+
+    def save_results(self, results):
+        self.saved.append(list(results))
+
+
+def _submission(submission_id, code, grade):
+    return {"id": submission_id, "problem_id": "p", "language": "verilog", "code": code, "grade": grade}
+
+
+class RegradeTest(unittest.TestCase):
+
+    def setUp(self):
+        global CALLS_FILE
+        self.directory = tempfile.mkdtemp()
+        CALLS_FILE = os.path.join(self.directory, "calls.log")
+        open(CALLS_FILE, "w").close()
+        self.test_cases = []
+        for index in range(2):
+            testbench = os.path.join(self.directory, "testbench{}.v".format(index))
+            golden_model = os.path.join(self.directory, "golden_model{}.v".format(index))
+            with open(testbench, "w") as testbench_file:
+                testbench_file.write("T, {}, INPUTS, a, 1, OUTPUTS, y, 1\n".format(index))
+            with open(golden_model, "w") as golden_file:
+                golden_file.write("golden model")
+            self.test_cases.append((testbench, golden_model))
+        self.options = {"project_factory": FakeFactory()}
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _regrade(self, store, **kwargs):
+        kwargs.setdefault("workers", 1)
+        return hdl_regrade.regrade(store, self.test_cases, self.options, report=lambda line: None, **kwargs)
+
+    def test_grades_and_saves_in_batches(self):
+        store = MemorySubmissionStore([_submission("a", "good", 0.0), _submission("b", "bad", 100.0),
+                                       _submission("c", "good", 100.0)])
+        summary = self._regrade(store, batch_size=2)
+        self.assertEqual(summary, {"graded": 3, "changed": 2, "failed": 0, "skipped": 0})
+        self.assertEqual([len(batch) for batch in store.saved], [2, 1])
+        grades = {result["id"]: result["grade"] for batch in store.saved for result in batch}
+        self.assertEqual(grades, {"a": 100.0, "b": 0.0, "c": 100.0})
+
+    def test_teacher_side_is_compiled_and_simulated_once(self):
+        store = MemorySubmissionStore([_submission(str(index), "good", 100.0) for index in range(4)])
+        self._regrade(store)
+        actions = _calls()
+        # Once per test case
+        self.assertEqual(actions.count("build_golden"), 2)
+        self.assertEqual(actions.count("run_golden"), 2)
+        self.assertEqual(actions.count("run_design"), 8)
+
+    def test_compilation_error(self):
+        store = MemorySubmissionStore([_submission("a", "syntax error", 100.0)])
+        summary = self._regrade(store)
+        self.assertEqual(summary["changed"], 1)
+        self.assertEqual(store.saved[0][0]["grade"], 0.0)
+
+    def test_dry_run_saves_nothing(self):
+        store = MemorySubmissionStore([_submission("a", "good", 0.0)])
+        summary = self._regrade(store, dry_run=True)
+        self.assertEqual(summary["changed"], 1)
+        self.assertEqual(store.saved, [])
+
+    def test_resumes_from_progress_file(self):
+        progress_file_name = os.path.join(self.directory, "progress.log")
+        store = MemorySubmissionStore([_submission("a", "good", 0.0), _submission("b", "bad", 0.0)])
+        self._regrade(store, progress_file_name=progress_file_name, batch_size=1)
+        store.saved = []
+        summary = self._regrade(store, progress_file_name=progress_file_name)
+        self.assertEqual(summary, {"graded": 0, "changed": 0, "failed": 0, "skipped": 2})
+        self.assertEqual(store.saved, [])
+
+    def test_hanging_submission_is_stopped(self):
+        progress_file_name = os.path.join(self.directory, "progress.log")
+        store = MemorySubmissionStore([_submission("a", "good", 0.0), _submission("b", "hang", 0.0),
+                                       _submission("c", "raise", 0.0), _submission("d", "bad", 100.0)])
+        start = time.monotonic()
+        summary = self._regrade(store, workers=2, progress_file_name=progress_file_name, submission_timeout=1)
+        self.assertLess(time.monotonic() - start, 10)
+        self.assertEqual(summary, {"graded": 2, "changed": 2, "failed": 2, "skipped": 0})
+        self.assertEqual(sorted(result["id"] for batch in store.saved for result in batch), ["a", "d"])
+        # The failed submissions are graded again when the regrade is resumed
+        store.saved = []
+        summary = self._regrade(store, progress_file_name=progress_file_name, submission_timeout=1)
+        self.assertEqual(summary, {"graded": 0, "changed": 0, "failed": 2, "skipped": 2})
+
+    def test_json_store(self):
+        store_file_name = os.path.join(self.directory, "submissions.json")
+        with open(store_file_name, "w") as store_file:
+            json.dump([_submission("a", "good", 0.0), _submission("b", "bad", 100.0)], store_file)
+        self._regrade(hdl_regrade.JsonSubmissionStore(store_file_name))
+        with open(store_file_name, "r") as store_file:
+            submissions = {submission["id"]: submission for submission in json.load(store_file)}
+        self.assertEqual(submissions["a"]["grade"], 100.0)
+        self.assertEqual(submissions["a"]["result"], "success")
+        self.assertEqual(submissions["b"]["grade"], 0.0)
+        self.assertIn("text", submissions["b"])
+
+
+class SelectSubmissionTest(unittest.TestCase):
+
+    submissions = [
+        {"_id": 1, "grade": 50.0, "submitted_on": 1},
+        {"_id": 2, "grade": 100.0, "submitted_on": 2},
+        {"_id": 3, "grade": 100.0, "submitted_on": 3},
+        {"_id": 4, "grade": 0.0, "submitted_on": 4},
+    ]
+
+    def test_best(self):
+        self.assertEqual(hdl_regrade._select_submission(self.submissions, "best")["_id"], 3)
+
+    def test_last(self):
+        self.assertEqual(hdl_regrade._select_submission(self.submissions, "last")["_id"], 4)
+
+    def test_student(self):
+        self.assertEqual(hdl_regrade._select_submission(self.submissions, "student", 1)["_id"], 1)
+        self.assertIsNone(hdl_regrade._select_submission(self.submissions, "student", 5))
+
+
+if __name__ == "__main__":
+    unittest.main()
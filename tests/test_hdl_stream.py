@@ -0,0 +1,88 @@
+"""
+Tests of the streaming comparison of hdl_stream, with python processes as simulations.
+"""
+
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+import environment  # noqa: E402
+
+environment.setup()
+
+from hdl_stream import StreamingComparator, run_streaming, STOPPED_BY_MISMATCHES, STOPPED_BY_BYTES, \
+    STOPPED_BY_TIMEOUT  # noqa: E402
+
+EXPECTED = "".join("T, {}, OUTPUTS, y, 0\n".format(time) for time in range(0, 100, 10))
+
+
+def _run(script, comparator, timeout=None):
+    return run_streaming([sys.executable, "-c", script], None, comparator, timeout)
+
+
+class RunStreamingTest(unittest.TestCase):
+
+    def test_equal_output(self):
+        comparator = StreamingComparator(EXPECTED)
+        return_code, stdout, _stderr = _run("import sys; sys.stdout.write({!r})".format(EXPECTED), comparator)
+        self.assertEqual((return_code, stdout), (0, EXPECTED))
+        self.assertIsNone(comparator.stopped_reason)
+        self.assertEqual(comparator.mismatches, 0)
+
+    def test_last_line_without_newline(self):
+        comparator = StreamingComparator(EXPECTED)
+        _run("import sys; sys.stdout.write({!r})".format(EXPECTED.rstrip("\n")), comparator)
+        self.assertEqual((comparator.lines, comparator.mismatches), (10, 0))
+
+    def test_stopped_by_mismatches(self):
+        comparator = StreamingComparator(EXPECTED, max_mismatches=3)
+        start = time.perf_counter()
+        return_code, _stdout, _stderr = _run(
+            "import time\nwhile True:\n    print('T, 0, OUTPUTS, y, 1', flush=True)\n    time.sleep(0.01)", comparator)
+        self.assertLess(time.perf_counter() - start, 10)
+        self.assertNotEqual(return_code, 0)
+        self.assertEqual(comparator.stopped_reason, STOPPED_BY_MISMATCHES)
+        self.assertEqual((comparator.mismatches, comparator.first_mismatch_line), (3, 1))
+
+    def test_output_without_newlines_is_stopped_by_bytes(self):
+        comparator = StreamingComparator(EXPECTED, max_bytes=2 ** 20)
+        return_code, stdout, _stderr = _run(
+            "import sys\nwhile True:\n    sys.stdout.write('x' * 4096)", comparator)
+        self.assertNotEqual(return_code, 0)
+        self.assertEqual(comparator.stopped_reason, STOPPED_BY_BYTES)
+        # The output is not buffered until its first newline
+        self.assertLess(len(stdout), 2 ** 20 + 2 ** 17)
+        self.assertEqual(comparator.lines, 0)
+
+    def test_stopped_by_timeout(self):
+        comparator = StreamingComparator(EXPECTED)
+        start = time.perf_counter()
+        return_code, stdout, _stderr = _run(
+            "import sys, time\nsys.stdout.write({!r})\nsys.stdout.flush()\ntime.sleep(60)".format(EXPECTED[:21]),
+            comparator, timeout=0.5)
+        self.assertLess(time.perf_counter() - start, 10)
+        self.assertNotEqual(return_code, 0)
+        self.assertEqual(stdout, EXPECTED[:21])
+        self.assertEqual(comparator.stopped_reason, STOPPED_BY_TIMEOUT)
+
+    def test_invalid_utf8_is_replaced(self):
+        comparator = StreamingComparator("bad � byte\n")
+        _return_code, stdout, _stderr = _run("import sys; sys.stdout.buffer.write(b'bad \\xff byte\\n')", comparator)
+        self.assertEqual(stdout, "bad � byte\n")
+        self.assertEqual(comparator.mismatches, 0)
+
+
+class FeedTextTest(unittest.TestCase):
+
+    def test_lines_split_across_chunks(self):
+        comparator = StreamingComparator(EXPECTED)
+        for start in range(0, len(EXPECTED), 7):
+            self.assertTrue(comparator.feed_text(EXPECTED[start:start + 7]))
+        comparator.finish()
+        self.assertEqual((comparator.lines, comparator.mismatches), (10, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
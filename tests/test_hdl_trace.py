@@ -0,0 +1,179 @@
+"""
+Tests of the traces of hdl_trace and of the waveform stored in the feedback of HDLGrader.
+"""
+
+import json
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+import environment  # noqa: E402
+
+environment.setup()
+
+import generators  # noqa: E402
+from graders import HDLGrader  # noqa: E402
+from hdl_trace import parse_trace, compare_traces, waveform_payload, _value_changes  # noqa: E402
+from results import GraderResult  # noqa: E402
+
+TRACE_SIZE = 800 * 1024
+
+EXPECTED = """VCD info: dumpfile created
+T, 0, INPUTS, a, 0, b, 1, OUTPUTS, y, 0
+T, 10, INPUTS, a, 1, b, 1, OUTPUTS, y, 1
+T, 20, INPUTS, a, 1, b, 0, OUTPUTS, y, 0
+"""
+
+
+class Request:
+    problem_id = "p"
+    code = ""
+    language_name = "verilog"
+    problem_type = "code_multiple_languages"
+    is_staff = False
+
+
+def _size(payload):
+    return len(json.dumps(payload, separators=(',', ':')))
+
+
+class ParseTraceTest(unittest.TestCase):
+
+    def test_columns(self):
+        trace = parse_trace(EXPECTED)
+        self.assertEqual(trace.times, [0, 10, 20])
+        self.assertEqual(trace.columns, {"a": ["0", "1", "1"], "b": ["1", "1", "0"], "y": ["0", "1", "0"]})
+        self.assertEqual(trace.directions, {"a": "input", "b": "input", "y": "output"})
+        self.assertEqual(trace.ignored_lines, 1)
+        self.assertFalse(trace.truncated)
+
+    def test_unknown_values_are_normalized(self):
+        trace = parse_trace("T, 0, OUTPUTS, y, x, z, 1u0-\n")
+        self.assertEqual(trace.columns, {"y": ["X"], "z": ["1X0X"]})
+        self.assertEqual(trace.widths, {"y": 1, "z": 4})
+
+    def test_rows_lacking_a_signal(self):
+        trace = parse_trace("T, 0, OUTPUTS, y, 0\nT, 10, OUTPUTS, y, 1, z, 1\nT, 20, OUTPUTS, y, 0\n")
+        self.assertEqual(trace.columns, {"y": ["0", "1", "0"], "z": [None, "1", None]})
+
+    def test_max_rows(self):
+        trace = parse_trace(EXPECTED, max_rows=2)
+        self.assertEqual(trace.times, [0, 10])
+        self.assertTrue(trace.truncated)
+
+
+class CompareTracesTest(unittest.TestCase):
+
+    def _compare(self, actual, expected=EXPECTED, unknown_as_wildcard=False):
+        return compare_traces(parse_trace(expected), parse_trace(actual), unknown_as_wildcard)
+
+    def test_equal(self):
+        comparison = self._compare(EXPECTED.replace(", ", ","))
+        self.assertTrue(comparison.equal)
+        self.assertIsNone(comparison.first_mismatch_time)
+
+    def test_mismatch(self):
+        comparison = self._compare(EXPECTED.replace("T, 10, INPUTS, a, 1, b, 1, OUTPUTS, y, 1",
+                                                    "T, 10, INPUTS, a, 1, b, 1, OUTPUTS, y, 0"))
+        self.assertFalse(comparison.equal)
+        self.assertEqual(comparison.first_mismatch_time, 10)
+        self.assertEqual({signal.name: signal.mismatches for signal in comparison.signals}, {"a": 0, "b": 0, "y": 1})
+
+    def test_missing_and_extra_rows(self):
+        comparison = self._compare(EXPECTED.replace("T, 20,", "T, 30,"))
+        self.assertFalse(comparison.equal)
+        self.assertEqual((comparison.missing_rows, comparison.extra_rows), (1, 1))
+
+    def test_missing_signal(self):
+        comparison = self._compare(EXPECTED.replace(", b, 1", "").replace(", b, 0", ""))
+        self.assertFalse(comparison.equal)
+        self.assertEqual(comparison.missing_signals, ["b"])
+
+    def test_extra_signal(self):
+        comparison = self._compare(EXPECTED.replace("OUTPUTS, y, 0", "OUTPUTS, y, 0, debug, 1"))
+        self.assertFalse(comparison.equal)
+        self.assertEqual(comparison.extra_signals, ["debug"])
+
+    def test_lines_outside_the_trace(self):
+        self.assertFalse(self._compare(EXPECTED + "ERROR: wrong result\n").equal)
+        self.assertFalse(self._compare(EXPECTED.replace("dumpfile created", "dumpfile missing")).equal)
+        self.assertTrue(self._compare(EXPECTED.replace("VCD info", "  VCD info") + "\n").equal)
+
+    def test_unknown_as_wildcard(self):
+        expected = EXPECTED.replace("OUTPUTS, y, 1", "OUTPUTS, y, x")
+        self.assertFalse(self._compare(EXPECTED, expected).equal)
+        self.assertTrue(self._compare(EXPECTED, expected, unknown_as_wildcard=True).equal)
+        # Only the expected values are wildcards
+        comparison = self._compare(expected, EXPECTED, unknown_as_wildcard=True)
+        self.assertFalse(comparison.equal)
+        self.assertEqual([signal.unknown_values for signal in comparison.signals], [0, 0, 1])
+
+    def test_grader_rejects_lines_outside_the_trace(self):
+        grader = HDLGrader(Request(), {"compare_traces": True})
+        result, debug_info, _feedback_info = grader._construct_feedback(
+            (EXPECTED, (0, EXPECTED + "ERROR: wrong result\n", "")))
+        self.assertEqual(result, GraderResult.WRONG_ANSWER)
+        self.assertTrue(debug_info["trace_summary"]["ignored_lines_differ"])
+
+
+class ValueChangesTest(unittest.TestCase):
+
+    def test_changes(self):
+        self.assertEqual(_value_changes([0, 10, 20, 30], ["0", "0", "1", "1"]), [(0, "0"), (20, "1")])
+
+    def test_rows_without_value_are_skipped(self):
+        # The value after a gap is not a change when it is the one before the gap
+        self.assertEqual(_value_changes([0, 10, 20, 30], ["0", None, "0", "1"]), [(0, "0"), (30, "1")])
+        self.assertEqual(_value_changes([0, 10, 20], [None, "1", None]), [(10, "1")])
+
+
+class WaveformTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        rng = random.Random(7)
+        cls.expected = generators.hdl_trace(rng, TRACE_SIZE)
+        cls.mutated = generators.mutate_trace(rng, cls.expected)
+
+    def _feedback(self, stdout, **options):
+        grader = HDLGrader(Request(), dict({"generate_diff": True}, **options))
+        return grader._construct_feedback((self.expected, (0, stdout, "")))
+
+    def test_accepted_result_has_no_waveform(self):
+        result, debug_info, _feedback_info = self._feedback(self.expected)
+        self.assertEqual(result, GraderResult.ACCEPTED)
+        self.assertNotIn("waveform", debug_info)
+
+    def test_waveform_is_bounded_by_the_diff(self):
+        result, debug_info, _feedback_info = self._feedback(self.mutated)
+        self.assertEqual(result, GraderResult.WRONG_ANSWER)
+        waveform = debug_info["waveform"]
+        self.assertTrue(waveform["truncated"])
+        # In the order of size of the bounded diff, instead of the size of the traces
+        self.assertLess(_size(waveform), 32 * 1024)
+        self.assertLess(_size(waveform), 4 * len(debug_info["diff"]))
+
+    def test_waveform_starts_before_the_first_difference(self):
+        lines = self.expected.splitlines()
+        mutated = "\n".join(lines[:5000]) + "\n" + generators.mutate_trace(random.Random(1), "\n".join(lines[5000:]))
+        first_difference = next(row for row, line in enumerate(mutated.splitlines()) if line != lines[row])
+        _result, debug_info, _feedback_info = self._feedback(mutated, waveform_context_rows=3)
+        waveform = debug_info["waveform"]
+        # The generated traces print a row every 10 time units
+        self.assertEqual(waveform["start_time"], (first_difference - 3) * 10)
+        for signal in waveform["signals"]:
+            self.assertEqual(signal["expected"][0][0], waveform["start_time"])
+
+    def test_equal_signals_are_sent_once(self):
+        expected = parse_trace("T, 0, INPUTS, a, 0, OUTPUTS, y, 0\nT, 10, INPUTS, a, 1, OUTPUTS, y, 1\n")
+        actual = parse_trace("T, 0, INPUTS, a, 0, OUTPUTS, y, 0\nT, 10, INPUTS, a, 1, OUTPUTS, y, 0\n")
+        signals = {signal["name"]: signal for signal in waveform_payload(expected, actual)["signals"]}
+        self.assertIsNone(signals["a"]["student"])
+        self.assertEqual(signals["y"]["expected"], [[0, "0"], [10, "1"]])
+        self.assertEqual(signals["y"]["student"], [[0, "0"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
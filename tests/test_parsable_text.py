@@ -0,0 +1,123 @@
+"""
+Tests of the rendering of the feedback by parsable_text.
+"""
+
+import json
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+import environment  # noqa: E402
+
+environment.setup()
+
+import parsable_text  # noqa: E402
+from parsable_text import ParsableText, RstRenderer  # noqa: E402
+from results import GraderResult  # noqa: E402
+
+
+def _hdl_feedback(metrics):
+    case = {"i": 0, "result": GraderResult.ACCEPTED, "test_case": ["tb.v", "out.txt"], "input_sample": ""}
+    options = {"container_type": "hdl", "is_staff": False}
+    debug_info = {"files_feedback": {"0": {"input_file": "", "stdout": "", "stderr": "", "return_code": 0,
+                                           "diff": None}},
+                  "metrics": metrics}
+    return json.dumps([case, options, debug_info])
+
+
+class MetricsTest(unittest.TestCase):
+
+    metrics = {"phases": {"build": {"count": 1, "wall": 1.5}, "run": {"count": 1, "wall": 0.25}}, "wall": 2.0}
+
+    def test_metrics_are_shown_to_the_staff(self):
+        rendered = ParsableText(_hdl_feedback(self.metrics), "json", show_everything=True).parse()
+        self.assertIn("Grading time: 2.00 s (build: 1.50 s, run: 0.25 s)", rendered)
+
+    def test_metrics_are_hidden_from_the_students(self):
+        rendered = ParsableText(_hdl_feedback(self.metrics), "json").parse()
+        self.assertNotIn("Grading time", rendered)
+
+
+#  Texts rendered by the fast path, without docutils
+PLAIN_TEXTS = [
+    "",
+    "\n\n",
+    "Hello world",
+    "Wrong answer in test 3.",
+    "Two paragraphs.\n\nThe second one.",
+    "A paragraph\nwrapped on two lines",
+    "Trailing spaces   \nand blank lines\n\n\n",
+    "50% done, (ok)! Really? Yes; it's fine.",
+    "Ünïcödé ñandú",
+    "a/b-c and x-y",
+    "www.example.com",
+]
+
+#  Texts rendered by the fast path, with characters escaped as docutils does
+ESCAPED_TEXTS = [
+    "Tom & Jerry",
+    'He said "hello"',
+    "&amp; is already escaped",
+    "Quotes 'single' and \"double\" & more",
+]
+
+#  Texts with markup, or that docutils does not render as plain paragraphs
+MARKUP_TEXTS = [
+    "*emphasis*",
+    "**strong**",
+    "``literal``",
+    "`link <http://example.com>`_",
+    "Title\n=====\n\nText",
+    "- item\n- item",
+    "* item",
+    "1. first\n2. second",
+    "a) item",
+    "(a) item",
+    "A. Letter enumerator",
+    "I. Roman enumerator",
+    "#. auto",
+    "Mr. Smith",
+    "word_ reference",
+    "http://example.com",
+    "user@example.com",
+    "Paragraph::\n\n    literal",
+    "| line block",
+    ".. note:: admonition",
+    "-- dash",
+    "-a option",
+    "/path/to/file",
+    "Term\n  Definition",
+    "Text\n\n    quoted",
+    "x\n\n----\n\ny",
+    ":field: value",
+    "\\*escaped\\*",
+    "tab\tseparated",
+    "a + b = c",
+    "a < b > c",
+]
+
+
+class RstRendererTest(unittest.TestCase):
+
+    def _docutils(self, string):
+        with mock.patch.object(parsable_text, "_is_plain_text", return_value=False):
+            return RstRenderer.get().render(string)
+
+    def test_fast_path_renders_as_docutils(self):
+        for string in PLAIN_TEXTS + ESCAPED_TEXTS + MARKUP_TEXTS:
+            with self.subTest(string=string):
+                self.assertEqual(RstRenderer.get().render(string), self._docutils(string))
+
+    def test_fast_path_detection(self):
+        for string in PLAIN_TEXTS + ESCAPED_TEXTS:
+            with self.subTest(string=string):
+                self.assertTrue(parsable_text._is_plain_text(string))
+        for string in MARKUP_TEXTS:
+            with self.subTest(string=string):
+                self.assertFalse(parsable_text._is_plain_text(string))
+
+
+if __name__ == "__main__":
+    unittest.main()